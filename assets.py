@@ -0,0 +1,262 @@
+# assets.py
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+from urllib.parse import quote
+
+import click
+from flask import abort, current_app, request, send_file
+from flask.cli import AppGroup
+from werkzeug.security import safe_join
+
+from extensions import AppExtension, per_app
+
+try:
+    import brotli  # optional: adds .br variants next to the .gz ones
+except ImportError:
+    brotli = None
+
+# Directory under static/ that the build writes to, and which is served as immutable
+OUTPUT_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+
+# Directories under static/ that are never fingerprinted (user content, sources, build output)
+SKIP_DIRS = {"uploads", "scss", OUTPUT_DIR}
+
+# File types worth storing precompressed; images and fonts like woff2 are already compressed
+COMPRESSIBLE = {".css", ".js", ".map", ".svg", ".json", ".txt", ".eot", ".ttf", ".xml", ".html"}
+
+# A year, the conventional maximum for far-future caching
+IMMUTABLE_MAX_AGE = 31536000
+
+# Processed uploads are stored as uploads/<sha256 of their bytes>.<ext> (see ImagePipeline._save), so
+# they never change either; older files and anything else in uploads/ keep the default caching
+_HASHED_UPLOAD_RE = re.compile(r"^uploads/[0-9a-f]{64}\.[a-z0-9]+$")
+
+# Ways of handing a file to the proxy in front instead of sending it from a worker thread
+OFFLOAD_MODES = {"x-accel-redirect", "x-sendfile"}
+
+_CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+assets_cli = AppGroup("assets", help="Build fingerprinted, precompressed static assets.")
+
+
+def _fingerprinted_name(rel_path, digest):
+    root, ext = posixpath.splitext(rel_path)
+    return f"{root}.{digest[:10]}{ext}"
+
+
+def _rewrite_css_urls(css, rel_path, manifest):
+    """Point relative url() references in a stylesheet at the fingerprinted copies of their targets."""
+    base = posixpath.dirname(rel_path)
+
+    def replace(match):
+        quote, target = match.groups()
+        if target.startswith(("data:", "http:", "https:", "//", "/", "#")):
+            return match.group(0)
+        # Keep query strings and fragments, e.g. "fa-solid-900.eot?#iefix"
+        path, sep, suffix = target, "", ""
+        split = re.search(r"[?#]", target)
+        if split:
+            path, sep, suffix = target[:split.start()], split.group(0), target[split.end():]
+        resolved = posixpath.normpath(posixpath.join(base, path))
+        if resolved not in manifest:
+            return match.group(0)
+        new_target = posixpath.relpath(manifest[resolved], posixpath.join(OUTPUT_DIR, base))
+        return f"url({quote}{new_target}{sep}{suffix}{quote})"
+
+    return _CSS_URL_RE.sub(replace, css)
+
+
+def _write_compressed(path, data):
+    """Write .gz (and .br when brotli is installed) siblings, skipping ones that wouldn't be smaller."""
+    written = []
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data):
+        with open(path + ".gz", "wb") as f:
+            f.write(compressed)
+        written.append("gzip")
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data):
+            with open(path + ".br", "wb") as f:
+                f.write(compressed)
+            written.append("br")
+    return written
+
+
+def build_assets(static_folder):
+    """
+    Copy every static asset to static/dist/ under a content-hashed name, with precompressed variants.
+
+    Stylesheets are processed last so that their url() references can be rewritten to the hashed names
+    of fonts and images. Returns the manifest mapping original names to fingerprinted ones.
+    """
+    output_root = os.path.join(static_folder, OUTPUT_DIR)
+    shutil.rmtree(output_root, ignore_errors=True)
+
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        rel_dir = os.path.relpath(dirpath, static_folder)
+        if rel_dir == ".":
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        for filename in filenames:
+            if filename.startswith("."):
+                continue
+            sources.append(posixpath.normpath(posixpath.join(rel_dir.replace(os.sep, "/"), filename)))
+    sources.sort(key=lambda rel: (rel.endswith(".css"), rel))
+
+    manifest = {}
+    for rel_path in sources:
+        with open(os.path.join(static_folder, rel_path), "rb") as f:
+            data = f.read()
+        if rel_path.endswith(".css"):
+            data = _rewrite_css_urls(data.decode("utf-8"), rel_path, manifest).encode("utf-8")
+        target = posixpath.join(OUTPUT_DIR, _fingerprinted_name(rel_path, hashlib.sha256(data).hexdigest()))
+        target_path = os.path.join(static_folder, target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        with open(target_path, "wb") as f:
+            f.write(data)
+        if posixpath.splitext(rel_path)[1].lower() in COMPRESSIBLE:
+            _write_compressed(target_path, data)
+        manifest[rel_path] = target
+
+    with open(os.path.join(output_root, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class AssetPipeline(AppExtension):
+    """
+    Serves static files by their fingerprinted names when a build manifest exists.
+
+    url_for('static', filename=...) transparently resolves through the manifest, and the static view
+    picks a brotli or gzip variant according to Accept-Encoding. Fingerprinted files and hashed uploads
+    are served with immutable, far-future Cache-Control; everything else keeps Flask's defaults.
+
+    With STATIC_OFFLOAD set, the view only decides which file to send and with which headers, and
+    hands the bytes to the proxy in front (nginx's X-Accel-Redirect or Apache/lighttpd's X-Sendfile),
+    which also answers conditional and Range requests. Without a proxy the file goes back through the
+    server's wsgi.file_wrapper, Range requests included, so under waitress it is written out by the
+    I/O thread while the worker thread moves on to the next request.
+    """
+
+    extension_name = "assets"
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.offload = None
+        self.offload_prefix = "/_static/"
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not app:
+            # Configure an instance of its own for this app (see extensions.AppExtension)
+            return self.bind(app).init_app(app)
+        app.config.setdefault('ASSET_MANIFEST', os.path.join(app.static_folder, OUTPUT_DIR, MANIFEST_NAME))
+        app.config.setdefault('STATIC_OFFLOAD', os.getenv('STATIC_OFFLOAD', '').lower() or None)
+        app.config.setdefault('STATIC_OFFLOAD_PREFIX', os.getenv('STATIC_OFFLOAD_PREFIX', '/_static/'))
+        if app.config['STATIC_OFFLOAD'] not in OFFLOAD_MODES | {None}:
+            raise ValueError(f"Unknown STATIC_OFFLOAD {app.config['STATIC_OFFLOAD']!r}; "
+                             "use 'x-accel-redirect' or 'x-sendfile'.")
+        self.offload = app.config['STATIC_OFFLOAD']
+        self.offload_prefix = app.config['STATIC_OFFLOAD_PREFIX'].rstrip("/") + "/"
+        self.load_manifest(app.config['ASSET_MANIFEST'])
+        app.url_defaults(self._fingerprint_url)
+        app.view_functions['static'] = self.send_static
+        app.cli.add_command(assets_cli)
+        app.extensions['assets'] = self
+
+    def load_manifest(self, path):
+        try:
+            with open(path) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def _fingerprint_url(self, endpoint, values):
+        if endpoint == 'static' and self.manifest:
+            filename = values.get('filename')
+            if filename in self.manifest:
+                values['filename'] = self.manifest[filename]
+
+    def send_static(self, filename):
+        static_folder = current_app.static_folder
+        path = safe_join(static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        compressible = os.path.splitext(filename)[1].lower() in COMPRESSIBLE
+        encoding = None
+        # nginx doesn't keep the app's Content-Encoding across X-Accel-Redirect; its gzip_static picks the .gz
+        if compressible and self.offload != "x-accel-redirect":
+            for candidate, suffix in (("br", ".br"), ("gzip", ".gz")):
+                if request.accept_encodings[candidate] and os.path.isfile(path + suffix):
+                    encoding, path = candidate, path + suffix
+                    break
+
+        immutable = filename.startswith(OUTPUT_DIR + "/") or _HASHED_UPLOAD_RE.match(filename) is not None
+        max_age = IMMUTABLE_MAX_AGE if immutable else current_app.get_send_file_max_age(filename)
+        if self.offload is not None:
+            response = self._offload(path, static_folder, mimetype, max_age)
+        else:
+            response = send_file(path, mimetype=mimetype, max_age=max_age, conditional=True)
+            if response.status_code == 206:
+                self._file_wrapper_range(response, path)
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        if compressible:
+            response.vary.add("Accept-Encoding")
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
+
+    def _offload(self, path, static_folder, mimetype, max_age):
+        """An empty response telling the proxy which file to send; it adds length, validators and ranges."""
+        response = current_app.response_class(mimetype=mimetype)
+        if self.offload == "x-accel-redirect":
+            rel_path = os.path.relpath(path, static_folder).replace(os.sep, "/")
+            response.headers["X-Accel-Redirect"] = quote(self.offload_prefix + rel_path)
+        else:
+            response.headers["X-Sendfile"] = os.path.abspath(path)
+        if max_age is not None:
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+        return response
+
+    @staticmethod
+    def _file_wrapper_range(response, path):
+        # Werkzeug serves a range through its own iterator, which a worker thread has to drive. Servers
+        # stop at Content-Length (PEP 3333), so a file_wrapper positioned at the start of the range
+        # sends exactly the range, and waitress writes it out from its I/O thread like a whole file.
+        file_wrapper = request.environ.get("wsgi.file_wrapper")
+        if file_wrapper is None or response.content_range is None:
+            return
+        f = open(path, "rb")
+        f.seek(response.content_range.start)
+        response.close()
+        response.response = file_wrapper(f)
+
+
+@assets_cli.command("build")
+def build_command():
+    """Fingerprint and precompress everything under static/ and write the manifest."""
+    manifest = build_assets(current_app.static_folder)
+    current_app.extensions['assets'].load_manifest(current_app.config['ASSET_MANIFEST'])
+    click.echo(f"Built {len(manifest)} assets into static/{OUTPUT_DIR}/"
+               + ("" if brotli is not None else " (install brotli for .br variants)"))
+
+
+@assets_cli.command("clean")
+def clean_command():
+    """Remove the build output, falling back to plain static files."""
+    shutil.rmtree(os.path.join(current_app.static_folder, OUTPUT_DIR), ignore_errors=True)
+    click.echo(f"Removed static/{OUTPUT_DIR}/")
@@ -0,0 +1,84 @@
+"""
+Compare two benchmark result files (from micro.py or load.py) and flag regressions.
+
+A benchmark regresses when its p50 or p95 latency grows, or its throughput drops, by more than
+--threshold percent, or when it runs more SQL queries per request than before. p99 is shown but not
+gated on, since it is too noisy over a few hundred iterations. Exits with status 1 if anything
+regressed, so it can gate a CI job.
+
+    python benchmarks/compare.py before.json after.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+# Metric -> (True when bigger is better, counts as a regression)
+METRICS = {
+    "p50_ms": (False, True),
+    "p95_ms": (False, True),
+    "p99_ms": (False, False),
+    "ops_per_second": (True, True),
+    "requests_per_second": (True, True),
+    "queries_per_request": (False, True),
+}
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(before, after, threshold):
+    """Yields (benchmark, metric, before, after, percent change, regressed) for every metric in both files."""
+    for name in sorted(set(before["results"]) & set(after["results"])):
+        old, new = before["results"][name], after["results"][name]
+        for metric, (higher_is_better, gated) in METRICS.items():
+            if metric not in old or metric not in new:
+                continue
+            percent = change(old[metric], new[metric])
+            if percent is None:
+                continue
+            if metric == "queries_per_request":
+                # Query counts are deterministic; any increase is a real change in behaviour
+                regressed = new[metric] > old[metric]
+            else:
+                regressed = gated and (-percent if higher_is_better else percent) > threshold
+            yield name, metric, old[metric], new[metric], percent, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10, help="Percent change counted as a regression.")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    if before.get("suite") != after.get("suite"):
+        sys.exit(f"Cannot compare a {before.get('suite')} run with a {after.get('suite')} run")
+    for key in ("dataset", "settings"):
+        if before.get(key) != after.get(key):
+            print(f"Warning: the runs used different {key}: {before.get(key)} vs {after.get(key)}")
+    print(f"{before['environment'].get('commit')} -> {after['environment'].get('commit')}")
+
+    regressions = 0
+    for name, metric, old, new, percent, regressed in compare(before, after, args.threshold):
+        regressions += regressed
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:>20} {metric:>20}: {old:>10} -> {new:>10} ({percent:+.1f}%){flag}")
+
+    missing = set(before["results"]) ^ set(after["results"])
+    if missing:
+        print(f"Only in one run: {', '.join(sorted(missing))}")
+    print(f"{regressions} regression(s) above {args.threshold}%" if regressions else "No regressions")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Shared setup for the benchmarks: a throwaway database, the app built against it, and synthetic data.
+
+The data is generated from a seeded random number generator, so the same arguments always produce
+the same users, posts and comments, and results stay comparable between commits.
+"""
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+CATEGORIES = ("Lifestyle", "Wellbeing", "Entertainment", "World News", "Sports")
+
+PASSWORD = "benchmark-password"
+
+WORDS = (
+    "the of and to in is for on with as that this from by at are be it or an was have not all can "
+    "more about new time people year first one way day world life health news game team season story "
+    "music film city travel food sleep running coffee market energy water summer winter morning "
+    "research study report player coach album concert recipe garden weekend habit mindful balance "
+    "community local global change growth future history culture design simple better quick guide"
+).split()
+
+_SERVER_TIMING_RE = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+def add_arguments(parser):
+    """Options shared by the benchmark scripts for the database and the size of the data set."""
+    parser.add_argument("--database-url", default=None,
+                        help="Empty database to use, e.g. postgresql://localhost/blog_bench (default: temp SQLite).")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--comments", type=int, default=5, help="Comments per post.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--password-iterations", type=int, default=1000,
+                        help="pbkdf2 iterations for the generated accounts and logins. Kept low so login "
+                             "benchmarks measure the route rather than the key stretching; pass the "
+                             "production value to include it.")
+    parser.add_argument("--output", default=None, help="Write the JSON results here (default: print them).")
+
+
+def make_app(args, **config):
+    """Build the app against args.database_url, or a fresh SQLite file, with tables created."""
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='blog-bench-'), 'bench.db')}"
+    os.environ.setdefault("SECRETKEY", "benchmark")
+    os.environ["DATABASE_URL"] = database_url
+
+    from main import create_app
+    from models import db
+
+    defaults = {
+        "WTF_CSRF_ENABLED": False,
+        "PASSWORD_PBKDF2_ITERATIONS": args.password_iterations,
+        # Keep uploads and slow-query output out of the way
+        "UPLOAD_FOLDER": tempfile.mkdtemp(prefix="blog-bench-uploads-"),
+        "SLOW_QUERY_SECONDS": float("inf"),
+    }
+    defaults.update(config)
+    app = create_app(defaults)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _sentence(rng, low=6, high=16):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng):
+    sentences = [_sentence(rng) for _ in range(rng.randint(2, 6))]
+    # Sprinkle in the inline markup CKEditor produces
+    i = rng.randrange(len(sentences))
+    sentences[i] = f"<strong>{sentences[i]}</strong>"
+    if rng.random() < 0.3:
+        j = rng.randrange(len(sentences))
+        sentences[j] = f'<a href="https://example.com/{rng.choice(WORDS)}">{sentences[j]}</a>'
+    return "<p>" + " ".join(sentences) + "</p>"
+
+
+def ckeditor_body(rng, paragraphs=None):
+    """HTML shaped like a CKEditor post: paragraphs, headings, lists, quotes and the odd image."""
+    blocks = []
+    for _ in range(paragraphs or rng.randint(4, 12)):
+        roll = rng.random()
+        if roll < 0.12:
+            blocks.append(f"<h2>{_sentence(rng, 3, 7)[:-1]}</h2>")
+        elif roll < 0.22:
+            items = "".join(f"<li>{_sentence(rng, 3, 9)}</li>" for _ in range(rng.randint(3, 6)))
+            blocks.append(f"<ul>{items}</ul>")
+        elif roll < 0.28:
+            blocks.append(f"<blockquote><p><em>{_sentence(rng)}</em></p></blockquote>")
+        elif roll < 0.32:
+            blocks.append(f'<p><img alt="{rng.choice(WORDS)}" src="https://example.com/{rng.randint(1, 999)}.jpg"></p>')
+        blocks.append(_paragraph(rng))
+    return "\n".join(blocks)
+
+
+def generate(app, users=50, posts=500, comments=5, seed=1):
+    """Insert users, posts (newest last) and comments in bulk. Returns the counts written."""
+    from sqlalchemy import insert
+    from categories import recount_categories
+    from content import make_excerpt, content_hash, sanitize_post_html, sanitize_comment_html, SANITIZER_VERSION
+    from main import password_hasher
+    from models import db, User, Post, Comment
+
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        password = password_hasher.hash(PASSWORD)
+        db.session.execute(insert(User), [
+            {"username": f"user{i}", "email": f"user{i}@example.com", "name": f"User {i}",
+             "password": password, "bio": _sentence(rng)}
+            for i in range(1, users + 1)
+        ])
+        # No explicit ids, so PostgreSQL sequences stay in step for the write benchmarks
+        user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+        batch = []
+        for i in range(1, posts + 1):
+            body = ckeditor_body(rng)
+            created = now - timedelta(minutes=10 * (posts - i))
+            batch.append({
+                "title": _sentence(rng, 3, 8)[:-1][:100], "subtitle": _sentence(rng, 4, 10)[:100],
+                "body": body, "excerpt": make_excerpt(body), "category": rng.choice(CATEGORIES),
+                "body_html": sanitize_post_html(body), "body_hash": content_hash(body),
+                "sanitizer_version": SANITIZER_VERSION,
+                "author_id": rng.choice(user_ids), "created_at": created, "updated_at": created, "version": 1,
+                "comment_count": comments,
+            })
+            if len(batch) == 500:
+                db.session.execute(insert(Post), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(Post), batch)
+        post_ids = [post_id for (post_id,) in db.session.query(Post.id).order_by(Post.id)]
+        rows = []
+        for post_id in post_ids:
+            for _ in range(comments):
+                text = _sentence(rng)
+                rows.append({"text": text, "text_html": sanitize_comment_html(text), "text_hash": content_hash(text),
+                             "sanitizer_version": SANITIZER_VERSION, "post_id": post_id,
+                             "comment_author_id": rng.choice(user_ids)})
+        for start in range(0, len(rows), 2000):
+            db.session.execute(insert(Comment), rows[start:start + 2000])
+        recount_categories()
+        db.session.commit()
+    return {"users": users, "posts": posts, "comments": posts * comments}
+
+
+def server_timing(response):
+    """(queries, db milliseconds) from the Server-Timing header the app adds to every response."""
+    match = _SERVER_TIMING_RE.search(response.headers.get("Server-Timing", ""))
+    if not match:
+        return None, None
+    return int(match.group(2)), float(match.group(1))
+
+
+def environment(app):
+    """What the numbers were measured on, stored next to them."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    from models import db
+    with app.app_context():
+        backend = db.engine.dialect.name
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": backend,
+    }
+
+
+def write_results(results, output=None):
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {output}")
+    else:
+        print(text)
@@ -0,0 +1,143 @@
+"""
+Concurrent load against the app served by waitress, the same server production runs.
+
+--clients threads each keep one request in flight for --duration seconds, picking routes from a
+weighted mix of anonymous readers and signed-in readers and writers. Reports overall throughput and
+per-route latency percentiles and status counts.
+
+    python benchmarks/load.py --clients 16 --duration 30 --output load.json
+    python benchmarks/load.py --mix feed=1 --clients 64 --threads 8   # saturate one route
+"""
+import argparse
+import itertools
+import random
+import threading
+import time
+
+import requests
+
+import fixtures
+
+# Route name -> relative weight in the default mix
+DEFAULT_MIX = {"feed": 40, "feed_category": 10, "show_post": 35, "search": 8, "login": 3, "create_post": 1,
+               "comment": 3}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000, 2) if values else None
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown route {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    fixtures.add_arguments(parser)
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent client threads.")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to run for.")
+    parser.add_argument("--threads", type=int, default=8, help="waitress worker threads (its default is 4).")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. feed=5,show_post=3,login=1")
+    parser.add_argument("--with-cache", action="store_true", help="Leave the rendered-page cache on.")
+    args = parser.parse_args()
+
+    from waitress.server import create_server
+
+    app = fixtures.make_app(args, RESPONSE_CACHE_ENABLED=args.with_cache)
+    dataset = fixtures.generate(app, args.users, args.posts, args.comments, args.seed)
+    server = create_server(app, host="127.0.0.1", port=0, threads=args.threads)
+    base_url = f"http://127.0.0.1:{server.effective_port}"
+    threading.Thread(target=server.run, daemon=True).start()
+
+    routes, weights = zip(*args.mix.items())
+    stats = {name: {"timings": [], "statuses": {}} for name in routes}
+    lock = threading.Lock()
+    deadline = None
+    ready = threading.Barrier(args.clients + 1)
+
+    def client(number):
+        rng = random.Random(args.seed * 1000 + number)
+        session = requests.Session()
+        user = f"user{number % args.users + 1}"
+        response = session.post(f"{base_url}/login", allow_redirects=False,
+                                data={"username_or_email": user, "password": fixtures.PASSWORD})
+        assert response.status_code == 302, "load client could not log in"
+        anonymous = requests.Session()
+        counter = itertools.count()
+        ready.wait()
+        while time.perf_counter() < deadline:
+            route = rng.choices(routes, weights)[0]
+            post_id = rng.randint(1, args.posts)
+            started = time.perf_counter()
+            if route == "feed":
+                response = anonymous.get(f"{base_url}/")
+            elif route == "feed_category":
+                response = anonymous.get(f"{base_url}/", params={"category": rng.choice(fixtures.CATEGORIES)})
+            elif route == "show_post":
+                response = (session if rng.random() < 0.3 else anonymous).get(f"{base_url}/post/{post_id}")
+            elif route == "search":
+                response = anonymous.get(f"{base_url}/", params={"search": rng.choice(fixtures.WORDS)})
+            elif route == "login":
+                response = requests.post(f"{base_url}/login", allow_redirects=False,
+                                         data={"username_or_email": user, "password": fixtures.PASSWORD})
+            elif route == "create_post":
+                response = session.post(f"{base_url}/create-post", allow_redirects=False, data={
+                    "title": f"Load post {number}-{next(counter)}", "subtitle": "Written under load",
+                    "body": fixtures.ckeditor_body(rng, 4), "category": rng.choice(fixtures.CATEGORIES)})
+            else:
+                response = session.post(f"{base_url}/post/{post_id}", allow_redirects=False,
+                                        data={"text": "Comment written under load"})
+            elapsed = time.perf_counter() - started
+            with lock:
+                stats[route]["timings"].append(elapsed)
+                stats[route]["statuses"][response.status_code] = stats[route]["statuses"].get(response.status_code, 0) + 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    deadline = time.perf_counter() + args.duration + 0.5
+    ready.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    server.close()
+
+    results = {}
+    total = 0
+    for name in routes:
+        timings = stats[name]["timings"]
+        total += len(timings)
+        results[name] = {
+            "requests": len(timings),
+            "requests_per_second": round(len(timings) / elapsed, 2),
+            "p50_ms": percentile(timings, 50),
+            "p95_ms": percentile(timings, 95),
+            "p99_ms": percentile(timings, 99),
+            "statuses": {str(code): count for code, count in sorted(stats[name]["statuses"].items())},
+        }
+        print(f"{name:>14}: {results[name]['requests_per_second']:8.2f} req/s  p50 {results[name]['p50_ms']} ms  "
+              f"p95 {results[name]['p95_ms']} ms  {results[name]['statuses']}")
+    print(f"{'total':>14}: {total / elapsed:8.2f} req/s over {elapsed:.1f}s with {args.clients} clients")
+
+    fixtures.write_results({
+        "suite": "load",
+        "environment": fixtures.environment(app),
+        "dataset": dict(dataset, seed=args.seed),
+        "settings": {"clients": args.clients, "duration": args.duration, "threads": args.threads,
+                     "mix": args.mix, "with_cache": args.with_cache,
+                     "password_iterations": args.password_iterations},
+        "total": {"requests": total, "requests_per_second": round(total / elapsed, 2), "seconds": round(elapsed, 2)},
+        "results": results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Login throughput under concurrency, and what a burst of logins does to ordinary page loads.
+
+Starts the app under waitress against a throwaway SQLite database, then has --concurrency clients
+log in as fast as they can while one more client keeps loading the homepage. Reports logins per
+second, login and page latency percentiles, and how many logins were shed with a 503.
+
+    python benchmarks/login_throughput.py --concurrency 16 --logins 200
+    python benchmarks/login_throughput.py --scheme bcrypt --password-workers 4
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000, 1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients logging in at once.")
+    parser.add_argument("--logins", type=int, default=100, help="Total login attempts.")
+    parser.add_argument("--users", type=int, default=20, help="Distinct accounts to log in as.")
+    parser.add_argument("--scheme", choices=("pbkdf2", "bcrypt"), default=None, help="PASSWORD_SCHEME.")
+    parser.add_argument("--password-workers", type=int, default=None, help="PASSWORD_WORKERS.")
+    parser.add_argument("--queue-size", type=int, default=None, help="PASSWORD_QUEUE_SIZE.")
+    parser.add_argument("--threads", type=int, default=16, help="waitress request threads.")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # create_app() reads its configuration from the environment
+    workdir = tempfile.mkdtemp(prefix="login-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("SECRETKEY", "benchmark")
+    # Measure rendering, not the page cache
+    os.environ["RESPONSE_CACHE_ENABLED"] = "0"
+    for option, name in ((args.scheme, "PASSWORD_SCHEME"), (args.password_workers, "PASSWORD_WORKERS"),
+                         (args.queue_size, "PASSWORD_QUEUE_SIZE")):
+        if option is not None:
+            os.environ[name] = str(option)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from waitress.server import create_server
+    from main import create_app
+    from models import db, User
+
+    app = create_app({"WTF_CSRF_ENABLED": False})
+    password_hasher = app.extensions['password_hasher']
+    with app.app_context():
+        db.create_all()
+        password = password_hasher.hash("benchmark-password")
+        db.session.add_all(User(username=f"bench{i}", email=f"bench{i}@example.com", name=f"Bench {i}",
+                                password=password) for i in range(args.users))
+        db.session.commit()
+
+    server = create_server(app, host="127.0.0.1", port=0, threads=args.threads)
+    base_url = f"http://127.0.0.1:{server.effective_port}"
+    threading.Thread(target=server.run, daemon=True).start()
+
+    login_times, page_times, statuses = [], [], {}
+    lock = threading.Lock()
+    remaining = iter(range(args.logins))
+    done = threading.Event()
+
+    def log_in():
+        session = requests.Session()
+        while True:
+            with lock:
+                attempt = next(remaining, None)
+            if attempt is None:
+                return
+            started = time.perf_counter()
+            response = session.post(f"{base_url}/login", allow_redirects=False, data={
+                "username_or_email": f"bench{attempt % args.users}", "password": "benchmark-password"})
+            elapsed = time.perf_counter() - started
+            session.cookies.clear()
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code == 302:
+                    login_times.append(elapsed)
+
+    def load_pages():
+        session = requests.Session()
+        while not done.is_set():
+            started = time.perf_counter()
+            session.get(f"{base_url}/")
+            page_times.append(time.perf_counter() - started)
+
+    # Baseline page latency with no logins in flight
+    pager = threading.Thread(target=load_pages)
+    pager.start()
+    time.sleep(1)
+    done.set()
+    pager.join()
+    idle_page_times, page_times = page_times, []
+    done.clear()
+
+    pager = threading.Thread(target=load_pages)
+    clients = [threading.Thread(target=log_in) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    pager.start()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    pager.join()
+    server.close()
+
+    results = {
+        "scheme": password_hasher.scheme,
+        "concurrency": args.concurrency,
+        "logins": args.logins,
+        "seconds": round(elapsed, 2),
+        "logins_per_second": round(len(login_times) / elapsed, 2),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "login_ms": {"p50": percentile(login_times, 50), "p95": percentile(login_times, 95),
+                     "mean": round(statistics.mean(login_times) * 1000, 1) if login_times else None},
+        "page_ms_idle": {"p50": percentile(idle_page_times, 50), "p95": percentile(idle_page_times, 95)},
+        "page_ms_during_logins": {"p50": percentile(page_times, 50), "p95": percentile(page_times, 95)},
+        "hasher": password_hasher.stats(),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['scheme']}: {results['logins_per_second']} logins/s over {results['seconds']}s "
+          f"with {args.concurrency} clients, statuses {results['statuses']}")
+    print(f"login latency p50 {results['login_ms']['p50']} ms, p95 {results['login_ms']['p95']} ms")
+    print(f"homepage latency p50/p95 idle {results['page_ms_idle']['p50']}/{results['page_ms_idle']['p95']} ms, "
+          f"during logins {results['page_ms_during_logins']['p50']}/{results['page_ms_during_logins']['p95']} ms")
+
+
+if __name__ == "__main__":
+    main()
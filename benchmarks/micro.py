@@ -0,0 +1,124 @@
+"""
+Microbenchmarks of the main routes through Flask's test client (no network, no server threads).
+
+Each benchmark runs a warm-up and then --iterations timed requests, recording latency percentiles and
+the number of SQL queries per request (from the Server-Timing header). The page cache is off unless
+--with-cache is given, so the numbers reflect rendering and querying.
+
+    python benchmarks/micro.py --output before.json
+    python benchmarks/micro.py --posts 5000 --only feed,search --output after.json
+    python benchmarks/compare.py before.json after.json
+"""
+import argparse
+import itertools
+import statistics
+import time
+
+import fixtures
+
+
+def summarize(timings, queries):
+    timings = sorted(timings)
+
+    def pct(p):
+        return round(timings[min(len(timings) - 1, int(len(timings) * p / 100))] * 1000, 3)
+
+    return {
+        "iterations": len(timings),
+        "mean_ms": round(statistics.mean(timings) * 1000, 3),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "min_ms": round(timings[0] * 1000, 3),
+        "ops_per_second": round(len(timings) / sum(timings), 1),
+        "queries_per_request": round(statistics.mean(queries), 2) if queries else None,
+    }
+
+
+def run(name, request, iterations, warmup, expect=(200,)):
+    """Time request() repeatedly; it returns a test-client response."""
+    for _ in range(warmup):
+        request()
+    timings, queries = [], []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = request()
+        timings.append(time.perf_counter() - started)
+        if response.status_code not in expect:
+            raise RuntimeError(f"{name}: unexpected status {response.status_code}")
+        count, _ = fixtures.server_timing(response)
+        if count is not None:
+            queries.append(count)
+    return summarize(timings, queries)
+
+
+def benchmarks(app, posts):
+    """name -> zero-argument callable making one request, set up against the generated data."""
+    anonymous = app.test_client()
+    signed_in = app.test_client()
+    response = signed_in.post("/login", data={"username_or_email": "user1", "password": fixtures.PASSWORD})
+    assert response.status_code == 302, "benchmark login failed"
+
+    # A cursor into the middle of the feed, taken from the first page's "Older Posts" link
+    first_page = anonymous.get("/").get_data(as_text=True)
+    cursor = first_page.split("cursor=", 1)[1].split('"', 1)[0] if "cursor=" in first_page else ""
+    post_ids = itertools.cycle(range(1, posts + 1, max(1, posts // 50)))
+    search_terms = itertools.cycle(["coffee", "morning running", "music festival", "garden recipe", "history"])
+    new_posts = itertools.count()
+
+    def login():
+        client = app.test_client()
+        return client.post("/login", data={"username_or_email": "user2", "password": fixtures.PASSWORD})
+
+    def create_post():
+        n = next(new_posts)
+        return signed_in.post("/create-post", data={
+            "title": f"Benchmark post {n}", "subtitle": "Created by the benchmark suite",
+            "body": "<p>" + "Benchmark body text. " * 80 + "</p>", "category": "Lifestyle"})
+
+    return {
+        "feed": (lambda: anonymous.get("/"), (200,)),
+        "feed_page_2": (lambda: anonymous.get(f"/?cursor={cursor}"), (200,)),
+        "feed_category": (lambda: anonymous.get("/?category=Sports"), (200,)),
+        "feed_signed_in": (lambda: signed_in.get("/"), (200,)),
+        "show_post": (lambda: anonymous.get(f"/post/{next(post_ids)}"), (200,)),
+        "show_post_signed_in": (lambda: signed_in.get(f"/post/{next(post_ids)}"), (200,)),
+        "search": (lambda: anonymous.get(f"/?search={next(search_terms)}"), (200,)),
+        "login": (login, (302,)),
+        "create_post": (create_post, (302,)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    fixtures.add_arguments(parser)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--only", default=None, help="Comma-separated benchmark names to run.")
+    parser.add_argument("--with-cache", action="store_true", help="Leave the rendered-page cache on.")
+    args = parser.parse_args()
+
+    app = fixtures.make_app(args, RESPONSE_CACHE_ENABLED=args.with_cache)
+    dataset = fixtures.generate(app, args.users, args.posts, args.comments, args.seed)
+    selected = set(args.only.split(",")) if args.only else None
+
+    results = {}
+    for name, (request, expect) in benchmarks(app, args.posts).items():
+        if selected and name not in selected:
+            continue
+        results[name] = run(name, request, args.iterations, args.warmup, expect)
+        print(f"{name:>20}: p50 {results[name]['p50_ms']:8.3f} ms  p95 {results[name]['p95_ms']:8.3f} ms  "
+              f"{results[name]['queries_per_request']} queries")
+
+    fixtures.write_results({
+        "suite": "micro",
+        "environment": fixtures.environment(app),
+        "dataset": dict(dataset, seed=args.seed),
+        "settings": {"iterations": args.iterations, "warmup": args.warmup, "with_cache": args.with_cache,
+                     "password_iterations": args.password_iterations},
+        "results": results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
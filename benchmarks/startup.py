@@ -0,0 +1,122 @@
+"""
+Cold-start time: how long a fresh process takes to import the app, build it, and start answering.
+
+Each run spawns a new interpreter, so nothing is warm. It reports the time to `import main`, the time
+for create_app(), and, with waitress serving the app, the time until /healthz/live and /healthz/ready
+first answer 200.
+
+    python benchmarks/startup.py --runs 5
+    python benchmarks/startup.py --database-url postgresql://localhost:1/nowhere   # database down
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in the child interpreter; prints import and factory timings as JSON
+IMPORT_SNIPPET = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.create_app()
+built = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "create_app_ms": (built - imported) * 1000}))
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, deadline):
+    """Poll url until it answers 200, returning the time it did, or None on timeout."""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def measure_import(env):
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_serve(env, timeout):
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "waitress", f"--port={port}", "--call", "main:create_app"],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + timeout
+        live = wait_for(f"http://127.0.0.1:{port}/healthz/live", deadline)
+        ready = wait_for(f"http://127.0.0.1:{port}/healthz/ready", deadline) if live else None
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "live_ms": (live - started) * 1000 if live else None,
+        "ready_ms": (ready - started) * 1000 if ready else None,
+    }
+
+
+def summarize(runs, key):
+    values = [run[key] for run in runs if run[key] is not None]
+    if not values:
+        return None
+    return {"median": round(statistics.median(values), 1), "min": round(min(values), 1),
+            "max": round(max(values), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--database-url", default=None,
+                        help="Database to start against (default: a throwaway SQLite file).")
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for each endpoint.")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}"
+    env.setdefault("SECRETKEY", "benchmark")
+
+    runs = []
+    for _ in range(args.runs):
+        run = measure_import(env)
+        run.update(measure_serve(env, args.timeout))
+        runs.append(run)
+
+    results = {key: summarize(runs, key) for key in ("import_ms", "create_app_ms", "live_ms", "ready_ms")}
+    results["runs"] = args.runs
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for key in ("import_ms", "create_app_ms", "live_ms", "ready_ms"):
+        stats = results[key]
+        label = key[:-3].replace("_", " ")
+        if stats is None:
+            print(f"{label:>12}: not reached within {args.timeout}s")
+        else:
+            print(f"{label:>12}: median {stats['median']} ms (min {stats['min']}, max {stats['max']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+# bulk.py
+import csv
+from datetime import datetime
+import gzip
+import io
+import json
+import os
+import sys
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import DateTime, Integer, insert, select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from categories import recount_categories
+from models import db, User, Image, Post, Comment
+
+# In dependency order: parents are written and read back before the rows referring to them
+MODELS = {"users": User, "images": Image, "posts": Post, "comments": Comment}
+
+FORMATS = ("ndjson", "csv")
+
+# Written for NULL in CSV files, as PostgreSQL's COPY does, so that NULL and "" stay distinct
+CSV_NULL = r"\N"
+
+blog_cli = AppGroup("blog", help="Export and import users, images, posts and comments in bulk.")
+
+
+def _tables(names):
+    tables = [name.strip() for name in names.split(",") if name.strip()]
+    unknown = [name for name in tables if name not in MODELS]
+    if unknown:
+        raise click.BadParameter(f"unknown table(s) {', '.join(unknown)}; choose from {', '.join(MODELS)}")
+    # Always in dependency order, whatever order they were given in
+    return [name for name in MODELS if name in tables]
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def _dump(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class _Progress:
+    """Running row count and rate for one table, redrawn in place on stderr."""
+
+    def __init__(self, label):
+        self.label = label
+        self.started = time.perf_counter()
+        self.count = 0
+
+    def add(self, rows):
+        self.count += rows
+        elapsed = max(time.perf_counter() - self.started, 1e-6)
+        click.echo(f"\r{self.label}: {self.count} rows ({self.count / elapsed:,.0f} rows/s)", nl=False, err=True)
+
+    def done(self):
+        self.add(0)
+        click.echo(err=True)
+
+
+# Export
+
+def export_table(model, f, fmt, batch_size, progress):
+    """Write every row of model's table to f, batch_size rows per round trip. Returns the row count."""
+    table = model.__table__
+    columns = [column.name for column in table.columns]
+    # yield_per streams from a server-side cursor on PostgreSQL, so memory stays flat however big the table
+    query = select(table).order_by(*table.primary_key.columns).execution_options(yield_per=batch_size)
+    if fmt == "csv":
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(columns)
+    for rows in db.session.execute(query).partitions():
+        if fmt == "csv":
+            writer.writerows([CSV_NULL if value is None else _dump(value) for value in row] for row in rows)
+        else:
+            f.writelines(json.dumps(dict(zip(columns, map(_dump, row))), ensure_ascii=False) + "\n" for row in rows)
+        progress.add(len(rows))
+    return progress.count
+
+
+@blog_cli.command("export")
+@click.argument("directory", type=click.Path(file_okay=False))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default="ndjson", show_default=True)
+@click.option("--tables", default=",".join(MODELS), show_default=True, help="Comma-separated tables to export.")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows fetched per round trip.")
+@click.option("--gzip", "compress", is_flag=True, help="Write gzip-compressed files (.ndjson.gz, .csv.gz).")
+def export_command(directory, fmt, tables, batch_size, compress):
+    """Write each table to DIRECTORY/<table>.ndjson (or .csv), one row per line."""
+    os.makedirs(directory, exist_ok=True)
+    for name in _tables(tables):
+        path = os.path.join(directory, f"{name}.{fmt}" + (".gz" if compress else ""))
+        progress = _Progress(name)
+        with _open(path, "w") as f:
+            export_table(MODELS[name], f, fmt, batch_size, progress)
+        progress.done()
+    # Nothing was written, so just end the read transaction
+    db.session.rollback()
+    click.echo(f"Exported to {directory}")
+
+
+# Import
+
+def _read_rows(f, fmt):
+    """Rows of an exported file as dicts of strings (CSV) or JSON values (NDJSON), one at a time."""
+    if fmt == "csv":
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        for record in reader:
+            yield {name: None if value == CSV_NULL else value for name, value in zip(header, record)}
+    else:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _converters(table):
+    converters = {}
+    for column in table.columns:
+        if isinstance(column.type, DateTime):
+            converters[column.name] = datetime.fromisoformat
+        elif isinstance(column.type, Integer):
+            converters[column.name] = int
+    return converters
+
+
+def _convert(converters, name, value):
+    # CSV gives strings for everything; NDJSON only for timestamps
+    convert = converters.get(name)
+    if convert is None or not isinstance(value, str):
+        return value
+    return convert(value)
+
+
+def _copy(table, columns, batch):
+    """Load a batch with PostgreSQL's COPY, which is several times faster than any INSERT."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows([CSV_NULL if row[name] is None else _dump(row[name]) for name in columns] for row in batch)
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                           buffer)
+    finally:
+        cursor.close()
+
+
+def import_table(model, f, fmt, batch_size, progress):
+    """Insert the rows read from f, committing every batch_size rows. Returns the row count."""
+    table = model.__table__
+    known = set(table.columns.keys())
+    converters = _converters(table)
+    dialect = db.engine.dialect
+    use_copy = dialect.name == "postgresql" and dialect.driver == "psycopg2"
+    # COPY goes straight to the driver, so its errors aren't wrapped by SQLAlchemy
+    errors = (SQLAlchemyError, dialect.dbapi.Error)
+    columns = None
+    batch = []
+
+    def flush():
+        try:
+            if use_copy:
+                _copy(table, columns, batch)
+            else:
+                # executemany; batched into multi-row INSERTs where the driver supports it
+                db.session.execute(insert(table), batch)
+            db.session.commit()
+        except errors as e:
+            db.session.rollback()
+            raise click.ClickException(f"{table.name}: rows {progress.count + 1}-{progress.count + len(batch)} "
+                                       f"could not be imported: {getattr(e, 'orig', None) or e}")
+        progress.add(len(batch))
+        batch.clear()
+
+    for row in _read_rows(f, fmt):
+        if columns is None:
+            # Columns this database doesn't have (e.g. from a newer schema) are left out
+            columns = [name for name in row if name in known]
+        if use_copy:
+            # PostgreSQL parses the exported text itself
+            batch.append({name: row.get(name) for name in columns})
+        else:
+            batch.append({name: _convert(converters, name, row.get(name)) for name in columns})
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return progress.count
+
+
+def _find_file(directory, name):
+    found = [(path, fmt) for fmt in FORMATS for path in (os.path.join(directory, f"{name}.{fmt}"),
+                                                         os.path.join(directory, f"{name}.{fmt}.gz"))
+             if os.path.isfile(path)]
+    if len(found) > 1:
+        raise click.ClickException(f"More than one file for {name}: {', '.join(path for path, _fmt in found)}")
+    return found[0] if found else (None, None)
+
+
+def _reset_sequences(names):
+    # Imported rows keep their ids, so move each id sequence past them
+    if db.engine.dialect.name != "postgresql":
+        return
+    for name in names:
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) "
+            f"FROM {name}"
+        ))
+    db.session.commit()
+
+
+@blog_cli.command("import")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("--tables", default=",".join(MODELS), show_default=True, help="Comma-separated tables to import.")
+@click.option("--batch-size", default=5000, show_default=True, help="Rows inserted and committed per batch.")
+def import_command(directory, tables, batch_size):
+    """Load the files written by `flask blog export` from DIRECTORY, keeping row ids."""
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))  # post bodies can exceed csv's 128 KB default
+    imported = []
+    for name in _tables(tables):
+        path, fmt = _find_file(directory, name)
+        if path is None:
+            click.echo(f"{name}: no file, skipped", err=True)
+            continue
+        progress = _Progress(name)
+        with _open(path, "r") as f:
+            import_table(MODELS[name], f, fmt, batch_size, progress)
+        progress.done()
+        imported.append(name)
+
+    _reset_sequences(imported)
+    if "posts" in imported:
+        recount_categories()
+        db.session.commit()
+    current_app.extensions['response_cache'].clear()
+    click.echo(f"Imported {', '.join(imported) or 'nothing'} from {directory}")
@@ -0,0 +1,238 @@
+# cache.py
+from collections import OrderedDict
+from functools import wraps
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from flask import current_app, request, session, Response
+from flask_login import current_user
+
+from extensions import AppExtension, per_app
+
+
+def viewer_key():
+    """
+    Identify whose copy of a page this request gets.
+
+    Anonymous visitors all share one; a signed-in user gets one per session, since pages embed
+    their name and a CSRF token bound to that session.
+    """
+    if not current_user.is_authenticated:
+        return "anon"
+    token = session.get('csrf_token', '')
+    return f"user:{current_user.get_id()}:{hashlib.sha1(token.encode()).hexdigest()[:12]}"
+
+
+class LRUCache:
+    """Thread-safe in-process cache with a size bound (least recently used entries go first) and per-entry TTL."""
+
+    def __init__(self, max_entries=1024, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        # Generation counters live outside the LRU so that eviction can never reset them
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_counters(self, names):
+        with self._lock:
+            return [self._counters.get(name, 0) for name in names]
+
+    def incr(self, name):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+            return self._counters[name]
+
+
+class RedisCache:
+    """
+    Shared cache backend for running several workers or dynos off one cache.
+
+    Speaks the Redis protocol through redis-py, so any compatible server works, including a local
+    redis-server. An already-configured client (e.g. fakeredis) can be passed in instead of a URL.
+    """
+
+    def __init__(self, url=None, client=None, default_ttl=300, prefix="blog:"):
+        if client is None:
+            import redis  # optional dependency, only needed for this backend
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl or None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+    def get_counters(self, names):
+        values = self.client.mget([self.prefix + "gen:" + name for name in names])
+        return [int(v) if v is not None else 0 for v in values]
+
+    def incr(self, name):
+        return self.client.incr(self.prefix + "gen:" + name)
+
+
+class ResponseCache(AppExtension):
+    """
+    Caches rendered GET responses and invalidates them by tag.
+
+    Each cached view declares tags (e.g. "posts", "post:42"). Every tag has a generation counter that
+    is folded into the cache key, so invalidate("post:42") makes every entry carrying that tag
+    unreachable at once, on every worker sharing the backend, and the stale entries simply age out.
+    """
+
+    # Tag carried by every entry, bumped by clear()
+    GLOBAL_TAG = "*"
+
+    extension_name = "response_cache"
+    shared_args = ("backend",)
+
+    def __init__(self, app=None, backend=None):
+        self.backend = backend
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not app:
+            # Configure an instance of its own for this app (see extensions.AppExtension)
+            return self.bind(app).init_app(app)
+        app.config.setdefault('RESPONSE_CACHE_ENABLED', os.getenv('RESPONSE_CACHE_ENABLED', '1') == '1')
+        app.config.setdefault('RESPONSE_CACHE_TTL', int(os.getenv('RESPONSE_CACHE_TTL', 300)))
+        app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES', int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 2048)))
+        app.config.setdefault('RESPONSE_CACHE_REDIS_URL', os.getenv('RESPONSE_CACHE_REDIS_URL'))
+        self.enabled = app.config['RESPONSE_CACHE_ENABLED']
+        if self.backend is None:
+            if app.config['RESPONSE_CACHE_REDIS_URL']:
+                self.backend = RedisCache(app.config['RESPONSE_CACHE_REDIS_URL'],
+                                          default_ttl=app.config['RESPONSE_CACHE_TTL'])
+            else:
+                self.backend = LRUCache(app.config['RESPONSE_CACHE_MAX_ENTRIES'], app.config['RESPONSE_CACHE_TTL'])
+        app.extensions['response_cache'] = self
+
+    # Invalidation
+
+    @per_app
+    def invalidate(self, *tags):
+        """Drop every cached response carrying any of the given tags."""
+        for tag in tags:
+            self.backend.incr(tag)
+        with self._stats_lock:
+            self.invalidations += len(tags)
+
+    @per_app
+    def clear(self):
+        self.invalidate(self.GLOBAL_TAG)
+
+    # Lookup
+
+    def _make_key(self, tags, query_args):
+        args = "&".join(f"{name}={request.args.get(name, '')}" for name in query_args)
+        generations = self.backend.get_counters((self.GLOBAL_TAG,) + tuple(tags))
+        raw = "|".join([request.endpoint, request.view_args and repr(sorted(request.view_args.items())) or "",
+                        args, viewer_key(), ",".join(map(str, generations))])
+        return "page:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def cached(self, tags=(), query_args=(), ttl=None):
+        """
+        Decorator caching a view's successful GET responses.
+
+        Args:
+            tags: Tags to invalidate the entry by. Either a tuple of strings or a callable taking the
+                view's keyword arguments and returning one.
+            query_args: Query-string parameters the response depends on.
+            ttl: Seconds to keep the entry, defaulting to RESPONSE_CACHE_TTL.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                cache = self.for_app()
+                if not cache.enabled or request.method not in ("GET", "HEAD"):
+                    return f(*args, **kwargs)
+                entry_tags = tags(**kwargs) if callable(tags) else tags
+                key = cache._make_key(entry_tags, query_args)
+                entry = cache.backend.get(key)
+                if entry is not None:
+                    with cache._stats_lock:
+                        cache.hits += 1
+                    body, status, headers = entry
+                    response = Response(body, status=status, headers=headers)
+                    response.headers['X-Cache'] = 'HIT'
+                    # Stored validators (see conditional.py) still answer If-None-Match with a 304
+                    return response.make_conditional(request)
+                with cache._stats_lock:
+                    cache.misses += 1
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    headers = [(k, v) for k, v in response.headers.items() if k.lower() != 'set-cookie']
+                    cache.backend.set(key, (response.get_data(), response.status_code, headers), ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return decorated_function
+        return decorator
+
+    # Reporting
+
+    @per_app
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "invalidations": self.invalidations,
+                "entries": len(self.backend) if hasattr(self.backend, "__len__") else None,
+            }
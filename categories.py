@@ -0,0 +1,58 @@
+# categories.py
+from flask import g
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Post, CategoryCount
+
+
+def category_counts():
+    """Posts per category as a {category: count} dict, read from the summary table once per request."""
+    counts = g.get("_category_counts")
+    if counts is None:
+        counts = g._category_counts = dict(
+            db.session.execute(select(CategoryCount.category, CategoryCount.post_count)).all())
+    return counts
+
+
+def count_post(category, delta):
+    """Add delta to a category's post count, in the caller's transaction."""
+    if category is None or delta == 0:
+        return
+    g.pop("_category_counts", None)
+    # Relative update, so concurrent posts in the same category never lose an increment
+    result = db.session.execute(
+        db.update(CategoryCount)
+        .where(CategoryCount.category == category)
+        .values(post_count=CategoryCount.post_count + delta)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        return
+    # First post in a category nobody has used yet; another worker may be inserting it too
+    try:
+        with db.session.begin_nested():
+            db.session.execute(db.insert(CategoryCount).values(category=category, post_count=delta))
+    except IntegrityError:
+        count_post(category, delta)
+
+
+def move_post(old_category, new_category):
+    """Count an edited post under its new category instead of its old one."""
+    if old_category != new_category:
+        count_post(old_category, -1)
+        count_post(new_category, 1)
+
+
+def recount_categories():
+    """Rebuild the summary table from the posts table, in the caller's transaction. Returns the counts."""
+    counts = dict(db.session.execute(
+        select(Post.category, func.count(Post.id)).where(Post.category.is_not(None)).group_by(Post.category)
+    ).all())
+    g.pop("_category_counts", None)
+    db.session.execute(db.delete(CategoryCount))
+    if counts:
+        db.session.execute(db.insert(CategoryCount), [
+            {"category": category, "post_count": count} for category, count in counts.items()
+        ])
+    return counts
@@ -0,0 +1,85 @@
+# comments.py
+from sqlalchemy import select
+from sqlalchemy.orm import defer
+
+from models import db, Post, Comment
+from pagination import keyset_paginate
+
+# Replies nested deeper than this are still shown, just not indented any further
+MAX_DEPTH = 5
+
+
+class CommentNode:
+    """A comment and the replies to it, oldest first."""
+
+    __slots__ = ("comment", "replies")
+
+    def __init__(self, comment):
+        self.comment = comment
+        self.replies = []
+
+    def walk(self):
+        yield self.comment
+        for reply in self.replies:
+            yield from reply.walk()
+
+
+def comment_page(post_id, cursor=None, per_page=20):
+    """
+    One page of a post's comment threads, newest thread first, each with all of its replies.
+
+    Two queries whatever the nesting: a keyset page of the top-level comments, then a single
+    recursive CTE fetching every reply below them. Only the sanitised text is loaded.
+    Raises ValueError for a bad cursor.
+    """
+    roots = (Comment.query.options(defer(Comment.text))
+             .filter(Comment.post_id == post_id, Comment.parent_id.is_(None)))
+    page = keyset_paginate(roots, [Comment.id], key=lambda comment: (comment.id,), cursor=cursor, per_page=per_page)
+
+    nodes = {comment.id: CommentNode(comment) for comment in page.items}
+    if nodes:
+        tree = select(Comment.id).where(Comment.parent_id.in_(list(nodes))).cte("reply_tree", recursive=True)
+        tree = tree.union_all(select(Comment.id).join(tree, Comment.parent_id == tree.c.id))
+        replies = (Comment.query.options(defer(Comment.text))
+                   .join(tree, Comment.id == tree.c.id)
+                   .order_by(Comment.id)
+                   .all())
+        # Ordered by id, so a reply's parent always has its node by the time the reply is reached
+        for reply in replies:
+            node = nodes[reply.id] = CommentNode(reply)
+            nodes[reply.parent_id].replies.append(node)
+
+    page.items = [nodes[comment.id] for comment in page.items]
+    return page
+
+
+def add_comment(comment):
+    """Add a new comment and count it on its post, in the caller's transaction."""
+    if comment.parent_id is not None:
+        parent = db.session.get(Comment, comment.parent_id)
+        if parent is None or parent.post_id != comment.post_id:
+            raise ValueError("Replies must answer a comment on the same post.")
+    db.session.add(comment)
+    _adjust_count(comment.post_id, 1)
+
+
+def delete_comment(comment):
+    """Delete a comment with all the replies below it and uncount them, in the caller's transaction."""
+    tree = select(Comment.id).where(Comment.id == comment.id).cte("delete_tree", recursive=True)
+    tree = tree.union_all(select(Comment.id).join(tree, Comment.parent_id == tree.c.id))
+    ids = [comment_id for (comment_id,) in db.session.execute(select(tree.c.id))]
+    db.session.execute(
+        db.delete(Comment).where(Comment.id.in_(ids)).execution_options(synchronize_session=False)
+    )
+    _adjust_count(comment.post_id, -len(ids))
+    return len(ids)
+
+
+def _adjust_count(post_id, delta):
+    # Relative update, so concurrent comments on the same post never lose an increment
+    db.session.execute(
+        db.update(Post)
+        .where(Post.id == post_id)
+        .values(comment_count=Post.comment_count + delta)
+        .execution_options(synchronize_session=False)
+    )
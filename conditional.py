@@ -0,0 +1,77 @@
+# conditional.py
+from datetime import timezone
+from functools import wraps
+import hashlib
+
+from flask import current_app, request
+from flask_login import current_user
+
+from cache import viewer_key
+
+
+def _as_utc(value):
+    """Normalise a timestamp to aware UTC with whole seconds, the precision of an HTTP date."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def make_etag(*parts):
+    """Strong entity tag for a response that depends on the given parts and on who is viewing it."""
+    raw = "|".join(map(str, parts + (viewer_key(),)))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def conditional(validator, max_age=0):
+    """
+    Decorator answering conditional GETs for a view without rendering it.
+
+    Apply it inside ResponseCache.cached: a warm cache entry keeps the validators set here and
+    answers conditional requests itself, without running the validator query.
+
+    Args:
+        validator: Callable taking the view's keyword arguments and returning (etag, last_modified)
+            from cheap version data, or None to let the view handle the request (e.g. to 404).
+        max_age: Seconds shared caches and browsers may reuse an anonymous response before
+            revalidating. Signed-in responses are always private and revalidated.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return f(*args, **kwargs)
+            validators = validator(**kwargs)
+            if validators is None:
+                return f(*args, **kwargs)
+            etag, last_modified = validators
+            last_modified = _as_utc(last_modified)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = bool(since and last_modified and last_modified <= since)
+
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            if current_user.is_authenticated:
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+            else:
+                response.cache_control.public = True
+                response.cache_control.max_age = max_age
+                response.cache_control.must_revalidate = True
+            # Signing in or out changes the page without changing the data behind it
+            response.vary.add("Cookie")
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,139 @@
+# content.py
+from functools import partial
+import hashlib
+from html.parser import HTMLParser
+import re
+import threading
+
+import bleach
+from bleach.callbacks import nofollow
+from bleach.linkifier import LinkifyFilter
+
+# Maximum length of the plain-text preview stored on each post
+EXCERPT_LENGTH = 300
+
+# Bump whenever the allow-lists below change, then run `flask render-html`: stored HTML cleaned under
+# an older version is only cleaned per response until then
+SANITIZER_VERSION = 1
+
+# What CKEditor produces with the toolbar we ship. style attributes are dropped, since cleaning
+# CSS needs tinycss2; CKEditor's default toolbar doesn't write any
+POST_TAGS = {
+    "a", "abbr", "b", "blockquote", "br", "caption", "code", "del", "div", "em", "figcaption", "figure",
+    "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "li", "ol", "p", "pre", "s", "span", "strike",
+    "strong", "sub", "sup", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "u", "ul",
+}
+POST_ATTRIBUTES = {
+    "a": ["href", "title", "rel", "target"],
+    "abbr": ["title"],
+    "img": ["src", "alt", "title", "width", "height"],
+    "td": ["colspan", "rowspan"],
+    "th": ["colspan", "rowspan", "scope"],
+}
+# Comments are plain text boxes; keep simple inline markup and turn bare URLs into nofollow links
+COMMENT_TAGS = {"a", "b", "br", "code", "em", "i", "p", "strong"}
+COMMENT_ATTRIBUTES = {"a": ["href", "title", "rel"]}
+PROTOCOLS = {"http", "https", "mailto"}
+
+# Cleaners are reusable but not thread-safe, so each thread builds its own on first use
+_cleaners = threading.local()
+
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML fragment, skipping script and style blocks."""
+
+    SKIP_TAGS = {"script", "style"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skipping:
+            self._skipping -= 1
+        # Block-level tags end a word, so make sure neighbouring text doesn't run together
+        self.parts.append(" ")
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def html_to_text(body_html):
+    """Return the plain text of an HTML fragment with whitespace collapsed."""
+    parser = _TextExtractor()
+    parser.feed(body_html or "")
+    parser.close()
+    return re.sub(r"\s+", " ", "".join(parser.parts)).strip()
+
+
+def make_excerpt(body_html, length=EXCERPT_LENGTH):
+    """Build the plain-text listing excerpt for a post body, cut on a word boundary."""
+    text = html_to_text(body_html)
+    if len(text) <= length:
+        return text
+    cut = text[:length - 1]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip(" ,.;:") + "…"
+
+
+def _cleaner(kind):
+    cleaner = getattr(_cleaners, kind, None)
+    if cleaner is None:
+        if kind == "post":
+            cleaner = bleach.Cleaner(tags=POST_TAGS, attributes=POST_ATTRIBUTES, protocols=PROTOCOLS, strip=True)
+        else:
+            cleaner = bleach.Cleaner(tags=COMMENT_TAGS, attributes=COMMENT_ATTRIBUTES, protocols=PROTOCOLS,
+                                     strip=True, filters=[partial(LinkifyFilter, callbacks=[nofollow],
+                                                                  skip_tags={"code"})])
+        setattr(_cleaners, kind, cleaner)
+    return cleaner
+
+
+def content_hash(source):
+    return hashlib.sha256((source or "").encode("utf-8")).hexdigest()
+
+
+def sanitize_post_html(source):
+    """Clean a post body down to the markup CKEditor writes, with no scripts, handlers or javascript: URLs."""
+    return _cleaner("post").clean(source or "")
+
+
+def sanitize_comment_html(source):
+    return _cleaner("comment").clean(source or "")
+
+
+def render_post_body(post):
+    """
+    Store the sanitised HTML of post.body on the post. Skips the work when the body and the
+    sanitiser are both unchanged since the last render. Returns True if anything was written.
+    """
+    digest = content_hash(post.body)
+    if post.body_html is not None and post.body_hash == digest and post.sanitizer_version == SANITIZER_VERSION:
+        return False
+    post.body_html = sanitize_post_html(post.body)
+    post.body_hash = digest
+    post.sanitizer_version = SANITIZER_VERSION
+    return True
+
+
+def render_comment_text(comment):
+    """Same as render_post_body, for a comment's text."""
+    digest = content_hash(comment.text)
+    if comment.text_html is not None and comment.text_hash == digest and comment.sanitizer_version == SANITIZER_VERSION:
+        return False
+    comment.text_html = sanitize_comment_html(comment.text)
+    comment.text_hash = digest
+    comment.sanitizer_version = SANITIZER_VERSION
+    return True
+
+
+def is_stale(html, sanitizer_version):
+    """True when stored HTML is missing or was cleaned under an older policy. Cheap enough for every view."""
+    return html is None or sanitizer_version != SANITIZER_VERSION
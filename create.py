@@ -1,5 +1,8 @@
-from main import app, db
+from main import create_app
+from models import db
+
+app = create_app()
 
 with app.app_context():
     db.drop_all()
-    db.create_all()
\ No newline at end of file
+    db.create_all() 
@@ -0,0 +1,214 @@
+# database.py
+from functools import wraps
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+from extensions import AppExtension, per_app
+
+# Bind key of the optional read replica in SQLALCHEMY_BINDS
+REPLICA = "replica"
+
+# Session key holding the time until which this client reads from the primary (see read-your-writes below)
+PRIMARY_UNTIL_KEY = "_primary_until"
+
+
+class PoolMetrics:
+    """Counters for one connection pool: how long checkouts wait and how old the connections handed out are."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connections_opened = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.age_seconds_total = 0.0
+        self.age_seconds_max = 0.0
+        self._lock = threading.Lock()
+
+    def observe_wait(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def observe_age(self, seconds):
+        with self._lock:
+            self.age_seconds_total += seconds
+            self.age_seconds_max = max(self.age_seconds_max, seconds)
+
+    def observe_connect(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def snapshot(self):
+        with self._lock:
+            checkouts = self.checkouts
+            return {
+                "checkouts": checkouts,
+                "checkout_timeouts": self.timeouts,
+                "connections_opened": self.connections_opened,
+                "checkout_wait_seconds_avg": round(self.wait_seconds_total / checkouts, 6) if checkouts else None,
+                "checkout_wait_seconds_max": round(self.wait_seconds_max, 6),
+                "connection_age_seconds_avg": round(self.age_seconds_total / checkouts, 3) if checkouts else None,
+                "connection_age_seconds_max": round(self.age_seconds_max, 3),
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records checkout wait (including connecting and pre-ping) and connection age."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+        event.listen(self, "connect", self._on_connect)
+        event.listen(self, "checkout", self._on_checkout)
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.observe_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.observe_wait(time.perf_counter() - started)
+        return connection
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        connection_record.info["connected_at"] = time.monotonic()
+        self.metrics.observe_connect()
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        connected_at = connection_record.info.get("connected_at")
+        if connected_at is not None:
+            self.metrics.observe_age(time.monotonic() - connected_at)
+
+    def stats(self):
+        return dict(self.metrics.snapshot(), pool_size=self.size(), checked_in=self.checkedin(),
+                    checked_out=self.checkedout(), overflow=max(self.overflow(), 0))
+
+
+class RoutingSession(Session):
+    """
+    Session sending reads to the read replica during requests that opted in (see DatabaseRouter.replica_reads).
+
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary, and mark the request as having
+    written so the client reads its own writes from the primary for a little while afterwards.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            writing = self._flushing or isinstance(clause, UpdateBase)
+            if writing:
+                if has_request_context():
+                    g._db_wrote = True
+            elif has_request_context() and g.get("_db_replica") and REPLICA in self._db.engines:
+                return self._db.engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def engine_options(url, config):
+    """SQLAlchemy engine options for a database URL, from the DB_* settings."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # In-memory SQLite keeps one connection per thread; there is no pool to tune
+        return {}
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": config['DB_POOL_SIZE'],
+        "max_overflow": config['DB_MAX_OVERFLOW'],
+        "pool_timeout": config['DB_POOL_TIMEOUT'],
+        "pool_recycle": config['DB_POOL_RECYCLE'],
+        "pool_pre_ping": config['DB_POOL_PRE_PING'],
+    }
+    if backend in ("postgresql", "postgres") and config['DB_STATEMENT_TIMEOUT_MS']:
+        options["connect_args"] = {"options": f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+
+class DatabaseRouter(AppExtension):
+    """
+    Tunes the engine pools and routes eligible reads to an optional read replica.
+
+    Call init_app() before db.init_app(), since it fills in SQLALCHEMY_ENGINE_OPTIONS and, when
+    DATABASE_REPLICA_URL is set, a "replica" entry in SQLALCHEMY_BINDS. The SQLAlchemy object must be
+    created with session_options={"class_": RoutingSession}.
+
+    Read-your-writes: a request that wrote anything stores a timestamp in the session, and that client's
+    requests read from the primary until DB_REPLICA_STICKY_SECONDS have passed, covering replication lag.
+    """
+
+    extension_name = "database_router"
+    shared_args = ("db",)
+
+    def __init__(self, app=None, db=None):
+        self.db = db
+        self.sticky_seconds = 5
+        self.reads = {"primary": 0, "replica": 0}
+        self._reads_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not app:
+            # Configure an instance of its own for this app (see extensions.AppExtension)
+            return self.bind(app).init_app(app)
+        app.config.setdefault('DB_POOL_SIZE', int(os.getenv('DB_POOL_SIZE', 5)))
+        app.config.setdefault('DB_MAX_OVERFLOW', int(os.getenv('DB_MAX_OVERFLOW', 10)))
+        app.config.setdefault('DB_POOL_TIMEOUT', float(os.getenv('DB_POOL_TIMEOUT', 10)))
+        app.config.setdefault('DB_POOL_RECYCLE', int(os.getenv('DB_POOL_RECYCLE', 1800)))
+        app.config.setdefault('DB_POOL_PRE_PING', os.getenv('DB_POOL_PRE_PING', '1') == '1')
+        app.config.setdefault('DB_STATEMENT_TIMEOUT_MS', int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000)))
+        app.config.setdefault('DATABASE_REPLICA_URL', os.getenv('DATABASE_REPLICA_URL'))
+        app.config.setdefault('DB_REPLICA_STICKY_SECONDS', float(os.getenv('DB_REPLICA_STICKY_SECONDS', 5)))
+        self.sticky_seconds = app.config['DB_REPLICA_STICKY_SECONDS']
+
+        options = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(options, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        if app.config['DATABASE_REPLICA_URL']:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            replica_url = app.config['DATABASE_REPLICA_URL']
+            binds.setdefault(REPLICA, dict(engine_options(replica_url, app.config), url=replica_url))
+            app.config['SQLALCHEMY_BINDS'] = binds
+
+        app.after_request(self._remember_writes)
+        app.extensions['database_router'] = self
+
+    def replica_reads(self, f):
+        """Decorator letting a view's GET/HEAD requests read from the replica, unless this client just wrote."""
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            use_replica = (request.method in ("GET", "HEAD")
+                           and session.get(PRIMARY_UNTIL_KEY, 0) < time.time())
+            g._db_replica = use_replica
+            router = self.for_app()
+            with router._reads_lock:
+                router.reads["replica" if use_replica else "primary"] += 1
+            return f(*args, **kwargs)
+        return decorated_function
+
+    def _remember_writes(self, response):
+        if g.get("_db_wrote"):
+            session[PRIMARY_UNTIL_KEY] = time.time() + self.sticky_seconds
+        return response
+
+    @per_app
+    def stats(self):
+        pools = {}
+        for key, engine in self.db.engines.items():
+            pool = engine.pool
+            pools[key or "primary"] = pool.stats() if isinstance(pool, InstrumentedQueuePool) else {"pool": pool.status()}
+        with self._reads_lock:
+            reads = dict(self.reads)
+        return {"pools": pools, "routed_requests": reads, "replica_configured": REPLICA in self.db.engines}
@@ -1,8 +1,93 @@
 # email_sender.py
 import smtplib
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+import heapq
 import os
+import threading
+import time
+
+from extensions import AppExtension, per_app
+
+
+class SMTPConnectionPool:
+    """Keeps authenticated SMTP connections open so each message doesn't pay for a new TLS handshake and login."""
+
+    def __init__(self, host, port, username=None, password=None, use_tls=True, size=2, max_age=300, timeout=30):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_age = max_age
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = deque()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()  # Secure the connection
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        return server, time.monotonic()
+
+    @staticmethod
+    def _discard(server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                entry = self._idle.popleft() if self._idle else None
+            if entry is None:
+                return self._connect()
+            server, opened_at = entry
+            if time.monotonic() - opened_at > self.max_age:
+                self._discard(server)
+                continue
+            try:
+                if server.noop()[0] == 250:
+                    return entry
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            server.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a ready-to-use connection; it goes back to the pool unless the block raised."""
+        with self._slots:
+            server, opened_at = self._checkout()
+            try:
+                yield server
+            except Exception:
+                server.close()
+                raise
+            with self._lock:
+                self._idle.append((server, opened_at))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for server, _ in idle:
+            self._discard(server)
+
 
 class EmailSender:
     def __init__(self):
@@ -10,33 +95,306 @@ class EmailSender:
         self.recipient = os.getenv("EMAIL_USER")
         self.smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
         self.smtp_port = os.getenv("SMTP_PORT", 587)
-        
+        # Set SMTP_STARTTLS=0 for a plain local server (e.g. `python -m aiosmtpd -n`) during development
+        self.pool = SMTPConnectionPool(
+            self.smtp_server,
+            self.smtp_port,
+            username=self.recipient,
+            password=os.getenv("EMAIL_PASS"),
+            use_tls=os.getenv("SMTP_STARTTLS", "1") == "1",
+            size=int(os.getenv("SMTP_POOL_SIZE", 2)),
+        )
+
+    def build_message(self, sender_email, subject, body, body_html=None):
+        """Create the MIME message sent to the recipient on behalf of sender_email."""
+        # Create the MIME multipart message
+        msg = MIMEMultipart("alternative")
+        msg["Subject"] = subject
+        msg["From"] = sender_email
+        msg["To"] = self.recipient
+
+        # Attach plain text part
+        text_part = MIMEText(body, "plain")
+        msg.attach(text_part)
+
+        # Attach HTML part if provided
+        if body_html:
+            html_part = MIMEText(body_html, "html")
+            msg.attach(html_part)
+        return msg
+
+    def deliver(self, sender_email, subject, body, body_html=None):
+        """Send one message over a pooled connection, raising on failure."""
+        msg = self.build_message(sender_email, subject, body, body_html)
+        with self.pool.connection() as server:
+            server.sendmail(sender_email, self.recipient, msg.as_string())
+
     def send_email(self, sender_email, sender_name, subject, body, body_html=None):
         """Send an email where the recipient is always the user (you) and the sender is the logged-in user."""
         try:
-            # Create the MIME multipart message
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = subject
-            msg["From"] = sender_email
-            msg["To"] = self.recipient
-            
-            # Attach plain text part
-            text_part = MIMEText(body, "plain")
-            msg.attach(text_part)
-
-            # Attach HTML part if provided
-            if body_html:
-                html_part = MIMEText(body_html, "html")
-                msg.attach(html_part)
-
-            # Connect to the SMTP server
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()  # Secure the connection
-                # No need to login the sender, just the server credentials
-                server.login(self.recipient, os.getenv("EMAIL_PASS"))
-                server.sendmail(sender_email, self.recipient, msg.as_string())
-            
+            self.deliver(sender_email, subject, body, body_html)
             print(f"Email sent successfully from {sender_name}!")
         except Exception as e:
             print(f"Failed to send email. Error: {e}")
 
+
+class EmailQueue(AppExtension):
+    """
+    Background delivery of outgoing email.
+
+    Messages are written to an outbox table and handed to a small pool of worker threads, which deliver
+    them through the sender's pooled SMTP connections. Failed deliveries are retried with exponential
+    backoff. The workers start with the first enqueue, or with the app when EMAIL_QUEUE_AUTOSTART is
+    set (the web process, see the Procfile; never one-off CLI commands). A recovery thread then reloads
+    whatever the outbox holds, at once and every EMAIL_RECOVER_INTERVAL seconds, so queued mail
+    survives a restart.
+
+    Every process may schedule the same message, so a worker first claims it with a conditional
+    UPDATE (pending -> sending) and only the process that changed the row sends it. The claim is a
+    lease of EMAIL_SEND_TIMEOUT seconds, stored in next_attempt_at; a message left in "sending" past it
+    by a process that died mid-delivery goes back to pending.
+    """
+
+    extension_name = "email_queue"
+    shared_args = ("sender", "db", "model")
+
+    def __init__(self, sender=None, db=None, model=None, app=None):
+        self.sender = sender
+        self.db = db
+        self.model = model
+        self.app = None
+        self.workers = 2
+        self.max_attempts = 5
+        self.backoff = 30
+        self.send_timeout = 300
+        self.recover_interval = 60
+        self.metrics = {"enqueued": 0, "sent": 0, "retried": 0, "failed": 0, "delivery_seconds_total": 0.0}
+        self._metrics_lock = threading.Lock()
+        self._due = []  # heap of (due timestamp, outbox id)
+        self._scheduled = set()  # ids in the heap or being delivered, so recovery can't double-send
+        self._ready = threading.Condition()
+        self._threads = []
+        self._recovery_thread = None
+        self._stopping = False
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not app:
+            # Configure an instance of its own for this app (see extensions.AppExtension)
+            return self.bind(app).init_app(app)
+        app.config.setdefault('EMAIL_WORKERS', int(os.getenv('EMAIL_WORKERS', 2)))
+        app.config.setdefault('EMAIL_MAX_ATTEMPTS', int(os.getenv('EMAIL_MAX_ATTEMPTS', 5)))
+        app.config.setdefault('EMAIL_RETRY_BACKOFF', float(os.getenv('EMAIL_RETRY_BACKOFF', 30)))
+        app.config.setdefault('EMAIL_SEND_TIMEOUT', float(os.getenv('EMAIL_SEND_TIMEOUT', 300)))
+        app.config.setdefault('EMAIL_RECOVER_INTERVAL', float(os.getenv('EMAIL_RECOVER_INTERVAL', 60)))
+        app.config.setdefault('EMAIL_QUEUE_AUTOSTART', os.getenv('EMAIL_QUEUE_AUTOSTART', '0') == '1')
+        if self.sender is None:
+            # Reads the SMTP settings from the environment; connections are only opened on first delivery
+            self.sender = EmailSender()
+        self.app = app
+        self.workers = app.config['EMAIL_WORKERS']
+        self.max_attempts = app.config['EMAIL_MAX_ATTEMPTS']
+        self.backoff = app.config['EMAIL_RETRY_BACKOFF']
+        self.send_timeout = app.config['EMAIL_SEND_TIMEOUT']
+        self.recover_interval = app.config['EMAIL_RECOVER_INTERVAL']
+        app.extensions['email_queue'] = self
+
+    # Lifecycle
+
+    @per_app
+    def start(self):
+        """Start the worker threads and the recovery thread reloading the outbox."""
+        with self._ready:
+            if self._threads:
+                return
+            self._stopping = False
+            self._stop.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"email-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._recovery_thread = threading.Thread(target=self._recover_loop, name="email-recovery", daemon=True)
+            self._recovery_thread.start()
+
+    @per_app
+    def stop(self, timeout=5):
+        with self._ready:
+            self._stopping = True
+            self._ready.notify_all()
+            threads = self._threads + [self._recovery_thread]
+            self._threads, self._recovery_thread = [], None
+        self._stop.set()
+        for thread in threads:
+            if thread is not None:
+                thread.join(timeout)
+        self.sender.pool.close()
+
+    # Producing
+
+    @per_app
+    def enqueue(self, sender_email, sender_name, subject, body, body_html=None):
+        """Store a message in the outbox and schedule it for delivery. Returns the outbox id."""
+        message = self.model(
+            sender_email=sender_email,
+            sender_name=sender_name,
+            subject=subject,
+            body=body,
+            body_html=body_html,
+        )
+        self.db.session.add(message)
+        self.db.session.commit()
+        self._count("enqueued")
+        self._schedule(message.id, time.time())
+        self.start()
+        return message.id
+
+    def _schedule(self, message_id, due, retry=False):
+        """Put a message on this process's delivery heap. Returns False if it was already there."""
+        with self._ready:
+            if message_id in self._scheduled and not retry:
+                return False
+            self._scheduled.add(message_id)
+            heapq.heappush(self._due, (due, message_id))
+            self._ready.notify()
+            return True
+
+    def _recover(self):
+        model = self.model
+        now = datetime.now(timezone.utc)
+        # Claims whose lease ran out: the process sending them died or hung
+        released = self.db.session.execute(
+            self.db.update(model)
+            .where(model.status == "sending", model.next_attempt_at < now)
+            .values(status="pending", next_attempt_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.db.session.commit()
+        if released:
+            print(f"Released {released} email(s) left unfinished by another worker.")
+        pending = self.db.session.query(model.id, model.next_attempt_at).filter_by(status="pending").all()
+        requeued = 0
+        for message_id, next_attempt_at in pending:
+            if next_attempt_at is None:
+                due = time.time()
+            elif next_attempt_at.tzinfo is None:
+                due = next_attempt_at.replace(tzinfo=timezone.utc).timestamp()
+            else:
+                due = next_attempt_at.timestamp()
+            requeued += self._schedule(message_id, due)
+        if requeued:
+            print(f"Requeued {requeued} pending email(s) from the outbox.")
+
+    def _recover_loop(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    self._recover()
+                except Exception as e:
+                    # e.g. the database isn't reachable yet; the next round tries again
+                    self.db.session.rollback()
+                    print(f"Could not reload the email outbox. Error: {e}")
+                finally:
+                    self.db.session.remove()
+                if self._stop.wait(self.recover_interval):
+                    return
+
+    # Consuming
+
+    def _next_due(self):
+        with self._ready:
+            while not self._stopping:
+                if self._due and self._due[0][0] <= time.time():
+                    return heapq.heappop(self._due)[1]
+                wait = self._due[0][0] - time.time() if self._due else None
+                self._ready.wait(wait)
+            return None
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                message_id = self._next_due()
+                if message_id is None:
+                    return
+                retrying = False
+                try:
+                    retrying = self._deliver(message_id)
+                except Exception as e:
+                    # e.g. the database connection dropped or a lock timed out; keep the worker and try
+                    # the message again after the base backoff
+                    self.db.session.rollback()
+                    print(f"Could not deliver email {message_id}. Error: {e}")
+                    self._schedule(message_id, time.time() + self.backoff, retry=True)
+                    retrying = True
+                finally:
+                    self.db.session.remove()
+                    if not retrying:
+                        with self._ready:
+                            self._scheduled.discard(message_id)
+
+    def _claim(self, message_id):
+        """Mark a due, pending message as being sent by this process. False if it isn't due or another process has it."""
+        model = self.model
+        now = datetime.now(timezone.utc)
+        claimed = self.db.session.execute(
+            self.db.update(model)
+            .where(model.id == message_id, model.status == "pending",
+                   self.db.or_(model.next_attempt_at.is_(None), model.next_attempt_at <= now))
+            .values(status="sending", next_attempt_at=now + timedelta(seconds=self.send_timeout))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.db.session.commit()
+        return claimed == 1
+
+    def _deliver(self, message_id):
+        """Attempt one delivery. Returns True if the message was rescheduled for another attempt."""
+        if not self._claim(message_id):
+            return False
+        message = self.db.session.get(self.model, message_id)
+        started = time.monotonic()
+        try:
+            self.sender.deliver(message.sender_email, message.subject, message.body, message.body_html)
+        except Exception as e:
+            message.attempts += 1
+            message.last_error = str(e)[:500]
+            if message.attempts >= self.max_attempts:
+                message.status = "failed"
+                self._count("failed")
+                print(f"Giving up on email {message_id} after {message.attempts} attempts. Error: {e}")
+            else:
+                delay = self.backoff * 2 ** (message.attempts - 1)
+                message.status = "pending"
+                message.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+                self._count("retried")
+                self._schedule(message_id, time.time() + delay, retry=True)
+            self.db.session.commit()
+            return message.status == "pending"
+        message.status = "sent"
+        message.next_attempt_at = None
+        message.attempts += 1
+        message.sent_at = datetime.now(timezone.utc)
+        self.db.session.commit()
+        self._count("sent")
+        self._count("delivery_seconds_total", time.monotonic() - started)
+        print(f"Email sent successfully from {message.sender_name}!")
+        return False
+
+    # Reporting
+
+    def _count(self, name, amount=1):
+        with self._metrics_lock:
+            self.metrics[name] += amount
+
+    @per_app
+    def stats(self):
+        with self._ready:
+            queued = len(self._due)
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        stats = dict(metrics, queued=queued, workers=len(self._threads),
+                     smtp_connections_opened=self.sender.pool.connections_opened)
+        stats["delivery_seconds_avg"] = (
+            round(stats["delivery_seconds_total"] / stats["sent"], 4) if stats["sent"] else None
+        )
+        return stats
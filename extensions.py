@@ -0,0 +1,43 @@
+# extensions.py
+from functools import wraps
+
+from flask import current_app
+
+
+class AppExtension:
+    """
+    Base for the extensions main.py creates once, at import, and shares between apps.
+
+    init_app() on the shared object never stores an app's settings, caches or threads on it. It binds
+    a fresh instance to the app (see bind()), kept in app.extensions[extension_name], and configures
+    that one, so building a second app (tests, CLI tools, benchmarks) can't change how the first one
+    behaves. Methods marked @per_app that are called on the shared object run on the instance bound
+    to the current app; background threads hold their app's instance directly.
+    """
+
+    # Key in app.extensions
+    extension_name = None
+    # Constructor arguments passed on to each app's instance (database, model, callbacks)
+    shared_args = ()
+    # The app an instance is bound to; None on the shared object
+    app = None
+
+    def bind(self, app):
+        """A new instance of this extension for app, sharing only the constructor arguments."""
+        ext = type(self)(**{name: getattr(self, name) for name in self.shared_args})
+        ext.app = app
+        return ext
+
+    def for_app(self):
+        """The instance bound to the current app; this one when it is bound itself."""
+        if self.app is not None:
+            return self
+        return current_app.extensions[self.extension_name]
+
+
+def per_app(method):
+    """Run method on the current app's instance when it is called on the shared extension."""
+    @wraps(method)
+    def decorated_function(self, *args, **kwargs):
+        return method(self.for_app(), *args, **kwargs)
+    return decorated_function
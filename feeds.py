@@ -0,0 +1,228 @@
+# feeds.py
+from datetime import timezone
+import hashlib
+import os
+import re
+import threading
+from xml.sax.saxutils import escape, quoteattr
+
+from flask import abort, current_app, request, stream_with_context, url_for
+from sqlalchemy import func, select
+
+from cache import LRUCache
+from extensions import AppExtension, per_app
+from forms import CATEGORY_CHOICES
+from models import db, Post, User
+
+# Rows fetched per round trip while streaming; on PostgreSQL this is a server-side cursor
+YIELD_PER = 500
+
+# The sitemap protocol allows at most this many URLs per file
+SITEMAP_MAX_URLS = 50000
+
+# /feed/world-news.xml -> "World News"
+CATEGORY_SLUGS = {re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-"): value for value, _label in CATEGORY_CHOICES}
+
+
+def _iso(value):
+    """RFC 3339 timestamp, as used by Atom and sitemaps; naive values (SQLite) are UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0).isoformat()
+
+
+def _post_url_prefix():
+    # url_for once rather than per row; every post URL is this plus its id
+    return url_for('blog.show_post', post_id=0, _external=True)[:-1]
+
+
+class FeedPublisher(AppExtension):
+    """
+    The Atom feeds (/feed.xml and one per category) and the sitemap.
+
+    Documents are streamed while they are generated: rows come from the database YIELD_PER at a
+    time and are written out a batch at a time, so no more than one batch of posts is ever in memory.
+    Each document's ETag is a hash of cheap aggregate queries (newest updated_at and number of posts
+    behind it), which answer If-None-Match with a 304 before any row is read. A complete document is
+    kept in memory under its ETag, so it is only generated again after a post behind it changes. The
+    sitemap is split by post id into shards of SITEMAP_SHARD_SIZE, listed by /sitemap.xml once there
+    is more than one; editing a post then only regenerates the shard containing it.
+    """
+
+    extension_name = "feeds"
+
+    def __init__(self, app=None):
+        self.items = 20
+        self.shard_size = 10000
+        self.max_age = 300
+        self.cache = LRUCache(max_entries=64, default_ttl=0)
+        self.metrics = {"generated": 0, "cache_hits": 0, "not_modified": 0}
+        self._metrics_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not app:
+            # Configure an instance of its own for this app (see extensions.AppExtension)
+            return self.bind(app).init_app(app)
+        app.config.setdefault('FEED_ITEMS', int(os.getenv('FEED_ITEMS', 20)))
+        app.config.setdefault('FEED_MAX_AGE', int(os.getenv('FEED_MAX_AGE', 300)))
+        app.config.setdefault('FEED_CACHE_MAX_ENTRIES', int(os.getenv('FEED_CACHE_MAX_ENTRIES', 64)))
+        app.config.setdefault('SITEMAP_SHARD_SIZE', int(os.getenv('SITEMAP_SHARD_SIZE', 10000)))
+        self.items = app.config['FEED_ITEMS']
+        self.max_age = app.config['FEED_MAX_AGE']
+        self.shard_size = min(app.config['SITEMAP_SHARD_SIZE'], SITEMAP_MAX_URLS)
+        self.cache = LRUCache(max_entries=app.config['FEED_CACHE_MAX_ENTRIES'], default_ttl=0)
+        app.extensions['feeds'] = self
+
+    def _count(self, name):
+        with self._metrics_lock:
+            self.metrics[name] += 1
+
+    # Responses
+
+    @per_app
+    def respond(self, version, last_modified, generate, mimetype="application/xml"):
+        """
+        Answer with the document generate() streams, identified by version (a tuple of its inputs).
+
+        generate is only called when neither the client nor the cache already has this version.
+        """
+        etag = hashlib.sha1("|".join(map(str, version)).encode("utf-8")).hexdigest()
+        if request.if_none_match.contains(etag):
+            self._count("not_modified")
+            response = current_app.response_class(status=304)
+        else:
+            body = self.cache.get(etag)
+            if body is not None:
+                self._count("cache_hits")
+                response = current_app.response_class(body, mimetype=mimetype)
+            else:
+                self._count("generated")
+                response = current_app.response_class(stream_with_context(self._stream(etag, generate)),
+                                                      mimetype=mimetype)
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified.replace(tzinfo=last_modified.tzinfo or timezone.utc)
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        return response
+
+    def _stream(self, etag, generate):
+        chunks = []
+        for chunk in generate():
+            chunk = chunk.encode("utf-8")
+            chunks.append(chunk)
+            yield chunk
+        # Only reached once the whole document is out; a client hanging up early caches nothing
+        self.cache.set(etag, b"".join(chunks))
+
+    # Atom
+
+    @per_app
+    def feed(self, category_slug=None):
+        category = None
+        if category_slug is not None:
+            category = CATEGORY_SLUGS.get(category_slug)
+            if category is None:
+                abort(404)
+        version_query = select(func.max(Post.updated_at), func.count(Post.id))
+        if category is not None:
+            version_query = version_query.where(Post.category == category)
+        updated, count = db.session.execute(version_query).one()
+        version = ("feed", category, self.items, updated, count)
+        return self.respond(version, updated, lambda: self._atom(category, updated),
+                            mimetype="application/atom+xml")
+
+    def _atom(self, category, updated):
+        title = "Intel-Vibez Blog" + (f": {category}" if category else "")
+        site_url = url_for('blog.get_all_posts', category=category, _external=True)
+        feed_url = request.base_url
+        post_url = _post_url_prefix()
+        yield ('<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">'
+               f"<title>{escape(title)}</title><link href={quoteattr(site_url)}/>"
+               f"<link rel=\"self\" href={quoteattr(feed_url)}/><id>{escape(feed_url)}</id>"
+               f"<updated>{_iso(updated) if updated else '1970-01-01T00:00:00+00:00'}</updated>\n")
+
+        query = (select(Post.id, Post.title, Post.subtitle, Post.excerpt, Post.body_html, Post.category,
+                        Post.created_at, Post.updated_at, User.name)
+                 .outerjoin(User, Post.author_id == User.id)
+                 .order_by(Post.created_at.desc(), Post.id.desc())
+                 .limit(self.items)
+                 .execution_options(yield_per=YIELD_PER))
+        if category is not None:
+            query = query.where(Post.category == category)
+        for rows in db.session.execute(query).partitions():
+            entries = []
+            for row in rows:
+                url = f"{post_url}{row.id}"
+                entries.append(
+                    f"<entry><title>{escape(row.title)}</title><link href={quoteattr(url)}/><id>{escape(url)}</id>"
+                    f"<published>{_iso(row.created_at)}</published><updated>{_iso(row.updated_at)}</updated>"
+                    f"<author><name>{escape(row.name or 'Anonymous')}</name></author>"
+                    f"<category term={quoteattr(row.category)}/>"
+                    f"<summary>{escape(row.excerpt or row.subtitle)}</summary>"
+                    f"<content type=\"html\">{escape(row.body_html or '')}</content></entry>\n"
+                )
+            yield "".join(entries)
+        yield "</feed>\n"
+
+    # Sitemaps
+
+    @per_app
+    def sitemap(self):
+        """The single sitemap while posts fit in one shard, otherwise an index of the shards."""
+        max_id, count, updated = db.session.execute(
+            select(func.max(Post.id), func.count(Post.id), func.max(Post.updated_at))
+        ).one()
+        if (max_id or 0) <= self.shard_size:
+            return self.sitemap_shard(0)
+        version = ("sitemap-index", self.shard_size, max_id, count, updated)
+        return self.respond(version, updated, self._sitemap_index)
+
+    def _sitemap_index(self):
+        shard = ((Post.id - 1) // self.shard_size).label("shard")
+        shards = db.session.execute(
+            select(shard, func.max(Post.updated_at)).group_by(shard).order_by(shard)
+        ).all()
+        yield '<?xml version="1.0" encoding="utf-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        for number, updated in shards:
+            url = url_for('blog.sitemap_shard', shard=number, _external=True)
+            yield f"<sitemap><loc>{escape(url)}</loc><lastmod>{_iso(updated)}</lastmod></sitemap>\n"
+        yield "</sitemapindex>\n"
+
+    @per_app
+    def sitemap_shard(self, shard):
+        first_id = shard * self.shard_size + 1
+        in_shard = Post.id.between(first_id, first_id + self.shard_size - 1)
+        updated, count = db.session.execute(
+            select(func.max(Post.updated_at), func.count(Post.id)).where(in_shard)
+        ).one()
+        # Shard 0 always exists, since it also lists the site's own pages
+        if count == 0 and shard != 0:
+            abort(404)
+        version = ("sitemap", self.shard_size, shard, updated, count)
+        return self.respond(version, updated, lambda: self._urlset(shard, in_shard))
+
+    def _urlset(self, shard, in_shard):
+        yield '<?xml version="1.0" encoding="utf-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        if shard == 0:
+            pages = [url_for('blog.get_all_posts', _external=True), url_for('blog.about', _external=True),
+                     url_for('blog.contact', _external=True)]
+            pages += [url_for('blog.get_all_posts', category=value, _external=True) for value, _label in CATEGORY_CHOICES]
+            yield "".join(f"<url><loc>{escape(url)}</loc></url>\n" for url in pages)
+
+        post_url = _post_url_prefix()
+        query = (select(Post.id, Post.updated_at).where(in_shard).order_by(Post.id)
+                 .execution_options(yield_per=YIELD_PER))
+        for rows in db.session.execute(query).partitions():
+            yield "".join(f"<url><loc>{escape(post_url)}{post_id}</loc><lastmod>{_iso(updated)}</lastmod></url>\n"
+                          for post_id, updated in rows)
+        yield "</urlset>\n"
+
+    @per_app
+    def stats(self):
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        metrics["cached_documents"] = len(self.cache)
+        return metrics
@@ -1,8 +1,11 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, PasswordField, EmailField, TextAreaField, FileField, SelectField
+from wtforms import StringField, SubmitField, PasswordField, EmailField, TextAreaField, FileField, SelectField, HiddenField
 from wtforms.validators import DataRequired, Email, EqualTo, URL
 from flask_wtf.file import FileAllowed
 
+# Post categories as (value, label) pairs; also used for the per-category feeds
+CATEGORY_CHOICES = [('Lifestyle', 'Lifestyle'), ('Wellbeing', 'Wellbeing'), ('Entertainment', 'Entertainment'), ('World News', 'World News'), ('Sports', 'Sports')]
+
 # Form for creating new blog posts
 class CreatePostForm(FlaskForm):
     title = StringField("Blog Post Title", validators=[DataRequired()])
@@ -10,7 +13,7 @@ class CreatePostForm(FlaskForm):
     body = TextAreaField("Blog Content", validators=[DataRequired()])
     image = FileField("Upload Image")
     # Dropdown menu to select the post category (required)
-    category = SelectField("Category", choices=[('Lifestyle', 'Lifestyle'), ('Wellbeing', 'Wellbeing'), ('Entertainment', 'Entertainment'), ('World News', 'World News'), ('Sports', 'Sports')], validators=[DataRequired()])
+    category = SelectField("Category", choices=CATEGORY_CHOICES, validators=[DataRequired()])
     submit = SubmitField("Submit Post")
 
 # Form for user registration
@@ -36,6 +39,8 @@ class PostForm(FlaskForm):
 # Form for submitting comments on blog posts
 class CommentForm(FlaskForm):
     text = TextAreaField("Comment", validators=[DataRequired()])
+    # Set when replying to another comment
+    parent_id = HiddenField("Reply to", filters=[lambda value: int(value) if value else None])
     submit = SubmitField("Submit")
 
 # Form for sending an email message (contact form)
@@ -0,0 +1,97 @@
+# health.py
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from extensions import AppExtension, per_app
+
+
+class ReadinessProbe(AppExtension):
+    """
+    Checks the database from a background thread so startup never waits on it.
+
+    The app starts serving (and answers liveness checks) immediately; readiness turns true once a
+    `SELECT 1` succeeds, retrying with backoff while the database is still coming up, and is then
+    re-checked every READINESS_INTERVAL seconds so a lost connection takes the instance out of rotation.
+    """
+
+    extension_name = "readiness"
+    shared_args = ("db",)
+
+    def __init__(self, app=None, db=None):
+        self.db = db
+        self.app = None
+        self.interval = 15
+        self.retry_delay = 0.5
+        self.ready = False
+        self.last_error = None
+        self.checked_at = None
+        self.started_at = time.monotonic()
+        self.ready_after = None
+        self._thread = None
+        self._stopping = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not app:
+            # Configure an instance of its own for this app (see extensions.AppExtension)
+            return self.bind(app).init_app(app)
+        app.config.setdefault('READINESS_INTERVAL', float(os.getenv('READINESS_INTERVAL', 15)))
+        app.config.setdefault('READINESS_RETRY_DELAY', float(os.getenv('READINESS_RETRY_DELAY', 0.5)))
+        self.app = app
+        self.interval = app.config['READINESS_INTERVAL']
+        self.retry_delay = app.config['READINESS_RETRY_DELAY']
+        app.extensions['readiness'] = self
+
+    @per_app
+    def start(self):
+        if self._thread is not None:
+            return
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="readiness-probe", daemon=True)
+        self._thread.start()
+
+    @per_app
+    def stop(self):
+        self._stopping.set()
+
+    @per_app
+    def check(self):
+        """Run one check now, update the state and return whether the database answered."""
+        try:
+            with self.app.app_context():
+                with self.db.engine.connect() as connection:
+                    connection.execute(text('SELECT 1'))
+        except Exception as e:
+            self.ready, self.last_error = False, str(e)
+        else:
+            self.ready, self.last_error = True, None
+            if self.ready_after is None:
+                self.ready_after = time.monotonic() - self.started_at
+                print(f"Database connection successful after {self.ready_after:.2f}s.")
+        self.checked_at = time.time()
+        return self.ready
+
+    def _run(self):
+        delay = self.retry_delay
+        while not self._stopping.is_set():
+            if self.check():
+                delay = self.retry_delay
+                wait = self.interval
+            else:
+                print(f"Database not ready yet, retrying in {delay:.1f}s. Error: {self.last_error}")
+                wait = delay
+                delay = min(delay * 2, self.interval)
+            self._stopping.wait(wait)
+
+    @per_app
+    def status(self):
+        return {
+            "ready": self.ready,
+            "checked_at": self.checked_at,
+            "ready_after_seconds": round(self.ready_after, 3) if self.ready_after is not None else None,
+            "error": self.last_error,
+        }
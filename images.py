@@ -0,0 +1,301 @@
+# images.py
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import tempfile
+
+from flask import current_app
+from PIL import Image as PILImage, ImageOps, UnidentifiedImageError
+from sqlalchemy.exc import IntegrityError
+
+from extensions import AppExtension, per_app
+
+from storage import make_storage, copy_to_temp
+from uploads import UploadFile, sniff_image_type
+
+try:
+    # Optional: lets Pillow read HEIC/HEIF photos straight off iPhones
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+# Widths of the responsive variants generated for every upload (only those narrower than the original)
+DEFAULT_SIZES = (320, 640, 1280)
+
+# Pillow format -> file extension used for stored images
+EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp", "HEIF": "heic"}
+
+# Formats browsers can display; anything else is converted to JPEG when processed
+WEB_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
+
+CHUNK_SIZE = 64 * 1024
+
+# Upload types accepted by UploadRequest, as named by uploads.sniff_image_type
+ALLOWED_TYPES = ("jpeg", "png", "gif", "webp", "heic")
+
+# Image.path of an original that hasn't been processed yet; it lives in UPLOAD_PENDING_FOLDER, not in storage
+PENDING_PREFIX = "pending/"
+
+
+class ImagePipeline(AppExtension):
+    """
+    Stores uploaded images once per distinct content and builds their responsive variants.
+
+    Uploads arrive already on disk and hashed (see uploads.UploadRequest), so byte-identical uploads
+    share a single image record. The original is kept in the private UPLOAD_PENDING_FOLDER, outside
+    static/, while a background thread strips its metadata (camera details, GPS position) and builds
+    the resized JPEG/PNG and WebP variants; until then pages show no image. Only the processed files
+    go to the storage backend (storage.py), each named after the SHA-256 of its own bytes, so a
+    public file is written once and never changes.
+    """
+
+    extension_name = "image_pipeline"
+    shared_args = ("db", "model", "on_ready")
+
+    def __init__(self, db=None, model=None, app=None, on_ready=None):
+        self.db = db
+        self.model = model
+        # Called as on_ready(image, original_path) inside an app context once the variants exist;
+        # original_path differs from image.path when the original was converted to a web format
+        self.on_ready = on_ready
+        self.app = None
+        self.executor = None
+        self.storage = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not app:
+            # Configure an instance of its own for this app (see extensions.AppExtension)
+            return self.bind(app).init_app(app)
+        app.config.setdefault('UPLOAD_FOLDER', os.path.join(app.root_path, 'static/uploads'))
+        app.config.setdefault('IMAGE_SIZES', DEFAULT_SIZES)
+        app.config.setdefault('IMAGE_JPEG_QUALITY', 82)
+        app.config.setdefault('IMAGE_WEBP_QUALITY', 80)
+        app.config.setdefault('IMAGE_WORKERS', int(os.getenv('IMAGE_WORKERS', 2)))
+        # Originals waiting to be processed, and uploads while they are received: never served
+        app.config.setdefault('UPLOAD_PENDING_FOLDER', os.path.join(app.instance_path, 'uploads'))
+        app.config.setdefault('UPLOAD_TEMP_FOLDER', app.config['UPLOAD_PENDING_FOLDER'])
+        app.config.setdefault('UPLOAD_MAX_FILE_BYTES', int(os.getenv('UPLOAD_MAX_FILE_BYTES', 15 * 1024 * 1024)))
+        app.config.setdefault('UPLOAD_ALLOWED_TYPES', ALLOWED_TYPES)
+        app.config.setdefault('UPLOAD_STORAGE', os.getenv('UPLOAD_STORAGE', 'local'))
+        app.config.setdefault('UPLOAD_S3_BUCKET', os.getenv('UPLOAD_S3_BUCKET'))
+        app.config.setdefault('UPLOAD_S3_ENDPOINT_URL', os.getenv('UPLOAD_S3_ENDPOINT_URL'))
+        app.config.setdefault('UPLOAD_S3_PUBLIC_URL', os.getenv('UPLOAD_S3_PUBLIC_URL'))
+        # Whole request bodies, checked against Content-Length before anything is read
+        if app.config.get('MAX_CONTENT_LENGTH') is None:
+            app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('UPLOAD_MAX_BYTES', 16 * 1024 * 1024))
+        self.app = app
+        self.storage = make_storage(app)
+        self.pending_folder = app.config['UPLOAD_PENDING_FOLDER']
+        os.makedirs(self.pending_folder, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=app.config['IMAGE_WORKERS'], thread_name_prefix="image")
+        app.extensions['image_pipeline'] = self
+
+    # Request side
+
+    @per_app
+    def url(self, path):
+        """Public URL of a stored image path such as image.path or a variant's path; None while it is pending."""
+        if path.startswith(PENDING_PREFIX):
+            return None
+        return self.storage.url(path)
+
+    def _pending_file(self, path):
+        return os.path.join(self.pending_folder, path[len(PENDING_PREFIX):])
+
+    @per_app
+    def store(self, file_storage):
+        """
+        Save an uploaded FileStorage and return its image record, reusing an existing record for identical bytes.
+
+        Raises ValueError if the upload isn't an image Pillow can read.
+        """
+        stream = file_storage.stream
+        if isinstance(stream, UploadFile) and stream.path is not None:
+            # Streamed to disk and hashed while the request was parsed
+            sha256 = stream.sha256
+            temp_path = stream.detach()
+        else:
+            temp_path = None
+        try:
+            if temp_path is None:
+                temp_path = copy_to_temp(stream, self.storage.temp_dir, CHUNK_SIZE)
+                digest = hashlib.sha256()
+                with open(temp_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                        digest.update(chunk)
+                sha256 = digest.hexdigest()
+
+            existing = self.model.query.filter_by(sha256=sha256).first()
+            if existing is not None:
+                if existing.status == "failed" and existing.path.startswith(PENDING_PREFIX):
+                    # An earlier attempt failed (the original may be gone too): put these identical
+                    # bytes back in its place and process them again
+                    os.replace(temp_path, self._pending_file(existing.path))
+                    temp_path = None
+                    self._requeue(existing)
+                return existing
+
+            try:
+                with PILImage.open(temp_path) as img:
+                    image_format = img.format
+                    width, height = img.size
+                    # EXIF orientations 5-8 are rotated by 90 degrees, which process() bakes in
+                    if img.getexif().get(0x0112) in (5, 6, 7, 8):
+                        width, height = height, width
+                extension = EXTENSIONS.get(image_format)
+                if extension is None:
+                    raise ValueError(f"Unsupported image format: {image_format}")
+            except (UnidentifiedImageError, OSError) as e:
+                if self._is_heif(temp_path):
+                    # Publishing it unprocessed would also publish its EXIF data
+                    raise ValueError("HEIC photos can't be converted here; please upload a JPEG or PNG.") from e
+                raise ValueError("The uploaded file is not a supported image.") from e
+
+            path = f"{PENDING_PREFIX}{sha256}.{extension}"
+            os.replace(temp_path, self._pending_file(path))
+            temp_path = None
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        image = self.model(sha256=sha256, path=path, width=width, height=height, status="pending")
+        self.db.session.add(image)
+        try:
+            self.db.session.commit()
+        except IntegrityError:
+            # The same bytes were uploaded concurrently; use the record that won
+            self.db.session.rollback()
+            return self.model.query.filter_by(sha256=sha256).one()
+        self.executor.submit(self._process_in_context, image.id)
+        return image
+
+    def _requeue(self, image):
+        """Queue a failed image for processing again, unless a concurrent upload already did."""
+        model = self.model
+        requeued = self.db.session.execute(
+            self.db.update(model)
+            .where(model.id == image.id, model.status == "failed")
+            .values(status="pending")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.db.session.commit()
+        if requeued:
+            self.executor.submit(self._process_in_context, image.id)
+
+    @staticmethod
+    def _is_heif(path):
+        with open(path, "rb") as f:
+            return sniff_image_type(f.read(12)) == "heic"
+
+    # Worker side
+
+    def _process_in_context(self, image_id):
+        with self.app.app_context():
+            try:
+                self.process(image_id)
+            except Exception as e:
+                self.db.session.rollback()
+                image = self.db.session.get(self.model, image_id)
+                if image is not None:
+                    image.status = "failed"
+                    self.db.session.commit()
+                print(f"Image processing failed for image {image_id}. Error: {e}")
+            finally:
+                self.db.session.remove()
+
+    @per_app
+    def process(self, image_id):
+        """Publish the pending original without its metadata, with resized JPEG/PNG and WebP variants."""
+        image = self.db.session.get(self.model, image_id)
+        if image is None or not image.path.startswith(PENDING_PREFIX):
+            return
+        sizes = self.app.config['IMAGE_SIZES']
+        jpeg_quality = self.app.config['IMAGE_JPEG_QUALITY']
+        webp_quality = self.app.config['IMAGE_WEBP_QUALITY']
+        original_path = image.path
+        pending_file = self._pending_file(original_path)
+        variants = []
+
+        with PILImage.open(pending_file) as original:
+            image_format = original.format
+            # Bake the EXIF orientation into the pixels, since the tag itself is about to be dropped
+            img = ImageOps.exif_transpose(original)
+            img.load()
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+        if image_format not in WEB_FORMATS:
+            # e.g. HEIC: publish a full-size JPEG (PNG if transparent) browsers can show
+            image_format = "PNG" if has_alpha else "JPEG"
+        # Re-encoding drops the EXIF data along with everything else Pillow isn't told to keep
+        image.path = self._save(img, image_format, quality=90)
+
+        for width in sorted(set(sizes)):
+            if width >= img.width:
+                continue
+            height = round(img.height * width / img.width)
+            resized = img.resize((width, height), PILImage.LANCZOS)
+            fallback_format = "PNG" if has_alpha else "JPEG"
+            fallback_path = self._save(resized, fallback_format, quality=jpeg_quality)
+            variants.append({"width": width, "path": fallback_path, "type": f"image/{fallback_format.lower()}"})
+            webp_path = self._save(resized, "WEBP", quality=webp_quality)
+            variants.append({"width": width, "path": webp_path, "type": "image/webp"})
+
+        # Full-size WebP, so WebP-capable browsers never fall back to the original
+        if image_format != "WEBP":
+            webp_path = self._save(img, "WEBP", quality=webp_quality)
+            variants.append({"width": img.width, "path": webp_path, "type": "image/webp"})
+
+        image.width, image.height = img.size
+        image.variants = json.dumps(variants)
+        image.status = "ready"
+        self.db.session.commit()
+        os.remove(pending_file)
+        if self.on_ready is not None:
+            self.on_ready(image, original_path)
+
+    def _save(self, img, image_format, quality):
+        """Encode img and store it as uploads/<sha256 of the encoded bytes>.<ext>. Returns that path."""
+        options = {"optimize": True}
+        if image_format == "JPEG":
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            options.update(quality=quality, progressive=True)
+        elif image_format == "WEBP":
+            options = {"quality": quality, "method": 4}
+        elif image_format == "GIF":
+            img = img.convert("P", palette=PILImage.ADAPTIVE)
+        fd, temp_path = tempfile.mkstemp(dir=self.storage.temp_dir, prefix=".variant-")
+        try:
+            with os.fdopen(fd, "w+b") as out:
+                img.save(out, format=image_format, **options)
+                out.seek(0)
+                digest = hashlib.sha256()
+                for chunk in iter(lambda: out.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            path = f"uploads/{digest.hexdigest()}.{EXTENSIONS[image_format]}"
+            self.storage.save(temp_path, path)
+            return path
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def srcset(image, webp=False):
+    """
+    Build a srcset attribute value for an image record.
+
+    With webp=True this lists the WebP variants (for a <source type="image/webp">); otherwise the
+    JPEG/PNG variants plus the original (for the <img> fallback). Empty until processing is done.
+    """
+    if image is None or image.status != "ready" or not image.variants:
+        return ""
+    entries = [v for v in json.loads(image.variants) if (v["type"] == "image/webp") == webp]
+    if not webp:
+        entries.append({"width": image.width, "path": image.path})
+    storage = current_app.extensions['image_pipeline'].storage
+    return ", ".join(f"{storage.url(v['path'])} {v['width']}w" for v in entries)
@@ -1,5 +1,7 @@
- 
-from main import app, db
+from main import create_app
+from models import db
+
+app = create_app()
 
 with app.app_context():
-    db.create_all()
\ No newline at end of file
+    db.create_all()
@@ -1,146 +1,191 @@
-from flask import Flask, render_template, render_template_string, redirect, url_for, flash, request
+from flask import Flask, Blueprint, current_app, render_template, render_template_string, redirect, url_for, flash, request, jsonify
 from flask_bootstrap import Bootstrap
 from flask_wtf import FlaskForm, CSRFProtect
 from wtforms import StringField, TextAreaField, SubmitField
 from wtforms.validators import DataRequired
-from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import relationship
-from sqlalchemy.exc import IntegrityError, OperationalError
-from flask_login import UserMixin, login_user, LoginManager, login_required, current_user, logout_user
-from forms import CreatePostForm, RegisterForm, LoginForm, PostForm, CommentForm, EmailForm, ProfileForm
+from sqlalchemy.orm import joinedload, defer
+from sqlalchemy.orm.attributes import set_committed_value
+from flask_login import login_user, LoginManager, login_required, current_user, logout_user
+from forms import CreatePostForm, RegisterForm, LoginForm, PostForm, CommentForm, EmailForm, ProfileForm, CATEGORY_CHOICES
 from functools import wraps
 from flask import abort
 import hashlib
 from dotenv import load_dotenv
-from sqlalchemy import text
-from email_sender import EmailSender
+from models import db, User, Post, Image, Comment, OutboxEmail, touch_posts
+from email_sender import EmailQueue
+from pagination import keyset_paginate
+from content import make_excerpt, render_post_body, render_comment_text, is_stale, sanitize_post_html, sanitize_comment_html, SANITIZER_VERSION
+from search import PostSearch
+from comments import comment_page, add_comment, delete_comment as delete_comment_tree, MAX_DEPTH
+from categories import category_counts, count_post, move_post, recount_categories
+from cache import ResponseCache
+from conditional import conditional, make_etag
+from images import ImagePipeline, srcset
+from uploads import UploadRequest
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from assets import AssetPipeline
+from templating import TemplateCompiler
+from user_cache import UserCache
+from passwords import PasswordHasher
+from health import ReadinessProbe
+from database import DatabaseRouter
+from metrics import Instrumentation, stats_samples
+from views import ViewCounter
+from feeds import FeedPublisher
+from bulk import blog_cli
 from flask_migrate import Migrate
-from werkzeug.utils import secure_filename
 from flask_wtf.csrf import generate_csrf
 import time
-import psycopg2
+import atexit
+import click
 import os
-import uuid
 
-# Load environment variables
-load_dotenv()
+# Extensions are created unbound here and attached to an app by create_app(), so importing this
+# module stays cheap and never touches the database. Ours keep a separate instance per app in
+# app.extensions (see extensions.py); calling them here reaches the current app's.
+migrate = Migrate()
+bootstrap = Bootstrap()
+login_manager = LoginManager()
+login_manager.login_view = 'blog.login'
+# Enable CSRF protection
+csrf = CSRFProtect()
 
-email_sender = EmailSender()
+# Serve fingerprinted, precompressed static files once `flask assets build` has run
+assets = AssetPipeline()
 
-# Initialize Flask app
-app = Flask(__name__, static_folder='static')
-app.config['SECRET_KEY'] = os.getenv('SECRETKEY')
-Bootstrap(app)
+# Compiled templates cached on disk (`flask templates compile` at deploy), with per-template timings
+templating = TemplateCompiler()
 
-# Initialize Flask-Login
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+# Rendered-page cache (in-process LRU, or Redis when RESPONSE_CACHE_REDIS_URL is set)
+response_cache = ResponseCache()
+
+# Engine pool settings and metrics, and read-replica routing for the views marked replica_reads
+db_router = DatabaseRouter(db=db)
+
+# Checks the database in the background; see /healthz/ready
+readiness = ReadinessProbe(db=db)
+
+# Per-request query counts and timings, Server-Timing headers, and Prometheus metrics at /metrics
+instrumentation = Instrumentation(db=db)
+
+# All of the site's pages; cli_group=None keeps its commands at the top level (flask backfill-excerpts)
+bp = Blueprint('blog', __name__, cli_group=None)
 
-# Enable CSRF protection
-csrf = CSRFProtect(app)
 # Added 'wtf' global for Jinja2
-app.jinja_env.globals['wtf'] = FlaskForm
+bp.add_app_template_global(FlaskForm, 'wtf')
 
 # Inject current time into Jinja templates
-@app.context_processor
+@bp.app_context_processor
 def inject_time():
     return dict(time=time)
 
-# Use PostgreSQL if DATABASE_URL is set, otherwise raise an error
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
+# Format a post's created_at timestamp for display, e.g. "January 05, 2025"
+@bp.app_template_filter('post_date')
+def post_date(value, fmt="%B %d, %Y"):
+    if value is None:
+        return ""
+    return value.strftime(fmt)
 
-if not app.config['SQLALCHEMY_DATABASE_URI']:
-    raise ValueError("DATABASE_URL is not set. Please set it in your environment variables.")
 
-# Disable modification tracking for performance
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+class PostForm(FlaskForm):
+    title = StringField('Title', validators=[DataRequired()])
+    body = TextAreaField('Body', validators=[DataRequired()])
+    submit = SubmitField('Submit')
 
-# Initialize SQLAlchemy and database migrations
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+# Eager-loading strategies, declared per view so that templates never trigger lazy loads.
+# Feed: one query for the page of posts and their authors, without the (large) body columns.
+FEED_LOAD_OPTIONS = (joinedload(Post.author), joinedload(Post.image), defer(Post.body, raiseload=True),
+                     defer(Post.body_html, raiseload=True))
+# Post page: the post and its author; comments are paged separately (see comments.comment_page).
+# Only the sanitised HTML is shown; the source is loaded if it has to be rendered again.
+POST_PAGE_LOAD_OPTIONS = (
+    joinedload(Post.author),
+    joinedload(Post.image),
+    defer(Post.body),
+)
+
+# Full-text search over posts (tsvector on PostgreSQL, in-process index elsewhere)
+post_search = PostSearch(db, Post)
+
+# Once an image's variants exist, pages showing it can emit srcset
+def image_ready(image, original_path):
+    if image.path != original_path:
+        # The original has just been published under its own hash, so point existing references at it
+        Post.query.filter_by(image_id=image.id).update(
+            {Post.image_url: image_pipeline.url(image.path)}, synchronize_session=False)
+        User.query.filter_by(profile_picture=original_path).update(
+            {User.profile_picture: image.path}, synchronize_session=False)
+        user_cache.clear()
+        response_cache.clear()
+    post_ids = [post_id for (post_id,) in db.session.query(Post.id).filter_by(image_id=image.id)]
+    touch_posts(*post_ids)
+    db.session.commit()
+    response_cache.invalidate("posts", *[f"post:{post_id}" for post_id in post_ids])
 
-import time
-from sqlalchemy.exc import OperationalError
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 
-# Retry function for database connection
-def connect_with_retry(db, retries=5, delay=2):
-    """
-    Attempts to connect to the database with retries.
+# Resize, strip and dedupe uploaded images off the request thread
+image_pipeline = ImagePipeline(db, Image, on_ready=image_ready)
+bp.add_app_template_global(srcset, 'srcset')
+bp.add_app_template_global(image_pipeline.url, 'upload_url')
 
-    Args:
-        db: The SQLAlchemy database instance.
-        retries: Number of retry attempts.
-        delay: Delay between retries (in seconds).
-    """
-    with app.app_context():  # Ensure we're inside the Flask app context
-        for attempt in range(retries):
-            try:
-                db.session.execute(text('SELECT 1'))  # Simple query to check DB readiness
-                print("Database connection successful.")
-                return
-            except OperationalError as e:
-                print(f"Database connection failed, retrying... ({attempt+1}/{retries})")
-                time.sleep(delay)  # Wait before retrying
-        raise Exception("Database connection failed after retries")
-
-# Call the function before proceeding
-connect_with_retry(db)
-
-# Define a simple test model
-class TestConnection(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(50))
-
-# Define User model
-class User(UserMixin, db.Model):
-    __tablename__ = "users"
-    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    email = db.Column(db.String(100), unique=True)
-    password = db.Column(db.String(100))
-    name = db.Column(db.String(100))
-    profile_picture = db.Column(db.String(200), nullable=True)
-    bio = db.Column(db.Text, nullable=True)
-    username = db.Column(db.String(100), unique=True, nullable=False) 
-    posts = relationship("Post", back_populates="author")
-    comments = relationship("Comment", back_populates="comment_author")
-
-# Define Post model
-class Post(db.Model):
-    __tablename__ = "posts"
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(100), nullable=False)
-    subtitle = db.Column(db.String(100), nullable=False)
-    body = db.Column(db.Text, nullable=False)
-    image_url = db.Column(db.String(200), nullable=True)
-    category = db.Column(db.String(50), nullable=False)
-    author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    author = relationship("User", back_populates="posts")
-    date = db.Column(db.String(100), nullable=False)
-
-    #***************Parent Relationship*************#
-    comments = relationship("Comment", back_populates="parent_post")
 
-class PostForm(FlaskForm):
-    title = StringField('Title', validators=[DataRequired()])
-    body = TextAreaField('Body', validators=[DataRequired()])
-    submit = SubmitField('Submit')
+# Uploads that are too large or not images are refused while the body is still being received
+@bp.app_errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    flash(f"That file is too large; uploads can be up to {current_app.config['UPLOAD_MAX_FILE_BYTES'] // (1024 * 1024)} MB.", 'danger')
+    return redirect(request.path)
+
+
+@bp.app_errorhandler(UnsupportedMediaType)
+def upload_not_an_image(e):
+    flash(e.description, 'danger')
+    return redirect(request.path)
+
+
+# Snapshots of signed-in users, so loading the session user doesn't cost a query per request
+user_cache = UserCache(model=User)
+
+
+# Password hashing runs on its own bounded pool instead of the request threads
+password_hasher = PasswordHasher()
+
+
+# Deliver contact-form email off the request thread
+email_queue = EmailQueue(db=db, model=OutboxEmail)
+
+
+# The "Most read" list on the homepage changes with the view counts; the view counter calls this at
+# most once per POPULAR_POSTS_TTL
+def view_counts_flushed():
+    response_cache.invalidate("popular")
+
+
+# Post view counts, buffered per worker and written in batches
+view_counter = ViewCounter(db=db, model=Post, on_flush=view_counts_flushed)
+
+# Atom feeds and sitemaps, streamed and cached by ETag
+feeds = FeedPublisher()
+
+
+# Export the other extensions' counters alongside the request metrics
+def collect_extension_stats():
+    yield from stats_samples("response_cache", response_cache.stats())
+    yield from stats_samples("user_cache", user_cache.stats())
+    yield from stats_samples("email", email_queue.stats())
+    yield from stats_samples("password_hashing", password_hasher.stats())
+    yield from stats_samples("views", view_counter.stats())
+    yield from stats_samples("feeds", feeds.stats())
+    for bind, pool in db_router.stats()["pools"].items():
+        yield from stats_samples("db_pool", pool, {"bind": bind})
+    yield from stats_samples("readiness", {"ready": readiness.status()["ready"]})
+    template_stats = templating.stats()
+    yield from stats_samples("templates", {key: value for key, value in template_stats.items() if key != "templates"})
+    for name, timings in template_stats["templates"].items():
+        yield from stats_samples("template", timings, {"template": name})
+
+
+instrumentation.add_collector(collect_extension_stats)
 
-# Define Comment model
-class Comment(db.Model):
-    __tablename__ = "comments"
-    id = db.Column(db.Integer, primary_key=True)
-    text = db.Column(db.Text, nullable=False)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
-    comment_author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    
-    # Relationships
-    parent_post = relationship("Post", back_populates="comments")
-    comment_author = relationship("User", back_populates="comments")
 
 # Restrict access to admin users only
 def admin_only(f):
@@ -157,26 +202,83 @@ def admin_only(f):
 # Load user session
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.load(user_id)
 
 
-# Homepage displaying all posts
-@app.route('/')
+# Validators for the feed: the newest change and number of posts behind the current filter, and the
+# category counts shown beside it. The "Most read" list is left out: it differs from worker to worker,
+# and may lag by POPULAR_POSTS_TTL anyway
+def feed_validators():
+    category = request.args.get('category')
+    query = db.session.query(db.func.max(Post.updated_at), db.func.count(Post.id))
+    if category:
+        query = query.filter(Post.category == category)
+    last_modified, count = query.one()
+    counts = sorted(category_counts().items())
+    args = [request.args.get(name, '') for name in ("category", "search", "cursor", "per_page")]
+    return make_etag("feed", last_modified, count, counts, *args), last_modified
+
+
+# Homepage displaying posts, newest first, one keyset page at a time
+@bp.route('/')
+@db_router.replica_reads
+@response_cache.cached(tags=("posts", "popular"), query_args=("category", "search", "cursor", "per_page"))
+@conditional(feed_validators, max_age=30)
 def get_all_posts():
     category = request.args.get('category')
     search = request.args.get('search')
-    if category:
-        posts = Post.query.filter_by(category=category).all()
-    elif search:
-        posts = Post.query.filter(Post.title.contains(search)).all()
-    else:
-        posts = Post.query.all()
+    cursor = request.args.get('cursor')
+    per_page = request.args.get('per_page', current_app.config['POSTS_PER_PAGE'], type=int)
+    per_page = max(1, min(per_page, current_app.config['MAX_POSTS_PER_PAGE']))
+
+    snippets = {}
+    try:
+        if search and not category:
+            # Ranked full-text search, paged by (rank, id)
+            page, snippets = post_search.search(search, cursor=cursor, per_page=per_page, options=FEED_LOAD_OPTIONS)
+        else:
+            query = Post.query.options(*FEED_LOAD_OPTIONS)
+            if category:
+                # Walks ix_posts_category_created_at_id
+                query = query.filter_by(category=category)
+            page = keyset_paginate(query, [Post.created_at, Post.id], key=lambda post: (post.created_at, post.id),
+                                   cursor=cursor, per_page=per_page)
+    except ValueError:
+        abort(400)
+
+    counts = category_counts()
+    categories = [(value, label, counts.get(value, 0)) for value, label in CATEGORY_CHOICES]
     csrf_token = generate_csrf()
-    return render_template("index.html", all_posts=posts, current_user=current_user, csrf_token=csrf_token, preload_image="img/bg4.jpeg")
+    return render_template("index.html", all_posts=page.items, page=page, category=category, search=search,
+                           snippets=snippets, popular_posts=view_counter.popular(5),
+                           categories=categories, total_posts=sum(counts.values()),
+                           current_user=current_user, csrf_token=csrf_token,
+                           preload_image="img/bg4.jpeg")
+
+
+# Atom feed of the newest posts, overall or in one category (/feed/world-news.xml)
+@bp.route('/feed.xml')
+@bp.route('/feed/<category>.xml')
+@db_router.replica_reads
+def feed(category=None):
+    return feeds.feed(category)
+
+
+# Sitemap, or an index of sitemap shards once there are more posts than fit in one
+@bp.route('/sitemap.xml')
+@db_router.replica_reads
+def sitemap():
+    return feeds.sitemap()
+
+
+@bp.route('/sitemap-<int:shard>.xml')
+@db_router.replica_reads
+def sitemap_shard(shard):
+    return feeds.sitemap_shard(shard)
 
 
 # User registration route
-@app.route('/register', methods=["GET", "POST"])
+@bp.route('/register', methods=["GET", "POST"])
 def register():
     form = RegisterForm()
     
@@ -188,19 +290,18 @@ def register():
         # Check if email already exists
         if User.query.filter_by(email=email).first():
             flash("Email already exists, please log in instead.", "warning")
-            return redirect(url_for('login'))
+            return redirect(url_for('blog.login'))
 
         # Check if username already exists
         if User.query.filter_by(username=username).first():
             flash("Username already taken, please choose another.", "warning")
-            return redirect(url_for('register'))
+            return redirect(url_for('blog.register'))
 
         # Validate form input
         if form.validate_on_submit():
+            # Hash the password (outside the try below, so a full hashing pool still answers 503)
+            p_word = password_hasher.hash(form.password.data)
             try:
-                # Hash the password
-                p_word = generate_password_hash(form.password.data, "pbkdf2:sha256", 8)
-
                 # Create new user
                 new_user = User(
                     username=username,
@@ -217,13 +318,14 @@ def register():
 
                 # Auto-login user
                 login_user(new_user)
+                user_cache.refresh(new_user)
                 flash("Registration successful! Welcome to Intelvibez!", "success")
-                return redirect(url_for("get_all_posts"))
+                return redirect(url_for("blog.get_all_posts"))
 
             except Exception as e:
                 db.session.rollback()
                 flash(f"An unexpected error occurred: {str(e)}", "danger")
-                return redirect(url_for('register'))
+                return redirect(url_for('blog.register'))
 
         else:
             flash("Invalid input. Please correct the errors and try again.", "danger")
@@ -232,30 +334,36 @@ def register():
 
 
 # User login route
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('get_all_posts'))
+        return redirect(url_for('blog.get_all_posts'))
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter(
             (User.username == form.username_or_email.data) | 
             (User.email == form.username_or_email.data)
         ).first()
-        if user and check_password_hash(user.password, form.password.data):
+        valid, new_hash = password_hasher.verify(user.password, form.password.data) if user else (False, None)
+        if valid:
+            if new_hash:
+                # Stored with an older scheme or cost; upgrade it now that we have the plain password
+                user.password = new_hash
+                db.session.commit()
             login_user(user)
+            user_cache.refresh(user)
             flash('Login successful!', 'success')
-            return redirect(url_for('get_all_posts'))
+            return redirect(url_for('blog.get_all_posts'))
         else:
             flash('Login unsuccessful. Please check username/email and password', 'danger')
     return render_template('login.html', form=form, preload_image="https://images.unsplash.com/photo-1484100356142-db6ab6244067?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=800&q=80")
 
 # User logout route
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('get_all_posts'))
+    return redirect(url_for('blog.get_all_posts'))
 
 
 # Generate Gravatar URL for user profile images based on email
@@ -265,49 +373,96 @@ def gravatar_url(email, size=200):
     return f"https://www.gravatar.com/avatar/{email_hash}?d=identicon&s={size}"
 
 
+# Validators for a post page, from its version counter alone
+def post_validators(post_id):
+    row = db.session.query(Post.version, Post.updated_at).filter_by(id=post_id).first()
+    if row is None:
+        return None
+    args = [request.args.get(name, '') for name in ("comments", "reply_to")]
+    return make_etag("post", post_id, row.version, *args), row.updated_at
+
+
+# Clean HTML stored before the sanitiser existed or under an older version of it, for this response
+# only: a GET may be reading the replica, so storing it is left to `flask render-html`. The sources
+# are loaded in one query per table; with nothing stale this is a couple of integer comparisons.
+def clean_stale_html(post, comments):
+    if is_stale(post.body_html, post.sanitizer_version):
+        body = db.session.query(Post.body).filter_by(id=post.id).scalar()
+        set_committed_value(post, "body_html", sanitize_post_html(body))
+    stale = [comment for comment in comments if is_stale(comment.text_html, comment.sanitizer_version)]
+    if stale:
+        texts = dict(db.session.query(Comment.id, Comment.text).filter(Comment.id.in_([c.id for c in stale])))
+        for comment in stale:
+            # set_committed_value leaves the row clean, so nothing is flushed back
+            set_committed_value(comment, "text_html", sanitize_comment_html(texts.get(comment.id)))
+
+
 # Display a specific blog post and allow users to comment
-@app.route("/post/<int:post_id>", methods=["GET", "POST"])
+@bp.route("/post/<int:post_id>", methods=["GET", "POST"])
+@db_router.replica_reads
+@view_counter.counted
+@response_cache.cached(tags=lambda post_id: (f"post:{post_id}",), query_args=("comments", "reply_to"))
+@conditional(post_validators, max_age=60)
 def show_post(post_id):
-    post = Post.query.get_or_404(post_id)
+    post = Post.query.options(*POST_PAGE_LOAD_OPTIONS).filter_by(id=post_id).first_or_404()
     form = CommentForm()
     if form.validate_on_submit():
         new_comment = Comment(
             text=form.text.data,
             post_id=post.id,
-            comment_author_id=current_user.id
+            comment_author_id=current_user.id,
+            parent_id=form.parent_id.data or None
         )
-        db.session.add(new_comment)
+        render_comment_text(new_comment)
+        try:
+            add_comment(new_comment)
+        except ValueError:
+            abort(400)
+        touch_posts(post.id)
         db.session.commit()
-        return redirect(url_for('show_post', post_id=post.id))
-    return render_template("post.html", post=post, form=form, current_user=current_user)
+        response_cache.invalidate(f"post:{post.id}", "posts")
+        return redirect(url_for('blog.show_post', post_id=post.id))
+
+    try:
+        comments = comment_page(post.id, cursor=request.args.get('comments'),
+                                per_page=current_app.config['COMMENTS_PER_PAGE'])
+    except ValueError:
+        abort(400)
+    reply_to = request.args.get('reply_to', type=int)
+    if reply_to:
+        form.parent_id.data = reply_to
+    clean_stale_html(post, [comment for node in comments for comment in node.walk()])
+    return render_template("post.html", post=post, form=form, comments=comments, reply_to=reply_to,
+                           max_comment_depth=MAX_DEPTH, current_user=current_user)
 
 # About page route
-@app.route("/about")
+@bp.route("/about")
+@response_cache.cached()
 def about():
     return render_template("about.html", current_user=current_user, preload_image="img/about-bg.jpg")
 
 
 # Contact page for sending emails (authenticated users only)
-@app.route("/contact", methods=["GET", "POST"])
+@bp.route("/contact", methods=["GET", "POST"])
 def contact():
     form = EmailForm()
     if form.validate_on_submit() and current_user.is_authenticated:
-        email_sender.send_email(
+        email_queue.enqueue(
             sender_email=form.email.data,
             sender_name=current_user.name,
             subject=f"Message from {current_user.name}",
             body=form.message.data
         )
         flash("Your message has been sent!")
-        return redirect(url_for("contact"))
+        return redirect(url_for("blog.contact"))
     elif not current_user.is_authenticated:
         flash("You need to login to send email!")
-        return redirect(url_for("login"))
+        return redirect(url_for("blog.login"))
     return render_template("contact.html", form=form, current_user=current_user, preload_image="img/contact-bg.jpg")
 
 
 # Route to create a new blog post
-@app.route("/new-post", methods=['GET', 'POST'])
+@bp.route("/new-post", methods=['GET', 'POST'])
 def add_new_post():
     form = CreatePostForm()
     if form.validate_on_submit():
@@ -316,74 +471,83 @@ def add_new_post():
             title=form.title.data,
             subtitle=form.subtitle.data,
             body=form.body.data,
-            author=current_user,
-            date=datetime.now().strftime("%B %d, %Y %H:%M:%S")
+            excerpt=make_excerpt(form.body.data),
+            author_id=current_user.id
         )
+        render_post_body(new_post)
         db.session.add(new_post)
+        count_post(new_post.category, 1)
         db.session.commit()
-        return redirect(url_for("get_all_posts"))
+        post_search.index_post(new_post)
+        response_cache.invalidate("posts")
+        return redirect(url_for("blog.get_all_posts"))
     return render_template("make-post.html", form=form, current_user=current_user, preload_image="img/edit-bg.jpg")
 
 # Route to create a post with an image upload
-@app.route('/create-post', methods=['GET', 'POST'])
+@bp.route('/create-post', methods=['GET', 'POST'])
 @login_required
 def create_post():
     form = CreatePostForm()
     if form.validate_on_submit():
-        image = form.image.data
-        if image:
-            filename = secure_filename(image.filename)
-            upload_folder = os.path.join(app.root_path, 'static/uploads')
-            if not os.path.exists(upload_folder):
-                os.makedirs(upload_folder)
-            image_path = os.path.join(upload_folder, filename)
-            image.save(image_path)
-            image_url = url_for('static', filename='uploads/' + filename)
-        else:
-            image_url = None
+        image = None
+        image_url = None
+        if form.image.data:
+            try:
+                image = image_pipeline.store(form.image.data)
+            except ValueError as e:
+                flash(str(e), 'danger')
+                return render_template('make-post.html', form=form, current_user=current_user)
+            image_url = image_pipeline.url(image.path)
 
         # Save the new post with the uploaded image
         new_post = Post(
             title=form.title.data,
             subtitle=form.subtitle.data,
             body=form.body.data,
+            excerpt=make_excerpt(form.body.data),
             image_url=image_url,
+            image=image,
             category=form.category.data,  # Save the category
-            author=current_user,
-            date=datetime.now().strftime("%B %d, %Y")
+            author_id=current_user.id
         )
+        render_post_body(new_post)
         db.session.add(new_post)
+        count_post(new_post.category, 1)
         db.session.commit()
-        print("Post created successfully")  # Debug statement
-        return redirect(url_for('get_all_posts'))
-    else:
-        print("Form validation failed")  # Debug statement
-        print(form.errors)  # Debug statement
+        post_search.index_post(new_post)
+        response_cache.invalidate("posts")
+        return redirect(url_for('blog.get_all_posts'))
     return render_template('make-post.html', form=form, current_user=current_user)
 
 # Route to edit an existing post
-@app.route("/edit-post/<int:post_id>", methods=['GET', 'POST'])
+@bp.route("/edit-post/<int:post_id>", methods=['GET', 'POST'])
 @login_required
 def edit_post(post_id):
     post = Post.query.get_or_404(post_id)
-    if post.author != current_user and current_user.id != 1:
+    if post.author_id != current_user.id and current_user.id != 1:
         abort(403)
     form = CreatePostForm()
     if form.validate_on_submit():
         post.title = form.title.data
         post.subtitle = form.subtitle.data
         post.body = form.body.data
+        post.excerpt = make_excerpt(post.body)
+        render_post_body(post)
+        move_post(post.category, form.category.data)
         post.category = form.category.data
         if form.image.data:
-            filename = secure_filename(form.image.data.filename)
-            upload_folder = os.path.join(app.root_path, 'static/uploads')
-            if not os.path.exists(upload_folder):
-                os.makedirs(upload_folder)
-            image_path = os.path.join(upload_folder, filename)
-            form.image.data.save(image_path)
-            post.image_url = url_for('static', filename='uploads/' + filename)
+            try:
+                image = image_pipeline.store(form.image.data)
+            except ValueError as e:
+                flash(str(e), 'danger')
+                return render_template('make-post.html', form=form, current_user=current_user, post=post)
+            post.image = image
+            post.image_url = image_pipeline.url(image.path)
+        touch_posts(post.id)
         db.session.commit()
-        return redirect(url_for('get_all_posts'))
+        post_search.index_post(post)
+        response_cache.invalidate("posts", f"post:{post.id}")
+        return redirect(url_for('blog.get_all_posts'))
     elif request.method == 'GET':
         form.title.data = post.title
         form.subtitle.data = post.subtitle
@@ -393,66 +557,82 @@ def edit_post(post_id):
 
 
 # Route to delete a post
-@app.route("/delete-post/<int:post_id>", methods=['POST'])
+@bp.route("/delete-post/<int:post_id>", methods=['POST'])
 @login_required
 def delete_post(post_id):
     post = Post.query.get_or_404(post_id)
-    if post.author != current_user and current_user.id != 1:
+    if post.author_id != current_user.id and current_user.id != 1:
         abort(403)
     db.session.delete(post)
+    count_post(post.category, -1)
     db.session.commit()
-    return redirect(url_for('get_all_posts'))
+    post_search.remove_post(post_id)
+    response_cache.invalidate("posts", f"post:{post_id}")
+    return redirect(url_for('blog.get_all_posts'))
 
 # Route to delete a comment
-@app.route("/delete-comment/<int:comment_id>", methods=["GET", "POST"])
+@bp.route("/delete-comment/<int:comment_id>", methods=["GET", "POST"])
 @login_required
 def delete_comment(comment_id):
-    comment_to_delete = Comment.query.get(comment_id)
-    db.session.delete(comment_to_delete)
+    comment_to_delete = Comment.query.get_or_404(comment_id)
+    post_id = comment_to_delete.post_id
+    # Replies to it go too, and the post's comment_count drops by however many were removed
+    delete_comment_tree(comment_to_delete)
+    touch_posts(post_id)
     db.session.commit()
-    return redirect(url_for('show_post', post_id=comment_to_delete.post_id))
+    response_cache.invalidate(f"post:{post_id}", "posts")
+    return redirect(url_for('blog.show_post', post_id=post_id))
 
 # Forgot password route
-@app.route('/forgot-password')
+@bp.route('/forgot-password')
 def forgot_password():
     return render_template('forgot_password.html')
 
 # User profile management
-@app.route('/profile', methods=['GET', 'POST'])
+@bp.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
     form = ProfileForm()
     profile_picture = None  # Initialize the variable
 
     if form.validate_on_submit():
+        # current_user is a cached read-only snapshot, so update the row itself
+        user = db.session.get(User, current_user.id)
+
         # Check for duplicate email
-        if current_user.email != form.email.data:  # Check only if the email is being changed
+        if user.email != form.email.data:  # Check only if the email is being changed
             existing_user = User.query.filter_by(email=form.email.data).first()
             if existing_user:
                 flash('This email is already in use by another account.', 'error')
-                return redirect(url_for('profile'))
+                return redirect(url_for('blog.profile'))
 
         # Update user details
-        current_user.name = form.name.data
-        current_user.email = form.email.data
-        current_user.bio = form.bio.data
+        user.name = form.name.data
+        user.email = form.email.data
+        user.bio = form.bio.data
         profile_picture = form.profile_picture.data
 
-        if profile_picture:
-            # Generate a unique filename to prevent overwriting
-            unique_filename = str(uuid.uuid4()) + "_" + secure_filename(profile_picture.filename)
-            upload_folder = os.path.join(app.root_path, 'static/uploads')
-            if not os.path.exists(upload_folder):
-                os.makedirs(upload_folder)
+        # Posts showing this user's name, as author or commenter, have changed too
+        commented_on = db.session.query(Comment.post_id).filter_by(comment_author_id=user.id)
+        authored = db.session.query(Post.id).filter_by(author_id=user.id)
+        touch_posts(*{post_id for (post_id,) in authored.union(commented_on)})
 
-            profile_picture_path = os.path.join(upload_folder, unique_filename)
-            profile_picture.save(profile_picture_path)
-            current_user.profile_picture = 'uploads/' + unique_filename
-            print(f"Profile picture saved at: {profile_picture_path}")  # Debug statement
+        if profile_picture:
+            # Stored under its content hash, so re-uploading the same picture reuses the file
+            try:
+                image = image_pipeline.store(profile_picture)
+            except ValueError as e:
+                db.session.rollback()
+                flash(str(e), 'error')
+                return redirect(url_for('blog.profile'))
+            user.profile_picture = image.path
 
         db.session.commit()
+        user_cache.refresh(user)
+        # The user's name and picture appear on posts, comments and their profile page
+        response_cache.clear()
         flash('Your profile has been updated!', 'success')
-        return redirect(url_for('get_all_posts'))
+        return redirect(url_for('blog.get_all_posts'))
 
     elif request.method == 'GET':
         # Pre-fill the form with existing user data
@@ -464,35 +644,181 @@ def profile():
 
 
 # View other users' profiles
-@app.route('/user/<int:user_id>')
+@bp.route('/user/<int:user_id>')
+@db_router.replica_reads
+@response_cache.cached(tags=lambda user_id: (f"user:{user_id}",))
 def user_profile(user_id):
     user = User.query.get_or_404(user_id)
     return render_template('user_profile.html', user=user, current_user=current_user)
 
-@app.route('/healthz')
+# Fill in the listing excerpt for posts created before the column existed
+@bp.cli.command("backfill-excerpts")
+@click.option("--batch-size", default=500, show_default=True, help="Posts loaded and committed per batch.")
+@click.option("--all", "refresh_all", is_flag=True, help="Recompute excerpts that are already set.")
+def backfill_excerpts(batch_size, refresh_all):
+    last_id = 0
+    updated = 0
+    while True:
+        query = db.session.query(Post.id, Post.body).filter(Post.id > last_id)
+        if not refresh_all:
+            query = query.filter(Post.excerpt.is_(None))
+        batch = query.order_by(Post.id).limit(batch_size).all()
+        if not batch:
+            break
+        db.session.execute(
+            db.update(Post),
+            [{"id": post_id, "excerpt": make_excerpt(body)} for post_id, body in batch]
+        )
+        db.session.commit()
+        last_id = batch[-1].id
+        updated += len(batch)
+        click.echo(f"Backfilled {updated} posts (last id {last_id})")
+    click.echo(f"Done, {updated} excerpts written.")
+
+# Sanitise post bodies and comments in bulk, e.g. right after a SANITIZER_VERSION bump, instead of
+# leaving it to the first view of each post
+@bp.cli.command("render-html")
+@click.option("--batch-size", default=500, show_default=True, help="Rows loaded and committed per batch.")
+@click.option("--all", "refresh_all", is_flag=True, help="Render rows that are already up to date too.")
+def render_html(batch_size, refresh_all):
+    for model, render in ((Post, render_post_body), (Comment, render_comment_text)):
+        last_id = 0
+        rendered = 0
+        while True:
+            query = model.query.filter(model.id > last_id)
+            if not refresh_all:
+                query = query.filter(db.or_(model.sanitizer_version.is_(None),
+                                            model.sanitizer_version != SANITIZER_VERSION))
+            batch = query.order_by(model.id).limit(batch_size).all()
+            if not batch:
+                break
+            for row in batch:
+                if refresh_all:
+                    row.sanitizer_version = None
+                render(row)
+            if model is Post:
+                touch_posts(*[post.id for post in batch])
+            else:
+                touch_posts(*{comment.post_id for comment in batch})
+            db.session.commit()
+            last_id = batch[-1].id
+            rendered += len(batch)
+            click.echo(f"Rendered {rendered} {model.__tablename__} (last id {last_id})")
+    response_cache.clear()
+    click.echo("Done.")
+
+
+# Rebuild the category counts from the posts table, e.g. after editing posts outside the app
+@bp.cli.command("recount-categories")
+def recount_categories_command():
+    counts = recount_categories()
+    db.session.commit()
+    response_cache.invalidate("posts")
+    for category, count in sorted(counts.items()):
+        click.echo(f"{category}: {count}")
+
+# Response cache hit/miss counters (admin only)
+@bp.route('/admin/cache-stats')
+@login_required
+@admin_only
+def cache_stats():
+    return jsonify(dict(response_cache.stats(), users=user_cache.stats()))
+
+# Email delivery counters (admin only)
+@bp.route('/admin/email-stats')
+@login_required
+@admin_only
+def email_stats():
+    return jsonify(email_queue.stats())
+
+# Connection pool metrics and replica routing counts (admin only)
+@bp.route('/admin/db-stats')
+@login_required
+@admin_only
+def db_stats():
+    return jsonify(db_router.stats())
+
+# Liveness: the process is up and serving requests, whatever the state of the database
+@bp.route('/healthz')
+@bp.route('/healthz/live')
 def health_check():
     return "OK", 200
 
-def connect_with_retry(db, retries=5, delay=2):
+# Readiness: the database answered the background probe recently, so send traffic here
+@bp.route('/healthz/ready')
+def readiness_check():
+    status = readiness.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
+def create_app(config=None):
     """
-    Attempts to connect to the database with retries.
-    
-    Args:
-        db: The SQLAlchemy database instance.
-        retries: Number of retry attempts.
-        delay: Delay between retries (in seconds).
+    Build and configure the application.
+
+    Nothing here waits on the network: the database is checked by a background probe (see
+    /healthz/ready), and thread pools and SMTP connections are only opened when first used.
     """
-    for attempt in range(retries):
-        try:
-            db.session.execute('SELECT 1')  # Simple query to check DB readiness
-            print("Database connection successful.")
-            return
-        except OperationalError as e:
-            print(f"Database connection failed, retrying... ({attempt+1}/{retries})")
-            time.sleep(delay)  # Wait before retrying
-    raise Exception("Database connection failed after retries")
+    # Load environment variables
+    load_dotenv()
+
+    # Initialize Flask app
+    app = Flask(__name__, static_folder='static')
+    # Stream uploaded files straight to disk, hashing and checking them as they arrive (see uploads.py)
+    app.request_class = UploadRequest
+    app.config['SECRET_KEY'] = os.getenv('SECRETKEY')
+
+    # Use PostgreSQL if DATABASE_URL is set, otherwise raise an error
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
+    # Disable modification tracking for performance
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Feed paging: default and maximum number of posts per page
+    app.config['POSTS_PER_PAGE'] = int(os.getenv('POSTS_PER_PAGE', 10))
+    app.config['MAX_POSTS_PER_PAGE'] = int(os.getenv('MAX_POSTS_PER_PAGE', 50))
+    # Top-level comments per page on a post (their replies come with them)
+    app.config['COMMENTS_PER_PAGE'] = int(os.getenv('COMMENTS_PER_PAGE', 20))
+
+    if config:
+        app.config.update(config)
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        raise ValueError("DATABASE_URL is not set. Please set it in your environment variables.")
+
+    # Initialize SQLAlchemy and database migrations (pool and replica settings first)
+    db_router.init_app(app)
+    db.init_app(app)
+    migrate.init_app(app, db)
+    bootstrap.init_app(app)
+    login_manager.init_app(app)
+    csrf.init_app(app)
+    assets.init_app(app)
+    templating.init_app(app)
+    response_cache.init_app(app)
+    image_pipeline.init_app(app)
+    user_cache.init_app(app)
+    password_hasher.init_app(app)
+    # Deliver contact-form email off the request thread; workers start with the first message, or
+    # below when this process serves the site
+    email_queue.init_app(app)
+    atexit.register(app.extensions['email_queue'].stop)
+    view_counter.init_app(app)
+    # Write out buffered view counts on shutdown
+    atexit.register(app.extensions['view_counter'].stop)
+    feeds.init_app(app)
+    readiness.init_app(app)
+    # Last, so that it instruments every engine created above
+    instrumentation.init_app(app)
+
+    app.register_blueprint(bp)
+    # flask blog export / flask blog import
+    app.cli.add_command(blog_cli)
+
+    app.extensions['readiness'].start()
+    if app.config['EMAIL_QUEUE_AUTOSTART']:
+        # Delivers whatever the outbox still holds from before a restart, without waiting for new mail
+        app.extensions['email_queue'].start()
+    return app
+
 
 # Run the app
 if __name__ == "__main__":
-    with app.app_context():
-        app.run(debug=True, extra_files=["templates/", "static/"])
\ No newline at end of file
+    create_app({"EMAIL_QUEUE_AUTOSTART": True}).run(debug=True, extra_files=["templates/", "static/"])
@@ -0,0 +1,252 @@
+# metrics.py
+import hmac
+import os
+import re
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from extensions import AppExtension, per_app
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Every exported metric name starts with this
+PREFIX = "blog_"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class Histogram:
+    """Fixed-bucket histogram, one per label set, rendered in Prometheus' cumulative format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels tuple -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def samples(self, name, label_names):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        for labels, values in sorted(series.items()):
+            base = dict(zip(label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values[:-1]):
+                cumulative += count
+                yield f"{name}_bucket", dict(base, le=str(bound)), cumulative
+            yield f"{name}_sum", base, round(values[-1], 6)
+            yield f"{name}_count", base, cumulative
+
+
+class Counter:
+    def __init__(self):
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def samples(self, name, label_names):
+        with self._lock:
+            series = dict(self.series)
+        for labels, value in sorted(series.items()):
+            yield name, dict(zip(label_names, labels)), round(value, 6)
+
+
+def stats_samples(name, stats, labels=None):
+    """Turn an extension's stats() dict into (name, labels, value) samples, keeping only numbers."""
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            yield f"{name}_{key}", labels or {}, value
+        elif isinstance(value, dict):
+            yield from stats_samples(f"{name}_{key}", value, labels)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Instrumentation(AppExtension):
+    """
+    Request and query metrics, cheap enough to leave on in production.
+
+    SQLAlchemy cursor events count queries and database time for the current request, which are sent
+    back in a Server-Timing header and aggregated per endpoint. Queries slower than SLOW_QUERY_SECONDS
+    are logged with their parameters left out. Everything is served in Prometheus text format at
+    /metrics, together with the stats of any collectors registered with add_collector(). Scrapes must
+    present METRICS_TOKEN as a bearer token; without one configured, /metrics answers 404.
+    """
+
+    extension_name = "instrumentation"
+    shared_args = ("db",)
+
+    def __init__(self, app=None, db=None):
+        self.db = db
+        self.enabled = True
+        self.slow_query_seconds = 0.25
+        self.server_timing = True
+        self.token = None
+        self.request_duration = Histogram()
+        self.query_duration = Histogram()
+        self.requests = Counter()
+        self.queries = Counter()
+        self.db_seconds = Counter()
+        self.slow_queries = Counter()
+        self._collectors = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not app:
+            # Configure an instance of its own for this app (see extensions.AppExtension)
+            return self.bind(app).init_app(app)
+        app.config.setdefault('METRICS_ENABLED', os.getenv('METRICS_ENABLED', '1') == '1')
+        app.config.setdefault('SLOW_QUERY_SECONDS', float(os.getenv('SLOW_QUERY_SECONDS', 0.25)))
+        app.config.setdefault('SERVER_TIMING', os.getenv('SERVER_TIMING', '1') == '1')
+        app.config.setdefault('METRICS_TOKEN', os.getenv('METRICS_TOKEN'))
+        self.enabled = app.config['METRICS_ENABLED']
+        self.slow_query_seconds = app.config['SLOW_QUERY_SECONDS']
+        self.server_timing = app.config['SERVER_TIMING']
+        self.token = app.config['METRICS_TOKEN']
+        app.extensions['instrumentation'] = self
+        if not self.enabled:
+            return
+
+        # Call after db.init_app(), which creates the engines
+        with app.app_context():
+            for engine in self.db.engines.values():
+                if not event.contains(engine, "before_cursor_execute", self._before_cursor_execute):
+                    event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+                    event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def bind(self, app):
+        ext = super().bind(app)
+        # Collectors are registered once, at import, for every app
+        ext._collectors = self._collectors
+        return ext
+
+    def add_collector(self, collect):
+        """Register a callable returning (name, labels, value) samples to export on each scrape."""
+        self._collectors.append(collect)
+
+    # Query side
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        endpoint = None
+        if has_request_context():
+            g._db_queries = g.get("_db_queries", 0) + 1
+            g._db_seconds = g.get("_db_seconds", 0.0) + elapsed
+            endpoint = request.endpoint or "unmatched"
+        self.query_duration.observe(elapsed)
+        if elapsed >= self.slow_query_seconds:
+            self.slow_queries.inc()
+            self._log_slow_query(statement, parameters, elapsed, endpoint)
+
+    @staticmethod
+    def _log_slow_query(statement, parameters, elapsed, endpoint):
+        # Only the SQL text with its placeholders; bound values (emails, password hashes...) never get logged
+        sql = _WHITESPACE_RE.sub(" ", statement).strip()
+        if len(sql) > 1000:
+            sql = sql[:1000] + "..."
+        if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (dict, list, tuple)):
+            redacted = f"{len(parameters)} parameter sets redacted"
+        else:
+            redacted = f"{len(parameters or ())} parameters redacted"
+        print(f"Slow query ({elapsed * 1000:.1f} ms) in {endpoint or 'background task'}: {sql} [{redacted}]")
+
+    # Request side
+
+    def _start_request(self):
+        g._request_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.get("_request_started")
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or "unmatched"
+        queries = g.get("_db_queries", 0)
+        db_seconds = g.get("_db_seconds", 0.0)
+        self.request_duration.observe(elapsed, (endpoint, request.method))
+        self.requests.inc((endpoint, request.method, str(response.status_code)))
+        if queries:
+            self.queries.inc((endpoint,), queries)
+            self.db_seconds.inc((endpoint,), db_seconds)
+        if self.server_timing:
+            response.headers.add(
+                "Server-Timing",
+                f'db;dur={db_seconds * 1000:.2f};desc="{queries} queries", app;dur={elapsed * 1000:.2f}',
+            )
+        return response
+
+    # Exposition
+
+    def metrics_view(self):
+        # Endpoint names, traffic and pool sizes aren't for the public, so no token means no endpoint
+        if not self.token:
+            return "Not Found", 404
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {self.token}"):
+            return "Unauthorized", 401, {"WWW-Authenticate": "Bearer"}
+        return self.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    def render(self):
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{PREFIX}{sample_name}{_format_labels(labels)} {value}")
+
+        family("request_duration_seconds", "histogram", "Time spent handling requests, by endpoint.",
+               self.request_duration.samples("request_duration_seconds", ("endpoint", "method")))
+        family("requests_total", "counter", "Requests handled, by endpoint and status.",
+               self.requests.samples("requests_total", ("endpoint", "method", "status")))
+        family("db_queries_total", "counter", "SQL statements executed while handling requests, by endpoint.",
+               self.queries.samples("db_queries_total", ("endpoint",)))
+        family("db_seconds_total", "counter", "Time spent in SQL statements while handling requests, by endpoint.",
+               self.db_seconds.samples("db_seconds_total", ("endpoint",)))
+        family("db_query_duration_seconds", "histogram", "Duration of every SQL statement, including background work.",
+               self.query_duration.samples("db_query_duration_seconds", ()))
+        family("db_slow_queries_total", "counter", "SQL statements slower than SLOW_QUERY_SECONDS.",
+               self.slow_queries.samples("db_slow_queries_total", ()))
+
+        for collect in self._collectors:
+            samples = sorted(collect(), key=lambda sample: sample[0])
+            for name in sorted({sample[0] for sample in samples}):
+                lines.append(f"# TYPE {PREFIX}{name} untyped")
+                for sample_name, labels, value in samples:
+                    if sample_name == name:
+                        lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
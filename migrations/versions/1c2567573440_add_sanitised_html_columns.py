@@ -0,0 +1,41 @@
+"""Add sanitised HTML columns to posts and comments
+
+Revision ID: 1c2567573440
+Revises: 745039ace5ea
+Create Date: 2026-10-18 21:12:04.508313
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c2567573440'
+down_revision = '745039ace5ea'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Left empty here; rows are rendered when first shown, or all at once with `flask render-html`
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('body_html', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('body_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('sanitizer_version', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('text_html', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('text_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('sanitizer_version', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_column('sanitizer_version')
+        batch_op.drop_column('text_hash')
+        batch_op.drop_column('text_html')
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('sanitizer_version')
+        batch_op.drop_column('body_hash')
+        batch_op.drop_column('body_html')
@@ -0,0 +1,27 @@
+"""Add excerpt column to posts table
+
+Revision ID: 43f2c7493a1b
+Revises: 2fb2ab079ae5
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '43f2c7493a1b'
+down_revision = '2fb2ab079ae5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows are filled in afterwards with `flask backfill-excerpts`
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('excerpt', sa.String(length=300), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('excerpt')
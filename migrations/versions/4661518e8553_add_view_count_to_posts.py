@@ -0,0 +1,28 @@
+"""Add posts.view_count
+
+Revision ID: 4661518e8553
+Revises: 87e466a94b4c
+Create Date: 2026-10-18 22:05:17.840266
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4661518e8553'
+down_revision = '87e466a94b4c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('view_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index(batch_op.f('ix_posts_view_count'), ['view_count'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_posts_view_count'))
+        batch_op.drop_column('view_count')
@@ -0,0 +1,86 @@
+"""Add created_at timestamp column to posts table
+
+Revision ID: 4938d6cb26f9
+Revises: 78583ad64f6a
+Create Date: 2026-10-18 13:41:05.302771
+
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4938d6cb26f9'
+down_revision = '78583ad64f6a'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# Formats written to posts.date by add_new_post and create_post respectively
+LEGACY_DATE_FORMATS = ("%B %d, %Y %H:%M:%S", "%B %d, %Y")
+
+# Used for rows whose date string can't be parsed, so they sort after everything else
+FALLBACK_DATE = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+posts = sa.table(
+    'posts',
+    sa.column('id', sa.Integer),
+    sa.column('date', sa.String),
+    sa.column('created_at', sa.DateTime(timezone=True)),
+)
+
+
+def parse_legacy_date(value):
+    for fmt in LEGACY_DATE_FORMATS:
+        try:
+            return datetime.strptime((value or '').strip(), fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    return FALLBACK_DATE
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(timezone=True), nullable=True))
+
+    # Backfill from the legacy display strings, one batch of ids at a time
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(posts.c.id, posts.c.date)
+            .where(posts.c.id > last_id)
+            .order_by(posts.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        conn.execute(
+            posts.update().where(posts.c.id == sa.bindparam('post_id')).values(created_at=sa.bindparam('parsed')),
+            [{'post_id': row.id, 'parsed': parse_legacy_date(row.date)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(timezone=True), nullable=False)
+        # The display string is now derived from created_at at render time
+        batch_op.alter_column('date', existing_type=sa.String(length=100), nullable=True)
+        batch_op.create_index('ix_posts_created_at_id', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    # Posts written after the upgrade have no display string; rebuild it from created_at
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(posts.c.id, posts.c.created_at).where(posts.c.date.is_(None))).fetchall()
+    if rows:
+        conn.execute(
+            posts.update().where(posts.c.id == sa.bindparam('post_id')).values(date=sa.bindparam('display')),
+            [{'post_id': row.id, 'display': row.created_at.strftime(LEGACY_DATE_FORMATS[0])} for row in rows]
+        )
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_created_at_id')
+        batch_op.alter_column('date', existing_type=sa.String(length=100), nullable=False)
+        batch_op.drop_column('created_at')
@@ -0,0 +1,42 @@
+"""Add images table and posts.image_id
+
+Revision ID: 745039ace5ea
+Revises: f6ef251e22c1
+Create Date: 2026-10-18 18:47:30.215561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '745039ace5ea'
+down_revision = 'f6ef251e22c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('images',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('path', sa.String(length=200), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('height', sa.Integer(), nullable=False),
+    sa.Column('variants', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('sha256')
+    )
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_posts_image_id_images', 'images', ['image_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_posts_image_id_images', type_='foreignkey')
+        batch_op.drop_column('image_id')
+
+    op.drop_table('images')
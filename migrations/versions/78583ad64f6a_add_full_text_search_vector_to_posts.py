@@ -0,0 +1,42 @@
+"""Add full-text search vector to posts table
+
+Revision ID: 78583ad64f6a
+Revises: 43f2c7493a1b
+Create Date: 2026-10-18 11:03:27.540913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '78583ad64f6a'
+down_revision = '43f2c7493a1b'
+branch_labels = None
+depends_on = None
+
+
+# Must match SEARCH_VECTOR_SQL in search.py
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(subtitle, '')), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(body, '')), 'C')"
+)
+
+
+def upgrade():
+    # Only PostgreSQL has tsvector; other databases use the in-process index in search.py
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(
+        "ALTER TABLE posts ADD COLUMN search_vector tsvector "
+        f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+    )
+    op.create_index('ix_posts_search_vector', 'posts', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_posts_search_vector', table_name='posts')
+    op.drop_column('posts', 'search_vector')
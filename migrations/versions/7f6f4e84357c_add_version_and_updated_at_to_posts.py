@@ -0,0 +1,35 @@
+"""Add version and updated_at columns to posts table
+
+Revision ID: 7f6f4e84357c
+Revises: 4938d6cb26f9
+Create Date: 2026-10-18 15:26:51.874032
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f6f4e84357c'
+down_revision = '4938d6cb26f9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True))
+
+    op.execute("UPDATE posts SET updated_at = created_at")
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(timezone=True), nullable=False)
+        batch_op.create_index('ix_posts_updated_at', ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_updated_at')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('version')
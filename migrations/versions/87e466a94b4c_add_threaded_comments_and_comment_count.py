@@ -0,0 +1,44 @@
+"""Add comments.parent_id and posts.comment_count
+
+Revision ID: 87e466a94b4c
+Revises: 1c2567573440
+Create Date: 2026-10-18 21:40:51.377019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '87e466a94b4c'
+down_revision = '1c2567573440'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('parent_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_comments_parent_id_comments', 'comments', ['parent_id'], ['id'])
+        batch_op.create_index('ix_comments_post_id_parent_id_id', ['post_id', 'parent_id', 'id'], unique=False)
+        batch_op.create_index('ix_comments_parent_id', ['parent_id'], unique=False)
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Existing comments are all top-level, so each post's count is simply its number of comments
+    op.execute(
+        "UPDATE posts SET comment_count = "
+        "(SELECT COUNT(*) FROM comments WHERE comments.post_id = posts.id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('comment_count')
+
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_index('ix_comments_parent_id')
+        batch_op.drop_index('ix_comments_post_id_parent_id_id')
+        batch_op.drop_constraint('fk_comments_parent_id_comments', type_='foreignkey')
+        batch_op.drop_column('parent_id')
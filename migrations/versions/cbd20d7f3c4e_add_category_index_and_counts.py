@@ -0,0 +1,39 @@
+"""Add the posts (category, created_at, id) index and the category_counts table
+
+Revision ID: cbd20d7f3c4e
+Revises: 4661518e8553
+Create Date: 2026-10-18 22:31:42.518903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cbd20d7f3c4e'
+down_revision = '4661518e8553'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_category_created_at_id', ['category', 'created_at', 'id'], unique=False)
+
+    op.create_table('category_counts',
+    sa.Column('category', sa.String(length=50), nullable=False),
+    sa.Column('post_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('category')
+    )
+
+    op.execute(
+        "INSERT INTO category_counts (category, post_count) "
+        "SELECT category, COUNT(*) FROM posts WHERE category IS NOT NULL GROUP BY category"
+    )
+
+
+def downgrade():
+    op.drop_table('category_counts')
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_category_created_at_id')
@@ -0,0 +1,146 @@
+# models.py
+from datetime import datetime, timezone
+
+from flask_login import UserMixin
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import relationship
+
+from database import RoutingSession
+
+# Bound to the app in create_app() (see main.py); the session class can send reads to a replica
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Define a simple test model
+class TestConnection(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50))
+
+# Define User model
+class User(UserMixin, db.Model):
+    __tablename__ = "users"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    email = db.Column(db.String(100), unique=True)
+    password = db.Column(db.String(100))
+    name = db.Column(db.String(100))
+    profile_picture = db.Column(db.String(200), nullable=True)
+    bio = db.Column(db.Text, nullable=True)
+    username = db.Column(db.String(100), unique=True, nullable=False) 
+    posts = relationship("Post", back_populates="author")
+    comments = relationship("Comment", back_populates="comment_author")
+
+# Define Post model
+class Post(db.Model):
+    __tablename__ = "posts"
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(100), nullable=False)
+    subtitle = db.Column(db.String(100), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    # Plain-text preview shown on the feed, precomputed whenever the body is written
+    excerpt = db.Column(db.String(300), nullable=True)
+    # Sanitised copy of body served on the post page (see content.render_post_body), the hash of the
+    # body it was made from, and the sanitiser version that made it
+    body_html = db.Column(db.Text, nullable=True)
+    body_hash = db.Column(db.String(64), nullable=True)
+    sanitizer_version = db.Column(db.Integer, nullable=True)
+    image_url = db.Column(db.String(200), nullable=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('images.id'), nullable=True)
+    image = relationship("Image")
+    category = db.Column(db.String(50), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    author = relationship("User", back_populates="posts")
+    # Legacy display string; new posts leave it empty and templates format created_at instead
+    date = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    # Bumped (see touch_posts) whenever anything shown on the post page changes; used for ETags
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True,
+                           default=lambda: datetime.now(timezone.utc))
+    # Number of comments and replies, kept in step by comments.add_comment/delete_comment
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Page views, added in batches by views.ViewCounter
+    view_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+
+    __table_args__ = (
+        # Serves the newest-first feed ordering and its keyset pagination
+        db.Index('ix_posts_created_at_id', 'created_at', 'id'),
+        # The same within one category, for the homepage's category filter
+        db.Index('ix_posts_category_created_at_id', 'category', 'created_at', 'id'),
+    )
+
+    #***************Parent Relationship*************#
+    comments = relationship("Comment", back_populates="parent_post")
+
+# Number of posts in each category, kept in step by categories.count_post so the homepage's
+# category menu never has to count the posts table
+class CategoryCount(db.Model):
+    __tablename__ = "category_counts"
+    category = db.Column(db.String(50), primary_key=True)
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+# An uploaded image, stored once per distinct content, with its responsive variants
+class Image(db.Model):
+    __tablename__ = "images"
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    # Path of the stored original relative to static/, e.g. "uploads/<sha256>.jpg"
+    path = db.Column(db.String(200), nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    # JSON list of {"width", "path", "type"} written by ImagePipeline.process
+    variants = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+# Define Comment model
+class Comment(db.Model):
+    __tablename__ = "comments"
+    id = db.Column(db.Integer, primary_key=True)
+    text = db.Column(db.Text, nullable=False)
+    # Sanitised copy of text, as for Post.body_html
+    text_html = db.Column(db.Text, nullable=True)
+    text_hash = db.Column(db.String(64), nullable=True)
+    sanitizer_version = db.Column(db.Integer, nullable=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
+    comment_author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # The comment this one replies to; None for a top-level comment
+    parent_id = db.Column(db.Integer, db.ForeignKey('comments.id'), nullable=True)
+
+    __table_args__ = (
+        # Serves a post's top-level comments newest first, and looking up the replies to a comment
+        db.Index('ix_comments_post_id_parent_id_id', 'post_id', 'parent_id', 'id'),
+        db.Index('ix_comments_parent_id', 'parent_id'),
+    )
+
+    # Relationships
+    parent_post = relationship("Post", back_populates="comments")
+    # A comment is never shown without its author, so always fetch it in the same query
+    comment_author = relationship("User", back_populates="comments", lazy="joined", innerjoin=True)
+
+
+# Mark posts as changed so that their ETag and Last-Modified validators move on
+def touch_posts(*post_ids):
+    if not post_ids:
+        return
+    db.session.execute(
+        db.update(Post)
+        .where(Post.id.in_(post_ids))
+        .values(version=Post.version + 1, updated_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+
+
+# Outgoing email waiting for (or done with) delivery by the background EmailQueue
+class OutboxEmail(db.Model):
+    __tablename__ = "email_outbox"
+    id = db.Column(db.Integer, primary_key=True)
+    sender_email = db.Column(db.String(100), nullable=False)
+    sender_name = db.Column(db.String(100), nullable=True)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    body_html = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default="pending", index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    next_attempt_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    sent_at = db.Column(db.DateTime(timezone=True), nullable=True)
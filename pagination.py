@@ -0,0 +1,108 @@
+# pagination.py
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import tuple_
+
+
+class KeysetPage:
+    """A single page of results together with the cursors for its neighbours."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, per_page=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, Decimal):
+        # As a string, so the exact value survives JSON
+        return {"dec": str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    if isinstance(value, dict) and "dec" in value:
+        return Decimal(value["dec"])
+    return value
+
+
+def encode_cursor(values, direction="next"):
+    """Pack the sort key of a boundary row into an opaque, URL-safe token."""
+    payload = json.dumps({"d": direction, "k": [_encode_value(v) for v in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Unpack a token produced by encode_cursor. Raises ValueError on garbage input."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        direction = payload["d"]
+        values = [_decode_value(v) for v in payload["k"]]
+    except (ValueError, TypeError, KeyError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if direction not in ("next", "prev") or not values:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return values, direction
+
+
+def keyset_paginate(query, columns, key, cursor=None, per_page=10):
+    """
+    Paginate a query newest-first using keyset (seek) pagination instead of OFFSET.
+
+    Args:
+        query: The SQLAlchemy query to paginate.
+        columns: Column expressions making up a unique sort key, most significant first.
+            Rows are returned in descending order of this key.
+        key: Callable returning the sort key values of a result row.
+        cursor: Token from a previous page's next_cursor/prev_cursor, or None for the first page.
+        per_page: Number of rows per page.
+    """
+    sort_key = tuple_(*columns)
+    if cursor:
+        values, direction = decode_cursor(cursor)
+        if len(values) != len(columns):
+            raise ValueError(f"Invalid cursor: {cursor!r}")
+        boundary = tuple_(*values)
+    else:
+        direction = "next"
+        boundary = None
+
+    if direction == "next":
+        if boundary is not None:
+            query = query.filter(sort_key < boundary)
+        rows = query.order_by(*[c.desc() for c in columns]).limit(per_page + 1).all()
+        more = len(rows) > per_page
+        items = rows[:per_page]
+        next_cursor = encode_cursor(key(items[-1]), "next") if more else None
+        prev_cursor = encode_cursor(key(items[0]), "prev") if boundary is not None and items else None
+    else:
+        rows = query.filter(sort_key > boundary).order_by(*[c.asc() for c in columns]).limit(per_page + 1).all()
+        more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        prev_cursor = encode_cursor(key(items[0]), "prev") if more else None
+        next_cursor = encode_cursor(key(items[-1]), "next") if items else None
+
+    return KeysetPage(items, next_cursor=next_cursor, prev_cursor=prev_cursor, per_page=per_page)
@@ -0,0 +1,165 @@
+# passwords.py
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import os
+import threading
+import time
+
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from extensions import AppExtension, per_app
+
+try:
+    import bcrypt  # installed with Flask-Bcrypt; only needed for the bcrypt scheme
+except ImportError:
+    bcrypt = None
+
+SCHEMES = ("pbkdf2", "bcrypt")
+
+# Salt length for pbkdf2 hashes; users.password is String(100), which leaves room for 8 characters
+PBKDF2_SALT_LENGTH = 8
+
+
+class HashingBusy(ServiceUnavailable):
+    """Raised (and answered with a 503) when too many password hashes are already queued."""
+
+    description = "The server is busy signing other people in. Please try again in a moment."
+
+
+class PasswordHasher(AppExtension):
+    """
+    Hashes and checks passwords on a small dedicated thread pool.
+
+    Key stretching is deliberately slow, so running it on the request threads lets a burst of logins
+    hold up every other page. Here at most PASSWORD_WORKERS hashes run at once, up to
+    PASSWORD_QUEUE_SIZE more wait their turn, and anything beyond that is turned away immediately with
+    a 503 rather than piling up. Stored hashes made with an older policy are upgraded on the next
+    successful login.
+    """
+
+    extension_name = "password_hasher"
+
+    def __init__(self, app=None):
+        self.scheme = "pbkdf2"
+        self.pbkdf2_iterations = DEFAULT_PBKDF2_ITERATIONS
+        self.bcrypt_rounds = 12
+        self.timeout = 30
+        self.retry_after = 1
+        self.executor = None
+        self.metrics = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0, "seconds_total": 0.0}
+        self._metrics_lock = threading.Lock()
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not app:
+            # Configure an instance of its own for this app (see extensions.AppExtension)
+            return self.bind(app).init_app(app)
+        app.config.setdefault('PASSWORD_SCHEME', os.getenv('PASSWORD_SCHEME', 'pbkdf2'))
+        app.config.setdefault('PASSWORD_PBKDF2_ITERATIONS', int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', DEFAULT_PBKDF2_ITERATIONS)))
+        app.config.setdefault('PASSWORD_BCRYPT_ROUNDS', int(os.getenv('PASSWORD_BCRYPT_ROUNDS', 12)))
+        app.config.setdefault('PASSWORD_WORKERS', int(os.getenv('PASSWORD_WORKERS', 2)))
+        app.config.setdefault('PASSWORD_QUEUE_SIZE', int(os.getenv('PASSWORD_QUEUE_SIZE', 16)))
+        app.config.setdefault('PASSWORD_TIMEOUT', float(os.getenv('PASSWORD_TIMEOUT', 30)))
+        self.scheme = app.config['PASSWORD_SCHEME']
+        if self.scheme not in SCHEMES:
+            raise ValueError(f"PASSWORD_SCHEME must be one of {', '.join(SCHEMES)}, not {self.scheme!r}")
+        if self.scheme == "bcrypt" and bcrypt is None:
+            raise ValueError("PASSWORD_SCHEME=bcrypt needs the bcrypt package (pip install Flask-Bcrypt)")
+        self.pbkdf2_iterations = app.config['PASSWORD_PBKDF2_ITERATIONS']
+        self.bcrypt_rounds = app.config['PASSWORD_BCRYPT_ROUNDS']
+        self.timeout = app.config['PASSWORD_TIMEOUT']
+        workers = app.config['PASSWORD_WORKERS']
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        # Running plus waiting jobs; a full pool means the request is shed instead of queued
+        self._slots = threading.BoundedSemaphore(workers + app.config['PASSWORD_QUEUE_SIZE'])
+        app.extensions['password_hasher'] = self
+
+    # Request side
+
+    @per_app
+    def hash(self, password):
+        """Hash a new password with the current policy. Raises HashingBusy when the pool is full."""
+        return self._run("hashed", self._hash, password)
+
+    @per_app
+    def verify(self, stored_hash, password):
+        """
+        Check a password against its stored hash.
+
+        Returns (valid, new_hash): new_hash is a replacement made with the current policy when the
+        password was right but the stored hash used an older scheme or cost, otherwise None.
+        Raises HashingBusy when the pool is full.
+        """
+        return self._run("verified", self._verify, stored_hash, password)
+
+    def _run(self, metric, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise HashingBusy(retry_after=self.retry_after)
+        started = time.monotonic()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._count("rejected")
+            raise HashingBusy(retry_after=self.retry_after)
+        self._count(metric)
+        self._count("seconds_total", time.monotonic() - started)
+        return result
+
+    # Worker side
+
+    def _hash(self, password):
+        if self.scheme == "bcrypt":
+            return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.bcrypt_rounds)).decode("ascii")
+        return generate_password_hash(password, f"pbkdf2:sha256:{self.pbkdf2_iterations}", PBKDF2_SALT_LENGTH)
+
+    def _verify(self, stored_hash, password):
+        if not stored_hash:
+            return False, None
+        if stored_hash.startswith("$2"):
+            if bcrypt is None:
+                return False, None
+            valid = bcrypt.checkpw(password.encode("utf-8"), stored_hash.encode("ascii"))
+        else:
+            valid = check_password_hash(stored_hash, password)
+        if valid and self.needs_rehash(stored_hash):
+            self._count("rehashed")
+            return True, self._hash(password)
+        return valid, None
+
+    @per_app
+    def needs_rehash(self, stored_hash):
+        """True if the hash was made with a different scheme or cost than the current policy."""
+        if stored_hash.startswith("$2"):
+            # $2b$<rounds>$<salt and checksum>
+            return self.scheme != "bcrypt" or int(stored_hash.split("$")[2]) != self.bcrypt_rounds
+        if self.scheme != "pbkdf2":
+            return True
+        # pbkdf2:sha256:<iterations>$<salt>$<hash>; werkzeug's old default had no explicit iteration count
+        method = stored_hash.split("$", 1)[0].split(":")
+        if method[:2] != ["pbkdf2", "sha256"]:
+            return True
+        return len(method) < 3 or int(method[2]) != self.pbkdf2_iterations
+
+    # Reporting
+
+    def _count(self, name, amount=1):
+        with self._metrics_lock:
+            self.metrics[name] += amount
+
+    @per_app
+    def stats(self):
+        with self._metrics_lock:
+            stats = dict(self.metrics)
+        done = stats["hashed"] + stats["verified"]
+        stats["seconds_avg"] = round(stats["seconds_total"] / done, 4) if done else None
+        stats["scheme"] = self.scheme
+        return stats
@@ -0,0 +1,279 @@
+# search.py
+from collections import defaultdict
+from markupsafe import escape, Markup
+import math
+import re
+import threading
+
+from sqlalchemy import DDL, Numeric, cast, event, func, literal_column, tuple_
+
+from content import html_to_text
+from pagination import KeysetPage, decode_cursor, encode_cursor
+
+# Text search configuration used for both the stored vector and incoming queries
+SEARCH_CONFIG = "english"
+
+# Weighted document: title matches rank above subtitle matches, which rank above body matches
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(subtitle, '')), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(body, '')), 'C')"
+)
+
+# Markers ts_headline wraps around matches; swapped for <mark> after the snippet is escaped
+_START_SEL = "⟦"
+_STOP_SEL = "⟧"
+HEADLINE_OPTIONS = f"StartSel={_START_SEL}, StopSel={_STOP_SEL}, MaxFragments=2, MinWords=8, MaxWords=25"
+
+# Decimal places search ranks are rounded to, so a rank read back from a cursor compares equal to the
+# one the database sorts by
+RANK_DIGITS = 6
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were "
+    "will with".split()
+)
+
+
+def tokenize(text):
+    """Lower-case word tokens of a piece of text, minus common stop words."""
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in _STOP_WORDS]
+
+
+def _highlight(text, terms):
+    """Escape text and wrap every whole-word occurrence of terms in <mark>."""
+    if not terms:
+        return escape(text)
+    pattern = re.compile(r"\b(" + "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)) + r")\b",
+                         re.IGNORECASE)
+    parts = []
+    last = 0
+    for match in pattern.finditer(text):
+        parts.append(escape(text[last:match.start()]))
+        parts.append(Markup("<mark>%s</mark>") % match.group(0))
+        last = match.end()
+    parts.append(escape(text[last:]))
+    return Markup("").join(parts)
+
+
+def _headline_to_html(headline):
+    """Turn a ts_headline result into safe HTML with <mark> around the matches."""
+    escaped = str(escape(headline or ""))
+    return Markup(escaped.replace(_START_SEL, "<mark>").replace(_STOP_SEL, "</mark>"))
+
+
+class InvertedIndex:
+    """
+    Small in-process inverted index over posts, used when the database has no full-text search (SQLite).
+
+    Postings map each token to {post_id: weighted term frequency}; scores are tf-idf summed over the
+    query terms, and only documents containing every query term match.
+    """
+
+    FIELD_WEIGHTS = {"title": 3.0, "subtitle": 2.0, "body": 1.0}
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._doc_tokens = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_tokens)
+
+    def add(self, doc_id, title, subtitle, body_html):
+        weights = defaultdict(float)
+        for field, text in (("title", title), ("subtitle", subtitle), ("body", html_to_text(body_html))):
+            for token in tokenize(text):
+                weights[token] += self.FIELD_WEIGHTS[field]
+        with self._lock:
+            self._remove_locked(doc_id)
+            for token, weight in weights.items():
+                self._postings[token][doc_id] = weight
+            self._doc_tokens[doc_id] = tuple(weights)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id):
+        for token in self._doc_tokens.pop(doc_id, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[token]
+
+    def search(self, query_text):
+        """Return [(score, doc_id), ...] for documents matching every query term, best first."""
+        terms = set(tokenize(query_text))
+        if not terms:
+            return []
+        with self._lock:
+            total = len(self._doc_tokens) or 1
+            postings = [self._postings.get(term, {}) for term in terms]
+            if not all(postings):
+                return []
+            postings.sort(key=len)
+            matches = set(postings[0]).intersection(*postings[1:])
+            scores = []
+            for doc_id in matches:
+                score = 0.0
+                for term_postings in postings:
+                    idf = math.log(1 + total / len(term_postings))
+                    score += (1 + math.log(term_postings[doc_id])) * idf
+                scores.append((round(score, RANK_DIGITS), doc_id))
+        scores.sort(reverse=True)
+        return scores
+
+
+class PostSearch:
+    """
+    Ranked, paginated full-text search over posts.
+
+    On PostgreSQL this queries a stored, GIN-indexed tsvector column (posts.search_vector); anywhere
+    else it falls back to an InvertedIndex kept in process memory.
+    """
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+        self.index = InvertedIndex()
+        self._index_built = False
+        self._build_lock = threading.Lock()
+        self._install_ddl(model.__table__)
+
+    def _install_ddl(self, table):
+        # Keep tables created through db.create_all() in line with the Alembic migration
+        event.listen(table, "after_create", DDL(
+            f"ALTER TABLE {table.name} ADD COLUMN search_vector tsvector "
+            f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+        ).execute_if(dialect="postgresql"))
+        event.listen(table, "after_create", DDL(
+            f"CREATE INDEX ix_{table.name}_search_vector ON {table.name} USING gin (search_vector)"
+        ).execute_if(dialect="postgresql"))
+
+    @property
+    def uses_database(self):
+        return self.db.engine.dialect.name == "postgresql"
+
+    # Index maintenance (no-ops on PostgreSQL, where the generated column keeps itself up to date)
+
+    def index_post(self, post):
+        if self._index_built and not self.uses_database:
+            self.index.add(post.id, post.title, post.subtitle, post.body)
+
+    def remove_post(self, post_id):
+        if self._index_built and not self.uses_database:
+            self.index.remove(post_id)
+
+    def _ensure_index(self):
+        if self._index_built:
+            return
+        with self._build_lock:
+            if self._index_built:
+                return
+            Post = self.model
+            rows = self.db.session.query(Post.id, Post.title, Post.subtitle, Post.body).execution_options(
+                yield_per=500)
+            for row in rows:
+                self.index.add(row.id, row.title, row.subtitle, row.body)
+            self._index_built = True
+
+    # Querying
+
+    def search(self, text, cursor=None, per_page=10, options=()):
+        """
+        Search posts for text, best match first.
+
+        Returns (page, snippets): a KeysetPage of Post objects and a dict mapping post id to a
+        highlighted HTML snippet. Raises ValueError for an invalid cursor.
+        """
+        if self.uses_database:
+            return self._search_postgres(text, cursor, per_page, options)
+        return self._search_fallback(text, cursor, per_page, options)
+
+    def _search_postgres(self, text, cursor, per_page, options):
+        Post = self.model
+        vector = literal_column(f"{Post.__tablename__}.search_vector")
+        ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, text)
+        # ts_rank_cd() is a float4, which doesn't survive the trip through a cursor exactly; sort and
+        # compare by the rank rounded to a numeric instead (decoded from the cursor as a Decimal)
+        rank = cast(func.round(cast(func.ts_rank_cd(vector, ts_query), Numeric), RANK_DIGITS), Numeric).label("rank")
+        plain_body = func.regexp_replace(Post.body, "<[^>]*>", " ", "g")
+        snippet = func.ts_headline(SEARCH_CONFIG, plain_body, ts_query, HEADLINE_OPTIONS).label("snippet")
+
+        query = self.db.session.query(Post, rank, snippet).options(*options).filter(vector.op("@@")(ts_query))
+        sort_key = tuple_(rank, Post.id)
+        direction = "next"
+        if cursor:
+            values, direction = decode_cursor(cursor)
+            if len(values) != 2:
+                raise ValueError(f"Invalid cursor: {cursor!r}")
+            query = query.filter(sort_key < tuple_(*values) if direction == "next" else sort_key > tuple_(*values))
+        order = (rank.desc(), Post.id.desc()) if direction == "next" else (rank.asc(), Post.id.asc())
+        rows = query.order_by(*order).limit(per_page + 1).all()
+
+        page = self._page_from_ranked([(row.rank, row.Post) for row in rows], cursor, direction, per_page)
+        snippets = {row.Post.id: _headline_to_html(row.snippet) for row in rows}
+        return page, snippets
+
+    def _search_fallback(self, text, cursor, per_page, options):
+        Post = self.model
+        self._ensure_index()
+        ranked = self.index.search(text)
+        direction = "next"
+        if cursor:
+            values, direction = decode_cursor(cursor)
+            if len(values) != 2:
+                raise ValueError(f"Invalid cursor: {cursor!r}")
+            boundary = tuple(values)
+            if direction == "next":
+                ranked = [r for r in ranked if r < boundary]
+            else:
+                ranked = [r for r in reversed(ranked) if r > boundary]
+        window = ranked[:per_page + 1]
+
+        ids = [doc_id for _, doc_id in window]
+        posts = {post.id: post for post in Post.query.options(*options).filter(Post.id.in_(ids))} if ids else {}
+        page = self._page_from_ranked([(score, posts[doc_id]) for score, doc_id in window if doc_id in posts],
+                                      cursor, direction, per_page)
+
+        terms = set(tokenize(text))
+        page_ids = [post.id for post in page.items]
+        bodies = dict(self.db.session.query(Post.id, Post.body).filter(Post.id.in_(page_ids))) if page_ids else {}
+        snippets = {post_id: self._snippet(html_to_text(body), terms) for post_id, body in bodies.items()}
+        return page, snippets
+
+    @staticmethod
+    def _page_from_ranked(ranked, cursor, direction, per_page):
+        """Build a KeysetPage from (rank, post) pairs fetched in the cursor's direction."""
+        more = len(ranked) > per_page
+        ranked = ranked[:per_page]
+        if direction == "prev":
+            ranked.reverse()
+        items = [post for _, post in ranked]
+        keys = [(score, post.id) for score, post in ranked]
+        if direction == "next":
+            next_cursor = encode_cursor(keys[-1], "next") if more else None
+            prev_cursor = encode_cursor(keys[0], "prev") if cursor and keys else None
+        else:
+            prev_cursor = encode_cursor(keys[0], "prev") if more else None
+            next_cursor = encode_cursor(keys[-1], "next") if keys else None
+        return KeysetPage(items, next_cursor=next_cursor, prev_cursor=prev_cursor, per_page=per_page)
+
+    @staticmethod
+    def _snippet(text, terms, words=25):
+        """A window of text around the first matching term, with matches highlighted."""
+        tokens = text.split()
+        start = 0
+        for i, word in enumerate(tokens):
+            if any(t in terms for t in tokenize(word)):
+                start = max(0, i - words // 3)
+                break
+        fragment = " ".join(tokens[start:start + words])
+        if start > 0:
+            fragment = "… " + fragment
+        if start + words < len(tokens):
+            fragment += " …"
+        return _highlight(fragment, terms)
@@ -0,0 +1,134 @@
+# storage.py
+import errno
+import mimetypes
+import os
+import shutil
+import tempfile
+
+from flask import current_app
+
+try:
+    import boto3  # optional: only needed for UPLOAD_STORAGE=s3
+except ImportError:
+    boto3 = None
+
+# Stored uploads are named after their content hash, so they can be cached forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class LocalStorage:
+    """
+    Uploaded files kept under the static folder and served by the static view.
+
+    Keys are paths relative to static/, e.g. "uploads/<sha256>.jpg". save() moves a finished temp
+    file into place with an atomic rename, so readers never see a partial file.
+    """
+
+    def __init__(self, static_folder, temp_dir):
+        self.static_folder = static_folder
+        self.temp_dir = temp_dir
+        self._dirs = set()
+
+    def path(self, key):
+        return os.path.join(self.static_folder, key)
+
+    def save(self, source_path, key):
+        """Move source_path (a temp file in temp_dir) to key, replacing whatever was there."""
+        target = self.path(key)
+        directory = os.path.dirname(target)
+        if directory not in self._dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._dirs.add(directory)
+        try:
+            os.replace(source_path, target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # temp_dir is on another filesystem: copy next to the target first, so the rename stays atomic
+            fd, staging = tempfile.mkstemp(dir=directory, prefix=".upload-")
+            with os.fdopen(fd, "wb") as out, open(source_path, "rb") as source:
+                shutil.copyfileobj(source, out)
+            os.replace(staging, target)
+            os.remove(source_path)
+
+    def open(self, key):
+        return open(self.path(key), "rb")
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key):
+        # No request needed, so background workers can build URLs too
+        return f"{current_app.static_url_path}/{key}"
+
+
+class S3Storage:
+    """
+    Uploaded files kept in an S3-compatible bucket and served from UPLOAD_S3_PUBLIC_URL.
+
+    endpoint_url points it at any S3-compatible server, e.g. a local MinIO (`minio server /data`)
+    standing in for S3 in development. Temp files still go to temp_dir while uploads are received
+    and processed; save() uploads them and removes the local copy.
+    """
+
+    def __init__(self, bucket, temp_dir, public_url, endpoint_url=None, client=None):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("UPLOAD_STORAGE=s3 requires the boto3 package.")
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.temp_dir = temp_dir
+        self.public_url = public_url.rstrip("/")
+
+    def save(self, source_path, key):
+        content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+        self.client.upload_file(source_path, self.bucket, key,
+                                ExtraArgs={"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL})
+        os.remove(source_path)
+
+    def open(self, key):
+        f = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, dir=self.temp_dir)
+        self.client.download_fileobj(self.bucket, key, f)
+        f.seek(0)
+        return f
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except self.client.exceptions.ClientError:
+            return False
+        return True
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def url(self, key):
+        return f"{self.public_url}/{key}"
+
+
+def make_storage(app):
+    """The storage backend selected by UPLOAD_STORAGE ("local" or "s3")."""
+    temp_dir = app.config['UPLOAD_TEMP_FOLDER']
+    os.makedirs(temp_dir, exist_ok=True)
+    backend = app.config['UPLOAD_STORAGE']
+    if backend == "local":
+        return LocalStorage(os.path.dirname(app.config['UPLOAD_FOLDER']), temp_dir)
+    if backend == "s3":
+        return S3Storage(app.config['UPLOAD_S3_BUCKET'], temp_dir, app.config['UPLOAD_S3_PUBLIC_URL'],
+                         endpoint_url=app.config['UPLOAD_S3_ENDPOINT_URL'])
+    raise ValueError(f"Unknown UPLOAD_STORAGE {backend!r}; use 'local' or 's3'.")
+
+
+def copy_to_temp(fileobj, temp_dir, chunk_size=64 * 1024):
+    """Copy a readable file object to a new temp file in temp_dir and return its path."""
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir, prefix=".upload-")
+    with os.fdopen(fd, "wb") as out:
+        shutil.copyfileobj(fileobj, out, chunk_size)
+    return temp_path
@@ -0,0 +1,198 @@
+# templating.py
+import os
+import shutil
+import threading
+import time
+
+import click
+from flask import current_app, g, template_rendered, before_render_template
+from flask.cli import AppGroup
+from jinja2 import BaseLoader, FileSystemBytecodeCache, TemplateSyntaxError
+
+from extensions import AppExtension, per_app
+
+templates_cli = AppGroup("templates", help="Precompile Jinja templates into the bytecode cache.")
+
+
+class TemplateTimings:
+    """Per-template load/compile and render counters."""
+
+    def __init__(self):
+        self.templates = {}
+        self.bytecode_hits = 0
+        self.bytecode_misses = 0
+        self._lock = threading.Lock()
+
+    def _entry(self, name):
+        entry = self.templates.get(name)
+        if entry is None:
+            entry = self.templates[name] = {
+                "loads": 0, "compiles": 0, "compile_seconds": 0.0, "load_seconds": 0.0,
+                "renders": 0, "render_seconds": 0.0, "render_seconds_max": 0.0,
+            }
+        return entry
+
+    def observe_load(self, name, seconds, compile_seconds=None):
+        with self._lock:
+            entry = self._entry(name)
+            entry["loads"] += 1
+            entry["load_seconds"] += seconds
+            if compile_seconds is None:
+                self.bytecode_hits += 1
+            else:
+                self.bytecode_misses += 1
+                entry["compiles"] += 1
+                entry["compile_seconds"] += compile_seconds
+
+    def observe_render(self, name, seconds):
+        with self._lock:
+            entry = self._entry(name)
+            entry["renders"] += 1
+            entry["render_seconds"] += seconds
+            entry["render_seconds_max"] = max(entry["render_seconds_max"], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {key: round(value, 6) if isinstance(value, float) else value
+                           for key, value in entry.items()}
+                    for name, entry in sorted(self.templates.items())}
+
+
+class TimedLoader(BaseLoader):
+    """Wraps Flask's template loader to time loading and compiling each template."""
+
+    def __init__(self, loader, timings):
+        self.loader = loader
+        self.timings = timings
+
+    def get_source(self, environment, template):
+        return self.loader.get_source(environment, template)
+
+    def list_templates(self):
+        return self.loader.list_templates()
+
+    def load(self, environment, name, globals=None):
+        # Same steps as BaseLoader.load, with the compile step timed on its own
+        started = time.perf_counter()
+        source, filename, uptodate = self.get_source(environment, name)
+        bcc = environment.bytecode_cache
+        bucket = code = compile_seconds = None
+        if bcc is not None:
+            bucket = bcc.get_bucket(environment, name, filename, source)
+            code = bucket.code
+        if code is None:
+            compile_started = time.perf_counter()
+            code = environment.compile(source, name, filename)
+            compile_seconds = time.perf_counter() - compile_started
+            if bucket is not None:
+                bucket.code = code
+                bcc.set_bucket(bucket)
+        template = environment.template_class.from_code(environment, code, globals or {}, uptodate)
+        self.timings.observe_load(name, time.perf_counter() - started, compile_seconds)
+        return template
+
+
+class TemplateCompiler(AppExtension):
+    """
+    Production template mode: compiled templates are kept in a bytecode cache on disk, so a fresh
+    worker unpickles them instead of parsing and compiling every template on its first requests.
+
+    `flask templates compile` fills the cache at deploy time. Entries are keyed by the template's
+    absolute path and checked against its source, so an edited template is simply recompiled. With
+    TEMPLATES_AUTO_RELOAD off (the default outside debug mode) Jinja also stops checking template
+    files for changes once they are loaded. Load, compile and render times are kept per template.
+    """
+
+    extension_name = "templating"
+
+    def __init__(self, app=None):
+        self.timings = TemplateTimings()
+        self.cache_dir = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not app:
+            # Configure an instance of its own for this app (see extensions.AppExtension)
+            return self.bind(app).init_app(app)
+        app.config.setdefault('TEMPLATE_CACHE_DIR', os.getenv('TEMPLATE_CACHE_DIR',
+                                                              os.path.join(app.root_path, '.jinja_cache')))
+        app.config.setdefault('TEMPLATE_BYTECODE_CACHE', os.getenv('TEMPLATE_BYTECODE_CACHE', '1') == '1')
+        # Flask's own setting; None (its default) means "only in debug mode"
+        if app.config.get('TEMPLATES_AUTO_RELOAD') is None and os.getenv('TEMPLATES_AUTO_RELOAD'):
+            app.config['TEMPLATES_AUTO_RELOAD'] = os.getenv('TEMPLATES_AUTO_RELOAD') == '1'
+
+        env = app.jinja_env
+        if app.config.get('TEMPLATES_AUTO_RELOAD') is not None:
+            # The environment may already exist (other extensions touch it), so apply it directly
+            env.auto_reload = app.config['TEMPLATES_AUTO_RELOAD']
+        if app.config['TEMPLATE_BYTECODE_CACHE']:
+            self.cache_dir = app.config['TEMPLATE_CACHE_DIR']
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                env.bytecode_cache = FileSystemBytecodeCache(self.cache_dir)
+            except OSError as e:
+                print(f"Template bytecode cache disabled, {self.cache_dir} is not writable: {e}")
+                self.cache_dir = None
+        env.loader = TimedLoader(env.loader, self.timings)
+
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.cli.add_command(templates_cli)
+        app.extensions['templating'] = self
+
+    def _before_render(self, sender, template, context, **extra):
+        g.setdefault("_template_render_started", {})[template.name] = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        started = g.get("_template_render_started", {}).pop(template.name, None)
+        if started is not None:
+            self.timings.observe_render(template.name, time.perf_counter() - started)
+
+    def compile_all(self, app):
+        """Load every template the app can find, filling the bytecode cache. Returns {name: seconds or error}."""
+        env = app.jinja_env
+        results = {}
+        for name in env.list_templates():
+            started = time.perf_counter()
+            try:
+                env.get_template(name)
+            except TemplateSyntaxError as e:
+                # e.g. a library template written for an older Jinja; it fails at render time too
+                results[name] = e
+            else:
+                results[name] = time.perf_counter() - started
+        return results
+
+    @per_app
+    def stats(self):
+        return {"bytecode_cache": self.cache_dir is not None, "bytecode_hits": self.timings.bytecode_hits,
+                "bytecode_misses": self.timings.bytecode_misses, "templates": self.timings.snapshot()}
+
+
+@templates_cli.command("compile")
+def compile_command():
+    """Compile every template into the bytecode cache."""
+    compiler = current_app.extensions['templating']
+    if compiler.cache_dir is None:
+        raise click.ClickException("The template bytecode cache is disabled (TEMPLATE_BYTECODE_CACHE=0).")
+    results = compiler.compile_all(current_app)
+    total = 0.0
+    for name, result in sorted(results.items()):
+        if isinstance(result, Exception):
+            click.echo(f"  {name}: skipped ({result})")
+        else:
+            total += result
+            click.echo(f"  {name}: {result * 1000:.1f} ms")
+    compiled = sum(not isinstance(result, Exception) for result in results.values())
+    click.echo(f"Compiled {compiled} templates in {total * 1000:.0f} ms into {compiler.cache_dir}")
+
+
+@templates_cli.command("clear")
+def clear_command():
+    """Empty the bytecode cache."""
+    compiler = current_app.extensions['templating']
+    if compiler.cache_dir is not None:
+        shutil.rmtree(compiler.cache_dir, ignore_errors=True)
+        os.makedirs(compiler.cache_dir, exist_ok=True)
+    click.echo("Cleared the template bytecode cache")
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    """The app on a fresh SQLite file, with tables created and the page caches off."""
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'blog.db'}")
+    monkeypatch.setenv("SECRETKEY", "test")
+    from main import create_app
+    from models import db
+
+    app = create_app({
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        # Every request has to reach the database, rather than be answered from a cache
+        "RESPONSE_CACHE_ENABLED": False,
+        "POPULAR_POSTS_TTL": 0,
+        "UPLOAD_FOLDER": str(tmp_path / "uploads"),
+        "SLOW_QUERY_SECONDS": float("inf"),
+    })
+    with app.app_context():
+        # Only the primary's tables: db keeps the bind keys of every app built so far (see test_replicas)
+        db.create_all(bind_key=None)
+    yield app
@@ -0,0 +1,234 @@
+"""The outbox-backed email queue: delivery, retries, claiming and surviving database errors."""
+import threading
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+
+class FakeSender:
+    """Stands in for EmailSender, recording deliveries and failing the first `failures` attempts."""
+
+    class Pool:
+        connections_opened = 0
+
+        def close(self):
+            pass
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.delivered = []
+        self.attempts = 0
+        self.pool = self.Pool()
+        self._lock = threading.Lock()
+
+    def deliver(self, sender_email, subject, body, body_html=None):
+        with self._lock:
+            self.attempts += 1
+            if self.attempts <= self.failures:
+                raise ConnectionRefusedError("SMTP server unavailable")
+            self.delivered.append(subject)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture
+def make_queue(app):
+    from email_sender import EmailQueue
+    from models import db, OutboxEmail
+
+    queues = []
+
+    def make_queue(sender, **config):
+        app.config.update({"EMAIL_RETRY_BACKOFF": 0.05, "EMAIL_RECOVER_INTERVAL": 0.1, **config})
+        queue = EmailQueue(sender=sender, db=db, model=OutboxEmail)
+        queue.init_app(app)
+        queue = app.extensions['email_queue']
+        queues.append(queue)
+        return queue
+
+    yield make_queue
+    for queue in queues:
+        queue.stop()
+
+
+def enqueue(app, queue, count):
+    with app.app_context():
+        return [queue.enqueue("reader@example.com", "Reader", f"Message {i}", "Hello") for i in range(count)]
+
+
+def statuses(app):
+    from models import OutboxEmail
+
+    with app.app_context():
+        return sorted(status for (status,) in OutboxEmail.query.with_entities(OutboxEmail.status))
+
+
+def test_database_errors_do_not_kill_the_workers(app, make_queue, monkeypatch):
+    queue = make_queue(FakeSender(), EMAIL_WORKERS=2)
+    claim = queue._claim
+    failures = {"left": 4}
+
+    def flaky_claim(message_id):
+        if failures["left"] > 0:
+            failures["left"] -= 1
+            raise OperationalError("UPDATE email_outbox ...", {}, Exception("database is locked"))
+        return claim(message_id)
+
+    monkeypatch.setattr(queue, "_claim", flaky_claim)
+    enqueue(app, queue, 2)
+
+    assert wait_for(lambda: len(queue.sender.delivered) == 2)
+    assert all(thread.is_alive() for thread in queue._threads)
+    assert wait_for(lambda: statuses(app) == ["sent", "sent"])
+
+
+def test_failed_deliveries_are_retried_with_backoff(app, make_queue):
+    from models import OutboxEmail
+
+    queue = make_queue(FakeSender(failures=2), EMAIL_WORKERS=1)
+    [message_id] = enqueue(app, queue, 1)
+
+    assert wait_for(lambda: statuses(app) == ["sent"])
+    with app.app_context():
+        message = OutboxEmail.query.filter_by(id=message_id).one()
+        assert message.attempts == 3 and message.last_error == "SMTP server unavailable"
+    assert queue.sender.delivered == ["Message 0"]
+    assert queue.stats()["retried"] == 2
+
+
+def test_messages_are_given_up_after_max_attempts(app, make_queue):
+    queue = make_queue(FakeSender(failures=10), EMAIL_MAX_ATTEMPTS=2)
+    enqueue(app, queue, 1)
+
+    assert wait_for(lambda: statuses(app) == ["failed"])
+    assert queue.sender.attempts == 2 and queue.sender.delivered == []
+
+
+
+def store(app, subject, **fields):
+    """Put a message straight into the outbox, as another process would have left it."""
+    from models import db, OutboxEmail
+
+    with app.app_context():
+        message = OutboxEmail(sender_email="reader@example.com", sender_name="Reader", subject=subject,
+                              body="Hello", **fields)
+        db.session.add(message)
+        db.session.commit()
+        return message.id
+
+
+def test_a_claimed_message_is_not_claimed_again(app, make_queue):
+    from models import db, OutboxEmail
+
+    queue = make_queue(FakeSender())
+    message_id = store(app, "Hi")
+    with app.app_context():
+        assert queue._claim(message_id)
+        assert not queue._claim(message_id)
+        assert db.session.query(OutboxEmail.status).filter_by(id=message_id).scalar() == "sending"
+
+
+def test_claims_left_by_a_dead_process_are_released(app, make_queue):
+    from datetime import datetime, timedelta, timezone
+
+    expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+    store(app, "Stuck", status="sending", next_attempt_at=expired)
+    queue = make_queue(FakeSender())
+    queue.start()
+
+    assert wait_for(lambda: statuses(app) == ["sent"])
+    assert queue.sender.delivered == ["Stuck"]
+
+
+def test_two_processes_deliver_each_message_once(app, make_queue):
+    from main import create_app
+
+    sender = FakeSender()
+    first = make_queue(sender, EMAIL_WORKERS=2)
+    # A second app on the same database file stands in for another worker process
+    other = create_app({"TESTING": True, "EMAIL_RETRY_BACKOFF": 0.05, "EMAIL_RECOVER_INTERVAL": 0.05})
+    second = other.extensions['email_queue']
+    second.sender = sender
+    second.start()
+    try:
+        enqueue(app, first, 20)
+        assert wait_for(lambda: statuses(app) == ["sent"] * 20)
+    finally:
+        second.stop()
+    assert sorted(sender.delivered) == sorted(f"Message {i}" for i in range(20))
+
+
+@pytest.fixture
+def smtp_sender(monkeypatch):
+    """An EmailSender pointed at a local SMTP server; returns (sender, start_server)."""
+    pytest.importorskip("aiosmtpd")
+    import socket
+    from aiosmtpd.controller import Controller
+    from email_sender import EmailSender
+
+    class Inbox:
+        def __init__(self):
+            self.messages = []
+
+        async def handle_DATA(self, server, session, envelope):
+            self.messages.append(envelope)
+            return "250 Message accepted for delivery"
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setenv("EMAIL_USER", "owner@example.com")
+    monkeypatch.setenv("SMTP_SERVER", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(port))
+    monkeypatch.setenv("SMTP_STARTTLS", "0")
+    monkeypatch.delenv("EMAIL_PASS", raising=False)
+    controllers = []
+
+    def start_server():
+        inbox = Inbox()
+        controller = Controller(inbox, hostname="127.0.0.1", port=port)
+        controller.start()
+        controllers.append(controller)
+        return inbox
+
+    yield EmailSender(), start_server
+    for controller in controllers:
+        controller.stop()
+
+
+def test_delivers_over_pooled_smtp_connections(app, make_queue, smtp_sender):
+    sender, start_server = smtp_sender
+    inbox = start_server()
+    queue = make_queue(sender, EMAIL_WORKERS=1)
+    enqueue(app, queue, 3)
+
+    assert wait_for(lambda: statuses(app) == ["sent"] * 3)
+    assert sorted(envelope.mail_from for envelope in inbox.messages) == ["reader@example.com"] * 3
+    assert all(envelope.rcpt_tos == ["owner@example.com"] for envelope in inbox.messages)
+    assert b"Subject: Message 0" in inbox.messages[0].original_content
+    assert queue.stats()["smtp_connections_opened"] == 1
+
+
+def test_mail_waits_in_the_outbox_until_the_smtp_server_is_up(app, make_queue, smtp_sender):
+    from models import OutboxEmail
+
+    sender, start_server = smtp_sender
+    # Enough attempts to outlast starting the server
+    queue = make_queue(sender, EMAIL_WORKERS=1, EMAIL_MAX_ATTEMPTS=20)
+    [message_id] = enqueue(app, queue, 1)
+
+    assert wait_for(lambda: queue.stats()["retried"] >= 1)
+    assert wait_for(lambda: statuses(app) == ["pending"])
+    inbox = start_server()
+    assert wait_for(lambda: statuses(app) == ["sent"])
+    assert len(inbox.messages) == 1
+    with app.app_context():
+        assert OutboxEmail.query.filter_by(id=message_id).one().attempts >= 2
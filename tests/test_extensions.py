@@ -0,0 +1,52 @@
+"""Each app built by create_app() gets its own extension state; building another leaves it alone."""
+from test_email_queue import FakeSender, wait_for
+
+
+def make_app(monkeypatch, tmp_path, name, **config):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / name}.db")
+    monkeypatch.setenv("SECRETKEY", "test")
+    from main import create_app
+    from models import db
+
+    app = create_app(dict({"TESTING": True, "UPLOAD_FOLDER": str(tmp_path / name)}, **config))
+    with app.app_context():
+        db.create_all(bind_key=None)
+    return app
+
+
+def test_a_second_app_does_not_change_the_first(monkeypatch, tmp_path):
+    import main
+
+    first = make_app(monkeypatch, tmp_path, "first", RESPONSE_CACHE_ENABLED=True)
+    second = make_app(monkeypatch, tmp_path, "second", RESPONSE_CACHE_ENABLED=False)
+
+    assert first.extensions['response_cache'] is not second.extensions['response_cache']
+    assert first.extensions['response_cache'].enabled
+    assert not second.extensions['response_cache'].enabled
+    with first.app_context():
+        assert main.response_cache.stats()["enabled"]
+    with second.app_context():
+        assert not main.response_cache.stats()["enabled"]
+
+    client = first.test_client()
+    client.get('/about')
+    assert client.get('/about').headers['X-Cache'] == 'HIT'
+
+
+def test_mail_is_delivered_by_the_app_it_was_enqueued_on(monkeypatch, tmp_path):
+    import main
+    from models import db, OutboxEmail
+
+    make_app(monkeypatch, tmp_path, "first")
+    second = make_app(monkeypatch, tmp_path, "second", EMAIL_RETRY_BACKOFF=0.05)
+    queue = second.extensions['email_queue']
+    queue.sender = FakeSender()
+    try:
+        with second.app_context():
+            message_id = main.email_queue.enqueue("reader@example.com", "Reader", "Hello", "Hi")
+        assert wait_for(lambda: queue.sender.delivered == ["Hello"])
+        with second.app_context():
+            status = db.session.query(OutboxEmail.status).filter_by(id=message_id)
+            assert wait_for(lambda: status.scalar() == "sent")
+    finally:
+        queue.stop()
@@ -0,0 +1,55 @@
+"""The image pipeline: one record per distinct upload, processed in the background."""
+import io
+import os
+
+from test_email_queue import wait_for
+
+
+def jpeg_upload(color="teal"):
+    from PIL import Image as PILImage
+    from werkzeug.datastructures import FileStorage
+
+    data = io.BytesIO()
+    PILImage.new("RGB", (800, 600), color).save(data, format="JPEG")
+    data.seek(0)
+    return FileStorage(data, filename="photo.jpg", content_type="image/jpeg")
+
+
+def test_identical_uploads_share_one_record(app):
+    from models import db, Image
+
+    pipeline = app.extensions['image_pipeline']
+    with app.app_context():
+        first = pipeline.store(jpeg_upload()).id
+        second = pipeline.store(jpeg_upload()).id
+        assert first == second
+        assert db.session.query(Image).count() == 1
+
+
+def test_uploading_a_failed_image_again_reprocesses_it(app, monkeypatch):
+    from models import db, Image
+
+    pipeline = app.extensions['image_pipeline']
+    process = type(pipeline).process
+    calls = []
+
+    def process_once_failing(self, image_id):
+        calls.append(image_id)
+        if len(calls) == 1:
+            # The original goes missing along with the attempt, as when a worker dies mid-way
+            os.remove(self._pending_file(db.session.get(Image, image_id).path))
+            raise MemoryError("decompression bomb")
+        return process(self, image_id)
+
+    monkeypatch.setattr(type(pipeline), "process", process_once_failing)
+    with app.app_context():
+        image_id = pipeline.store(jpeg_upload()).id
+        status = db.session.query(Image.status).filter_by(id=image_id)
+        assert wait_for(lambda: status.scalar() == "failed")
+
+        assert pipeline.store(jpeg_upload()).id == image_id
+        assert wait_for(lambda: status.scalar() == "ready")
+        assert calls == [image_id, image_id]
+        # A ready image is returned as it is, without processing it again
+        assert pipeline.store(jpeg_upload()).status == "ready"
+    assert calls == [image_id, image_id]
@@ -0,0 +1,53 @@
+"""Stored post and comment HTML: stale rows are cleaned per response and stored by `flask render-html`."""
+from test_query_counts import add_posts, count_queries
+
+
+def make_stale(app, post_id):
+    """Drop the stored HTML of a post and its comments, as for rows from before the sanitiser."""
+    from models import db, Comment, Post
+
+    with app.app_context():
+        db.session.query(Post).filter_by(id=post_id).update(
+            {"body": '<p onclick="alert(1)">Body</p>', "body_html": None, "sanitizer_version": None})
+        db.session.query(Comment).filter_by(post_id=post_id).update(
+            {"text": 'Hi <img src=x onerror="alert(2)">', "text_html": None, "sanitizer_version": None})
+        db.session.commit()
+
+
+def stored_html(app, post_id):
+    from models import db, Comment, Post
+
+    with app.app_context():
+        return ([db.session.query(Post.body_html).filter_by(id=post_id).scalar()]
+                + [html for (html,) in db.session.query(Comment.text_html).filter_by(post_id=post_id)])
+
+
+def test_stale_html_is_cleaned_without_writing_from_a_get(app):
+    client = app.test_client()
+    post_id = add_posts(app, 1, 3)
+    client.get(f'/post/{post_id}')
+    with count_queries(app) as fresh:
+        client.get(f'/post/{post_id}')
+
+    make_stale(app, post_id)
+    with count_queries(app) as stale:
+        page = client.get(f'/post/{post_id}').get_data(as_text=True)
+
+    assert "<p>Body</p>" in page and "Hi " in page
+    assert "alert(" not in page
+    assert stored_html(app, post_id) == [None] * 7
+    assert not any(statement.lstrip().upper().startswith(("UPDATE", "INSERT")) for statement in stale)
+    # One query for the post body and one for every stale comment's text, however many there are
+    assert len(stale) == len(fresh) + 2
+
+
+def test_render_html_stores_the_cleaned_copies(app):
+    post_id = add_posts(app, 1, 2)
+    make_stale(app, post_id)
+
+    result = app.test_cli_runner().invoke(args=["render-html"])
+
+    assert result.exit_code == 0, result.output
+    body_html, *comments_html = stored_html(app, post_id)
+    assert body_html == "<p>Body</p>"
+    assert len(comments_html) == 4 and all(html and "onerror" not in html for html in comments_html)
@@ -0,0 +1,85 @@
+"""
+The homepage and the post page run a fixed number of queries, however many posts, authors, images
+and comments there are. A relationship loaded lazily in a template shows up here as a count that
+grows with the data.
+"""
+from contextlib import contextmanager
+import json
+import threading
+
+from sqlalchemy import event
+
+
+def add_posts(app, posts, comments):
+    """Add posts, each by its own author with its own image, and comments with one reply each."""
+    from categories import count_post
+    from content import make_excerpt, render_comment_text, render_post_body
+    from models import db, Comment, Image, Post, User
+
+    with app.app_context():
+        start = db.session.query(Post).count()
+        for i in range(start, start + posts):
+            author = User(email=f"author{i}@example.com", username=f"author{i}", name=f"Author {i}",
+                          password="x", profile_picture=f"uploads/{i:064x}.jpg")
+            image = Image(sha256=f"{i:064x}", path=f"uploads/{i:064x}.jpg", width=1200, height=800, status="ready",
+                          variants=json.dumps([{"width": 640, "path": f"uploads/{i:064x}-640.webp",
+                                                "type": "image/webp"}]))
+            body = f"<p>Body of post {i}.</p>"
+            post = Post(title=f"Post {i}", subtitle="Subtitle", body=body, excerpt=make_excerpt(body),
+                        category="Lifestyle", author=author, image=image, comment_count=2 * comments)
+            render_post_body(post)
+            db.session.add(post)
+            count_post(post.category, 1)
+            for j in range(comments):
+                commenter = User(email=f"reader{i}-{j}@example.com", username=f"reader{i}-{j}", name=f"Reader {j}",
+                                 password="x")
+                comment = Comment(text=f"Comment {j}", parent_post=post, comment_author=commenter)
+                reply = Comment(text=f"Reply {j}", parent_post=post, comment_author=author)
+                render_comment_text(comment)
+                render_comment_text(reply)
+                db.session.add_all([comment, reply])
+                db.session.flush()
+                reply.parent_id = comment.id
+        db.session.commit()
+        return db.session.query(Post.id).order_by(Post.id.desc()).limit(1).scalar()
+
+
+@contextmanager
+def count_queries(app):
+    """Collect the statements run by this thread; the app's background threads are left out."""
+    from models import db
+
+    statements = []
+    thread = threading.get_ident()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def queries_for(app, client, url):
+    client.get(url)  # warm up anything done once per process
+    with count_queries(app) as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_query_counts_do_not_grow_with_rows(app):
+    client = app.test_client()
+    counts = []
+    for posts, comments in ((2, 1), (15, 8)):
+        post_id = add_posts(app, posts, comments)
+        counts.append({"/": queries_for(app, client, "/"),
+                       "/post": queries_for(app, client, f"/post/{post_id}")})
+    small, large = counts
+    assert small["/"] > 0 and small["/post"] > 0
+    assert large == small
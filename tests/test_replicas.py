@@ -0,0 +1,87 @@
+"""Read-replica routing: GETs of replica_reads views read the replica, unless this client just wrote."""
+import shutil
+
+import pytest
+
+
+@pytest.fixture
+def replicated(monkeypatch, tmp_path):
+    """An app whose replica is a copy of the primary taken after one post, then left behind by another."""
+    from main import create_app
+    from models import db, Post, User
+
+    primary, replica = tmp_path / "primary.db", tmp_path / "replica.db"
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{primary}")
+    monkeypatch.setenv("SECRETKEY", "test")
+    app = create_app({
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "RESPONSE_CACHE_ENABLED": False,
+        "DATABASE_REPLICA_URL": f"sqlite:///{replica}",
+        "DB_REPLICA_STICKY_SECONDS": 60,
+        "UPLOAD_FOLDER": str(tmp_path / "uploads"),
+    })
+
+    def add_post(title):
+        author = db.session.query(User).first()
+        db.session.add(Post(title=title, subtitle="Subtitle", body="<p>Body</p>", category="Lifestyle",
+                            author=author))
+        db.session.commit()
+
+    with app.app_context():
+        db.create_all(bind_key=None)
+        db.session.add(User(email="author@example.com", username="author", name="Author", password="x"))
+        add_post("Replicated post")
+        db.engines[None].dispose()
+        shutil.copyfile(primary, replica)
+        add_post("Unreplicated post")
+    return app
+
+
+def routed(app):
+    with app.app_context():
+        return app.extensions['database_router'].stats()["routed_requests"]
+
+
+def test_gets_read_the_replica(replicated):
+    client = replicated.test_client()
+    page = client.get('/').get_data(as_text=True)
+
+    assert "Replicated post" in page and "Unreplicated post" not in page
+    assert routed(replicated) == {"primary": 0, "replica": 1}
+
+
+def test_a_client_reads_its_own_writes_from_the_primary(replicated):
+    from database import PRIMARY_UNTIL_KEY
+
+    client = replicated.test_client()
+    response = client.post('/register', data={"username": "reader", "email": "reader@example.com",
+                                              "password": "secret", "confirm_password": "secret"})
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        assert PRIMARY_UNTIL_KEY in session
+
+    assert "Unreplicated post" in client.get('/').get_data(as_text=True)
+    assert routed(replicated) == {"primary": 1, "replica": 0}
+    # Other clients still read the replica
+    assert "Unreplicated post" not in replicated.test_client().get('/').get_data(as_text=True)
+
+    # Once DB_REPLICA_STICKY_SECONDS have passed, so does this client
+    with client.session_transaction() as session:
+        session[PRIMARY_UNTIL_KEY] = 0
+    assert "Unreplicated post" not in client.get('/').get_data(as_text=True)
+    assert routed(replicated) == {"primary": 1, "replica": 2}
+
+
+def test_writes_during_replica_reads_go_to_the_primary(replicated):
+    from flask import g
+    from models import db, Post
+
+    with replicated.test_request_context('/'):
+        g._db_replica = True
+        assert db.session.query(Post).count() == 1
+        db.session.query(Post).filter_by(title="Replicated post").update({"title": "Edited"})
+        db.session.commit()
+        assert g._db_wrote
+        g._db_replica = False
+        assert db.session.query(Post.title).order_by(Post.id).first() == ("Edited",)
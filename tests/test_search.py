@@ -0,0 +1,65 @@
+"""Ranked search: the in-process fallback used on SQLite, and cursors paging through its results."""
+from decimal import Decimal
+
+import pytest
+
+
+def add_posts(app, titles):
+    from models import db, Post, User
+
+    with app.app_context():
+        author = User(email="author@example.com", username="author", name="Author", password="x")
+        for title, body in titles:
+            db.session.add(Post(title=title, subtitle="Subtitle", body=f"<p>{body}</p>", category="Lifestyle",
+                                author=author))
+        db.session.commit()
+
+
+@pytest.fixture
+def post_search(app):
+    from models import db, Post
+    from search import PostSearch
+
+    # A search of its own, so no other test's posts are in the in-process index
+    return PostSearch(db, Post)
+
+
+def test_fallback_ranks_title_matches_first(app, post_search):
+    add_posts(app, [("Gardening notes", "Tomatoes and basil."),
+                    ("Kitchen notes", "Basil in the garden, basil on the plate."),
+                    ("Travel notes", "Nothing green here.")])
+    with app.app_context():
+        page, snippets = post_search.search("basil tomatoes")
+        assert [post.title for post in page] == ["Gardening notes"]
+        assert "<mark>Tomatoes</mark>" in snippets[page.items[0].id]
+
+        page, _ = post_search.search("basil")
+        assert [post.title for post in page] == ["Kitchen notes", "Gardening notes"]
+        assert not page.has_next and not page.has_prev
+
+
+def test_cursors_page_through_ties_and_back(app, post_search):
+    # Identical posts score the same, so the pages are told apart by id alone
+    add_posts(app, [(f"Post {i}", "A note on basil.") for i in range(7)])
+    with app.app_context():
+        first, _ = post_search.search("basil", per_page=3)
+        second, _ = post_search.search("basil", cursor=first.next_cursor, per_page=3)
+        third, _ = post_search.search("basil", cursor=second.next_cursor, per_page=3)
+        back, _ = post_search.search("basil", cursor=third.prev_cursor, per_page=3)
+
+    ids = [post.id for page in (first, second, third) for post in page]
+    assert ids == sorted(ids, reverse=True) and len(set(ids)) == 7
+    assert not third.has_next
+    assert [post.id for post in back] == [post.id for post in second]
+    with app.app_context(), pytest.raises(ValueError):
+        post_search.search("basil", cursor="not-a-cursor")
+
+
+def test_ranks_survive_the_cursor_exactly():
+    from pagination import decode_cursor, encode_cursor
+
+    # PostgreSQL ranks come back as numerics rounded to RANK_DIGITS; the fallback's as rounded floats
+    for rank in (Decimal("0.033333"), Decimal("1E-6"), 0.1 + 0.2, 2.302585):
+        values, direction = decode_cursor(encode_cursor((rank, 42), "prev"))
+        assert values == [rank, 42] and type(values[0]) is type(rank)
+        assert direction == "prev"
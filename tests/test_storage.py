@@ -0,0 +1,119 @@
+"""Upload storage backends: files on local disk, or in an S3 bucket (here a stub client)."""
+import io
+import json
+import os
+
+import pytest
+
+from test_email_queue import wait_for
+
+
+class StubS3Client:
+    """The part of a boto3 S3 client S3Storage uses, keeping objects in a dict."""
+
+    class exceptions:
+        class ClientError(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}  # (bucket, key) -> (bytes, extra args)
+
+    def upload_file(self, filename, bucket, key, ExtraArgs=None):
+        with open(filename, "rb") as f:
+            self.objects[(bucket, key)] = (f.read(), ExtraArgs or {})
+
+    def download_fileobj(self, bucket, key, fileobj):
+        if (bucket, key) not in self.objects:
+            raise self.exceptions.ClientError("404 Not Found")
+        fileobj.write(self.objects[(bucket, key)][0])
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.ClientError("404 Not Found")
+        return {"ContentLength": len(self.objects[(Bucket, Key)][0])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+def temp_file(directory, data):
+    path = os.path.join(directory, ".upload-test")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_s3_storage_round_trip(tmp_path):
+    from storage import IMMUTABLE_CACHE_CONTROL, S3Storage
+
+    client = StubS3Client()
+    storage = S3Storage("media", str(tmp_path), "https://cdn.example.com/", client=client)
+    source = temp_file(tmp_path, b"webp bytes")
+    storage.save(source, "uploads/abc.webp")
+
+    assert not os.path.exists(source)
+    data, extra = client.objects[("media", "uploads/abc.webp")]
+    assert data == b"webp bytes"
+    assert extra == {"ContentType": "image/webp", "CacheControl": IMMUTABLE_CACHE_CONTROL}
+    with storage.open("uploads/abc.webp") as f:
+        assert f.read() == b"webp bytes"
+    assert storage.exists("uploads/abc.webp") and not storage.exists("uploads/missing.webp")
+    assert storage.url("uploads/abc.webp") == "https://cdn.example.com/uploads/abc.webp"
+
+    storage.delete("uploads/abc.webp")
+    assert not storage.exists("uploads/abc.webp")
+
+
+def test_local_storage_round_trip(app, tmp_path):
+    from storage import LocalStorage
+
+    storage = LocalStorage(str(tmp_path / "static"), str(tmp_path))
+    storage.save(temp_file(tmp_path, b"jpeg bytes"), "uploads/abc.jpg")
+
+    with storage.open("uploads/abc.jpg") as f:
+        assert f.read() == b"jpeg bytes"
+    assert storage.exists("uploads/abc.jpg") and not storage.exists("uploads/missing.jpg")
+    with app.app_context():
+        assert storage.url("uploads/abc.jpg") == "/static/uploads/abc.jpg"
+    storage.delete("uploads/abc.jpg")
+    storage.delete("uploads/abc.jpg")
+    assert not storage.exists("uploads/abc.jpg")
+
+
+def test_make_storage_checks_the_backend(app):
+    from storage import boto3, make_storage
+
+    app.config['UPLOAD_STORAGE'] = "ftp"
+    with pytest.raises(ValueError):
+        make_storage(app)
+    if boto3 is None:
+        app.config.update(UPLOAD_STORAGE="s3", UPLOAD_S3_BUCKET="media", UPLOAD_S3_PUBLIC_URL="https://cdn.example.com")
+        with pytest.raises(RuntimeError):
+            make_storage(app)
+
+
+def test_processed_images_are_published_to_the_bucket(app):
+    from PIL import Image as PILImage
+    from werkzeug.datastructures import FileStorage
+    from images import srcset
+    from models import db, Image
+    from storage import S3Storage
+
+    pipeline = app.extensions['image_pipeline']
+    client = StubS3Client()
+    pipeline.storage = S3Storage("media", pipeline.storage.temp_dir, "https://cdn.example.com", client=client)
+    upload = io.BytesIO()
+    PILImage.new("RGB", (1600, 900), "teal").save(upload, format="JPEG")
+    upload.seek(0)
+
+    with app.app_context():
+        image_id = pipeline.store(FileStorage(upload, filename="photo.jpg", content_type="image/jpeg")).id
+        status = db.session.query(Image.status).filter_by(id=image_id)
+        assert wait_for(lambda: status.scalar() == "ready")
+        db.session.expire_all()
+        image = db.session.get(Image, image_id)
+        paths = [image.path] + [variant["path"] for variant in json.loads(image.variants)]
+        assert {("media", path) for path in paths} == set(client.objects)
+        assert srcset(image).startswith("https://cdn.example.com/uploads/")
+        assert pipeline.url(image.path) == f"https://cdn.example.com/{image.path}"
+    assert os.listdir(pipeline.pending_folder) == []
@@ -0,0 +1,52 @@
+"""Buffered view counts and the "Most read" list built from them."""
+
+
+def add_post(app, title):
+    from models import db, Post, User
+
+    with app.app_context():
+        author = User(email=f"{title}@example.com", username=title, name=title, password="x")
+        post = Post(title=title, subtitle="Subtitle", body="<p>Body</p>", category="Lifestyle", author=author)
+        db.session.add(post)
+        db.session.commit()
+        return post.id
+
+
+def test_flushes_refresh_the_popular_list_at_most_once_per_ttl(app):
+    from models import db, Post
+    from views import ViewCounter
+
+    calls = []
+    app.config['POPULAR_POSTS_TTL'] = 60
+    ViewCounter(db=db, model=Post, on_flush=lambda: calls.append(1)).init_app(app)
+    counter = app.extensions['view_counter']
+    first, second = add_post(app, "first"), add_post(app, "second")
+
+    with app.app_context():
+        counter.record(first, 2)
+        assert counter.flush() == 1
+        assert counter.popular(5) == [(first, "first", 2)]
+
+        counter.record(second, 5)
+        assert counter.flush() == 1
+        # Within the TTL the list, and the pages showing it, are left as they were
+        assert counter.popular(5) == [(first, "first", 2)]
+        assert len(calls) == 1
+
+        counter._popular_refresh_at = 0  # as if POPULAR_POSTS_TTL had passed
+        counter.record(first, 1)
+        assert counter.flush() == 1
+        assert counter.popular(5) == [(second, "second", 5), (first, "first", 3)]
+        assert len(calls) == 2
+    counter.stop()
+
+
+def test_the_feed_etag_does_not_depend_on_view_counts(app):
+    post_id = add_post(app, "post")
+    client = app.test_client()
+    etag = client.get('/').headers['ETag']
+    counter = app.extensions['view_counter']
+    with app.app_context():
+        counter.record(post_id, 3)
+        counter.flush()
+    assert client.get('/').headers['ETag'] == etag
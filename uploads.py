@@ -0,0 +1,109 @@
+# uploads.py
+import hashlib
+import os
+import tempfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+# Enough leading bytes to recognise every format below
+MAGIC_LENGTH = 12
+
+
+def sniff_image_type(header):
+    """The image format a file's first bytes announce ("jpeg", "png", "gif", "webp", "heic"), or None."""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    # ISO media files start with a size and an "ftyp" box naming the brand
+    if header[4:8] == b"ftyp" and header[8:12] in (b"heic", b"heix", b"mif1", b"msf1", b"hevc"):
+        return "heic"
+    return None
+
+
+class UploadFile:
+    """
+    Writable temp file handed to Werkzeug's multipart parser for each uploaded file.
+
+    Chunks go straight to disk as they are parsed, and are hashed on the way. The upload is
+    rejected (415) as soon as its first bytes show it isn't an accepted image type, and (413) as
+    soon as it grows past max_size, so neither has to be received in full first. The temp file is
+    created next to the stored uploads, so keeping it is a rename; close() deletes it otherwise.
+    """
+
+    def __init__(self, temp_dir, max_size=None, allowed_types=None):
+        fd, self.path = tempfile.mkstemp(dir=temp_dir, prefix=".upload-")
+        self._file = os.fdopen(fd, "w+b")
+        self.max_size = max_size
+        self.allowed_types = allowed_types
+        self.size = 0
+        self.image_type = None
+        self._digest = hashlib.sha256()
+        self._header = b""
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise RequestEntityTooLarge()
+        if len(self._header) < MAGIC_LENGTH:
+            self._header += data[:MAGIC_LENGTH - len(self._header)]
+            if len(self._header) >= MAGIC_LENGTH:
+                self._check_type()
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def _check_type(self):
+        self.image_type = sniff_image_type(self._header)
+        if self.allowed_types is not None and self.image_type not in self.allowed_types:
+            raise UnsupportedMediaType("Only JPEG, PNG, GIF, WebP and HEIC images can be uploaded.")
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET and offset == 0 and 0 < self.size < MAGIC_LENGTH:
+            # Too short for the check in write(); the parser seeks back to the start once it's complete
+            self._check_type()
+        return self._file.seek(offset, whence)
+
+    def detach(self):
+        """Take ownership of the temp file: it is flushed, closed, and no longer deleted by close()."""
+        path, self.path = self.path, None
+        self._file.close()
+        return path
+
+    def close(self):
+        self._file.close()
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __getattr__(self, name):
+        # read, readline, tell, flush... come from the underlying file
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """Request class streaming uploaded files through UploadFile instead of Werkzeug's spooled buffers."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        stream = UploadFile(config['UPLOAD_TEMP_FOLDER'], max_size=config['UPLOAD_MAX_FILE_BYTES'],
+                            allowed_types=config['UPLOAD_ALLOWED_TYPES'])
+        # Tracked here too: a file rejected mid-parse never makes it into request.files
+        self.__dict__.setdefault('_upload_files', []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        for stream in self.__dict__.pop('_upload_files', ()):
+            stream.close()
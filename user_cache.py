@@ -0,0 +1,158 @@
+# user_cache.py
+import hashlib
+import os
+import threading
+
+from flask import session
+
+from cache import LRUCache
+
+from extensions import AppExtension, per_app
+
+# Session key holding the stamp of the user snapshot this session last saw written
+SESSION_STAMP_KEY = "_user_stamp"
+
+
+class CachedUser:
+    """
+    Read-only snapshot of a user row, used as Flask-Login's current_user.
+
+    It only carries the columns pages read, so it is cheap to keep in memory and safe to share
+    between requests. Views that change the user load the ORM object by current_user.id instead.
+    """
+
+    __slots__ = ("id", "username", "email", "name", "profile_picture", "bio", "stamp")
+
+    # Fields copied from the model, in the order they are hashed into the stamp
+    FIELDS = ("id", "username", "email", "name", "profile_picture", "bio")
+
+    def __init__(self, **fields):
+        for field in self.FIELDS:
+            setattr(self, field, fields.get(field))
+        raw = "|".join(str(fields.get(field)) for field in self.FIELDS)
+        self.stamp = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def from_model(cls, user):
+        return cls(**{field: getattr(user, field) for field in cls.FIELDS})
+
+    # The parts of flask_login.UserMixin we need, without the per-instance __dict__ it would bring
+
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, CachedUser):
+            return self.id == other.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"<CachedUser {self.id} {self.username!r}>"
+
+
+class UserCache(AppExtension):
+    """
+    Caches the signed-in user between requests so Flask-Login's user_loader rarely hits the database.
+
+    Snapshots live in a small LRU with a TTL, keyed by user id. Views that change a user call
+    refresh() (or invalidate() when they only have the id). refresh() also records the snapshot's
+    stamp in the session cookie, which Flask signs, so another worker still holding an older snapshot
+    notices the mismatch on that session's next request and reloads, without any shared state.
+    """
+
+    extension_name = "user_cache"
+    shared_args = ("model",)
+
+    def __init__(self, app=None, model=None):
+        self.model = model
+        self.backend = None
+        self.enabled = True
+        self.check_stamp = True
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not app:
+            # Configure an instance of its own for this app (see extensions.AppExtension)
+            return self.bind(app).init_app(app)
+        app.config.setdefault('USER_CACHE_ENABLED', os.getenv('USER_CACHE_ENABLED', '1') == '1')
+        app.config.setdefault('USER_CACHE_TTL', int(os.getenv('USER_CACHE_TTL', 300)))
+        app.config.setdefault('USER_CACHE_MAX_ENTRIES', int(os.getenv('USER_CACHE_MAX_ENTRIES', 1024)))
+        app.config.setdefault('USER_CACHE_SESSION_STAMP', os.getenv('USER_CACHE_SESSION_STAMP', '1') == '1')
+        self.enabled = app.config['USER_CACHE_ENABLED']
+        self.check_stamp = app.config['USER_CACHE_SESSION_STAMP']
+        self.backend = LRUCache(app.config['USER_CACHE_MAX_ENTRIES'], app.config['USER_CACHE_TTL'])
+        app.extensions['user_cache'] = self
+
+    @per_app
+    def load(self, user_id):
+        """Return a CachedUser for the id, or None if no such user exists. For use as the user_loader."""
+        user_id = int(user_id)
+        if self.enabled:
+            snapshot = self.backend.get(user_id)
+            if snapshot is not None:
+                expected = session.get(SESSION_STAMP_KEY) if self.check_stamp else None
+                if expected is None or expected == snapshot.stamp:
+                    self._count("hits")
+                    return snapshot
+                self._count("stale")
+            else:
+                self._count("misses")
+        user = self.model.query.get(user_id)
+        if user is None:
+            return None
+        snapshot = CachedUser.from_model(user)
+        if self.enabled:
+            self.backend.set(user_id, snapshot)
+            # Re-stamp sessions that saw an older version (e.g. the user edited their profile in another
+            # browser), so they go back to hitting the cache from the next request on
+            if self.check_stamp and session.get(SESSION_STAMP_KEY, snapshot.stamp) != snapshot.stamp:
+                session[SESSION_STAMP_KEY] = snapshot.stamp
+        return snapshot
+
+    @per_app
+    def refresh(self, user):
+        """Replace the cached snapshot after a user was created or changed, and stamp the current session."""
+        snapshot = CachedUser.from_model(user)
+        if self.enabled:
+            self.backend.set(user.id, snapshot)
+        if self.check_stamp:
+            session[SESSION_STAMP_KEY] = snapshot.stamp
+        return snapshot
+
+    @per_app
+    def invalidate(self, user_id):
+        self.backend.delete(int(user_id))
+
+    @per_app
+    def clear(self):
+        self.backend.clear()
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    @per_app
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses + self.stale
+            return {
+                "enabled": self.enabled,
+                "session_stamp": self.check_stamp,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "entries": len(self.backend),
+            }
@@ -0,0 +1,221 @@
+# views.py
+from functools import wraps
+import os
+import threading
+import time
+
+from flask import current_app, request
+from sqlalchemy import case
+
+from extensions import AppExtension, per_app
+
+# Posts per UPDATE statement when flushing; keeps the CASE expression and IN list a sane size
+FLUSH_BATCH = 500
+
+
+class ViewCounter(AppExtension):
+    """
+    Per-post view counts, buffered in memory and written in batches.
+
+    A view only increments a dict entry under a lock. A background thread adds the buffered counts
+    to the posts table every VIEW_FLUSH_INTERVAL seconds, or sooner once VIEW_FLUSH_THRESHOLD views
+    are waiting, with one multi-row UPDATE (view_count = view_count + CASE id ...) per batch of posts.
+    Hot posts therefore cost one row update per flush rather than one per view, and updates stay
+    relative, so several workers flushing at once never lose each other's counts. Whatever is still
+    buffered is written by stop(), which create_app() registers to run at exit.
+
+    popular() is cached per worker for POPULAR_POSTS_TTL seconds. A flush that changed any counts
+    refreshes it (and calls on_flush) at most once per POPULAR_POSTS_TTL, so the "Most read" list lags
+    the counts by about that much instead of invalidating cached pages on every flush.
+    """
+
+    extension_name = "view_counter"
+    shared_args = ("db", "model", "on_flush")
+
+    def __init__(self, app=None, db=None, model=None, on_flush=None):
+        self.db = db
+        self.model = model
+        # Called with no arguments inside an app context after a flush updated any posts, at most
+        # once per POPULAR_POSTS_TTL
+        self.on_flush = on_flush
+        self.app = None
+        self.enabled = True
+        self.interval = 10
+        self.threshold = 500
+        self.popular_ttl = 60
+        self.metrics = {"recorded": 0, "flushes": 0, "rows_updated": 0, "flush_failures": 0,
+                        "flush_seconds_total": 0.0}
+        self._pending = {}
+        self._pending_total = 0
+        self._wake = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._popular = (0, 0, [])  # (expires at, limit fetched, [(id, title, view_count), ...])
+        self._popular_lock = threading.Lock()
+        self._popular_refresh_at = 0  # monotonic time before which flushes leave popular() alone
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.app is not app:
+            # Configure an instance of its own for this app (see extensions.AppExtension)
+            return self.bind(app).init_app(app)
+        app.config.setdefault('VIEW_COUNTS_ENABLED', os.getenv('VIEW_COUNTS_ENABLED', '1') == '1')
+        app.config.setdefault('VIEW_FLUSH_INTERVAL', float(os.getenv('VIEW_FLUSH_INTERVAL', 10)))
+        app.config.setdefault('VIEW_FLUSH_THRESHOLD', int(os.getenv('VIEW_FLUSH_THRESHOLD', 500)))
+        app.config.setdefault('POPULAR_POSTS_TTL', float(os.getenv('POPULAR_POSTS_TTL', 60)))
+        self.app = app
+        self.enabled = app.config['VIEW_COUNTS_ENABLED']
+        self.interval = app.config['VIEW_FLUSH_INTERVAL']
+        self.threshold = app.config['VIEW_FLUSH_THRESHOLD']
+        self.popular_ttl = app.config['POPULAR_POSTS_TTL']
+        app.extensions['view_counter'] = self
+
+    # Recording
+
+    @per_app
+    def record(self, post_id, amount=1):
+        if not self.enabled:
+            return
+        with self._wake:
+            self._pending[post_id] = self._pending.get(post_id, 0) + amount
+            self._pending_total += amount
+            self.metrics["recorded"] += amount
+            if self._pending_total >= self.threshold:
+                self._wake.notify()
+        if self._thread is None:
+            self.start()
+
+    def counted(self, f):
+        """Decorator counting a view of post_id for each GET answered with a 200 or 304.
+
+        Apply it outside ResponseCache.cached, so that views served from the cache are counted too.
+        """
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            response = current_app.make_response(f(*args, **kwargs))
+            if request.method == "GET" and response.status_code in (200, 304):
+                self.for_app().record(kwargs["post_id"])
+            return response
+        return decorated_function
+
+    # Flushing
+
+    @per_app
+    def start(self):
+        with self._wake:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="view-counter", daemon=True)
+        self._thread.start()
+
+    @per_app
+    def stop(self, timeout=5):
+        """Stop the flusher thread after a final flush."""
+        with self._wake:
+            self._stopping = True
+            self._wake.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+        if self._pending and self.app is not None:
+            # The thread never started or couldn't finish in time
+            with self.app.app_context():
+                self.flush()
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                with self._wake:
+                    if not self._stopping and self._pending_total < self.threshold:
+                        self._wake.wait(self.interval)
+                    stopping = self._stopping
+                try:
+                    self.flush()
+                finally:
+                    self.db.session.remove()
+                if stopping:
+                    return
+
+    @per_app
+    def flush(self):
+        """Write the buffered counts now. Returns the number of posts updated."""
+        with self._wake:
+            pending, self._pending = self._pending, {}
+            self._pending_total = 0
+        if not pending:
+            return 0
+        started = time.perf_counter()
+        items = sorted(pending.items())  # a fixed order keeps concurrent flushes from deadlocking
+        updated = 0
+        try:
+            for start in range(0, len(items), FLUSH_BATCH):
+                batch = dict(items[start:start + FLUSH_BATCH])
+                result = self.db.session.execute(
+                    self.db.update(self.model)
+                    .where(self.model.id.in_(list(batch)))
+                    .values(view_count=self.model.view_count + case(batch, value=self.model.id, else_=0))
+                    .execution_options(synchronize_session=False)
+                )
+                updated += result.rowcount
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            # Put the counts back so the next flush retries them
+            with self._wake:
+                for post_id, count in pending.items():
+                    self._pending[post_id] = self._pending.get(post_id, 0) + count
+                    self._pending_total += count
+                self.metrics["flush_failures"] += 1
+            print(f"Could not write view counts for {len(pending)} posts. Error: {e}")
+            return 0
+        with self._wake:
+            self.metrics["flushes"] += 1
+            self.metrics["rows_updated"] += updated
+            self.metrics["flush_seconds_total"] += time.perf_counter() - started
+        if updated and self._refresh_popular_due():
+            if self.on_flush is not None:
+                self.on_flush()
+        return updated
+
+    def _refresh_popular_due(self):
+        """Drop the cached popular() list if it was last refreshed POPULAR_POSTS_TTL or more ago."""
+        now = time.monotonic()
+        with self._popular_lock:
+            if now < self._popular_refresh_at:
+                return False
+            self._popular_refresh_at = now + self.popular_ttl
+            self._popular = (0, 0, [])
+        return True
+
+    # Reading
+
+    @per_app
+    def popular(self, limit=5):
+        """The most-viewed posts as (id, title, view_count) tuples, cached for POPULAR_POSTS_TTL seconds."""
+        now = time.monotonic()
+        with self._popular_lock:
+            expires, fetched, posts = self._popular
+        if expires > now and limit <= fetched:
+            return posts[:limit]
+        # Fetch a few extra, so callers asking for slightly different lengths share the entry
+        fetched = max(limit, 10)
+        rows = (self.db.session.query(self.model.id, self.model.title, self.model.view_count)
+                .filter(self.model.view_count > 0)
+                .order_by(self.model.view_count.desc(), self.model.id.desc())
+                .limit(fetched)
+                .all())
+        posts = [tuple(row) for row in rows]
+        with self._popular_lock:
+            self._popular = (now + self.popular_ttl, fetched, posts)
+        return posts[:limit]
+
+    @per_app
+    def stats(self):
+        with self._wake:
+            metrics = dict(self.metrics, pending_views=self._pending_total, pending_posts=len(self._pending))
+        metrics["flush_seconds_total"] = round(metrics["flush_seconds_total"], 6)
+        metrics["enabled"] = self.enabled
+        return metrics